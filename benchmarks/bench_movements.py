@@ -0,0 +1,114 @@
+"""
+    Latency of building the `/movements` response
+
+    Reports p50 / p99 per request for the old row by row builder (`iterrows`,
+    `lookup.loc` per token, fastapi's encoder + stdlib json) and the column wise
+    one served now (`MovementsEngine.movements` + `movements_payload` + orjson),
+    at several universe sizes.
+
+    Usage:
+        python -m benchmarks.bench_movements --tokens 200 2000 20000 --out movements.json
+"""
+import json
+import time
+import random
+import argparse
+
+import orjson
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+
+from smartapi.movements import MovementsEngine, symbol_index, movements_payload
+from smartapi.utils.histogram import LatencyHistogram
+
+
+def make_universe(tokens: int, seed: int = 7) -> tuple[MovementsEngine, pd.DataFrame]:
+    "engine with 15 minutes of per second prices for `tokens` tokens & a lookup for 90% of them"
+    rng = random.Random(seed)
+    engine = MovementsEngine()
+    start_ms = int(time.time() - 15 * 60) * 1000
+
+    for idx in range(tokens):
+        token = 40_000 + idx
+        price = rng.uniform(10, 1000)
+        # a tick every ~10s keeps setup fast, windows only look at a few entries anyway
+        for second in range(0, 15 * 60, rng.randint(5, 15)):
+            price *= 1 + rng.gauss(0, 0.001)
+            engine.update(token, start_ms + second * 1000, round(price, 2))
+
+    lookup = pd.DataFrame({
+        'token': [40_000 + idx for idx in range(tokens) if idx % 10],
+        'symbol': [f"NIFTY24JAN{idx}CE" for idx in range(tokens) if idx % 10],
+    }).set_index('token')
+    return engine, lookup
+
+
+def legacy_response(df: pd.DataFrame, lookup: pd.DataFrame, growth_threshold: float = .2) -> bytes:
+    "the loop `get_movements` had (with isUp classified from change)"
+    res = []
+    for _, row in df.iterrows():
+        token = row['token']
+        if token not in lookup.index:
+            continue
+
+        change = row['change']
+        if change >= growth_threshold:
+            is_up = 1
+        elif change <= -growth_threshold:
+            is_up = -1
+        else:
+            is_up = 0
+
+        res.append({
+            'token': int(token),
+            'symbol': lookup.loc[token]['symbol'],
+            'change': float(change),
+            'ltp': float(row['ltp']),
+            'isUp': is_up,
+        })
+    return json.dumps(jsonable_encoder({"data": res})).encode()
+
+
+def measure(fn, repeat: int) -> dict:
+    hist = LatencyHistogram()
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        fn()
+        hist.record(time.perf_counter_ns() - start)
+    return hist.summary(scale=1e6, pcts=(50, 99))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/movements response latency")
+    parser.add_argument('--tokens', type=int, nargs='+', default=[200, 2_000, 20_000])
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--legacy-repeat', type=int, default=20, help="the old builder is slow, fewer runs")
+    parser.add_argument('--interval', type=int, default=3)
+    parser.add_argument('--out', help="write the results as json")
+    args = parser.parse_args()
+
+    results = []
+    for tokens in args.tokens:
+        engine, lookup = make_universe(tokens)
+        symbols = symbol_index(lookup)
+        df = engine.movements(args.interval)
+
+        def current():
+            frame = engine.movements(args.interval)
+            return orjson.dumps({"data": movements_payload(frame, symbols)})
+
+        for name, fn, repeat in (
+            ('legacy', lambda: legacy_response(df, lookup), args.legacy_repeat),
+            ('vectorized', current, args.repeat),
+        ):
+            summary = measure(fn, repeat)
+            results.append({"tokens": tokens, "builder": name, **summary})
+            print(f"{tokens:>6} tokens {name:>10}: p50 {summary['p50']:8.3f} ms  p99 {summary['p99']:8.3f} ms")
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
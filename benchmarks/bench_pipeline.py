@@ -0,0 +1,69 @@
+"""
+    Throughput of `ProcessPipeline` (receiver -> parsers -> writer) on synthetic frames
+
+    Timed from the moment every stage is ready until the writer has drained all the
+    records, with a counting sink so the database isn't measured.
+
+    Usage:
+        python -m benchmarks.bench_pipeline --frames 200000 --parsers 1 2 4
+"""
+import json
+import time
+import argparse
+
+from smartapi.process_pipeline import ProcessPipeline, SyntheticSource, CountingSink
+from smartapi.connections.api_types import SubscriptionMode, TickInterval
+
+
+def run(frames: int, parsers: int, mode: SubscriptionMode, tokens: int, bars: bool) -> dict:
+    pipeline = ProcessPipeline(
+        SyntheticSource(frames, mode, tokens=tokens), CountingSink(), parsers=parsers,
+        intervals=tuple(TickInterval) if bars else ()
+    )
+    pipeline.start()
+
+    start = time.perf_counter()
+    pipeline.wait_source()
+    stats = pipeline.stats()
+    pipeline.stop()
+    elapsed = time.perf_counter() - start
+
+    parsed = sum(ring["consumed"] for ring in stats["frame_rings"])
+    return {
+        "parsers": parsers,
+        "mode": mode.name,
+        "frames": frames,
+        "bars": bars,
+        "seconds": elapsed,
+        "ticks_per_sec": frames / elapsed,
+        "full_waits": sum(ring["full_waits"] for ring in stats["frame_rings"] + stats["record_rings"]),
+        "parsed_at_source_end": parsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi process pipeline throughput")
+    parser.add_argument('--frames', type=int, default=200_000)
+    parser.add_argument('--parsers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--mode', default=SubscriptionMode.QUOTE.name, choices=[m.name for m in SubscriptionMode])
+    parser.add_argument('--tokens', type=int, default=200)
+    parser.add_argument('--no-bars', action='store_true', help="skip the bar aggregators")
+    parser.add_argument('--out', help="write the results as json")
+    args = parser.parse_args()
+
+    results = []
+    for parsers in args.parsers:
+        result = run(args.frames, parsers, SubscriptionMode[args.mode], args.tokens, not args.no_bars)
+        results.append(result)
+        print(
+            f"{parsers} parser(s): {result['ticks_per_sec']:,.0f} ticks/s "
+            f"({result['seconds']:.2f}s, {result['full_waits']} full waits)"
+        )
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
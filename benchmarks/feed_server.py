@@ -0,0 +1,150 @@
+"""
+    Local stand-in for the smart-stream websocket server
+
+    Answers "ping" with "pong", follows subscribe / unsubscribe requests and emits binary
+    frames in the documented layout for every subscribed token.
+
+    Usage:
+        python -m benchmarks.feed_server --port 8765 --rate 5000
+
+    and point a client at it, e.g. `AsyncSocketConnection(..., url="ws://127.0.0.1:8765")`
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+
+from benchmarks.synthetic import make_frame
+from smartapi.connections.tick_decoder import LTP_STRUCT
+from smartapi.connections.api_types import SubscribeAction, SubscriptionMode, ExchangeType
+
+
+class StandInFeedServer:
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8765, rate: float = 1000,
+                 disconnect_after: int = None, bad_frame_every: int = None, seed: int = 7) -> None:
+        """
+            Args:
+                rate:               frames per second per connection (over all its tokens)
+                disconnect_after:   (optional) drop every connection after these many frames
+                bad_frame_every:    (optional) every n-th frame is malformed (a snap quote mode
+                                    byte on an ltp sized frame)
+        """
+        self.host = host
+        self.port = port
+        self.rate = rate
+        self.disconnect_after = disconnect_after
+        self.bad_frame_every = bad_frame_every
+        self.rng = random.Random(seed)
+
+        self.connections = 0
+        self.frames_sent = 0
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        self._server = await serve(self._handle, self.host, self.port)
+        # port 0 picks a free one
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def __aenter__(self) -> 'StandInFeedServer':
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.stop()
+
+    async def _handle(self, ws) -> None:
+        self.connections += 1
+
+        # (mode, exchange, token) -> [sequence, price (paise), volume]
+        subscriptions = {}
+        producer = asyncio.create_task(self._produce(ws, subscriptions))
+
+        try:
+            async for message in ws:
+                if message == "ping":
+                    await ws.send("pong")
+                    continue
+
+                request = json.loads(message)
+                mode = SubscriptionMode(request['params']['mode'])
+
+                for entry in request['params']['tokenList']:
+                    exchange = ExchangeType(entry['exchangeType'])
+                    for token in entry['tokens']:
+                        key = (mode, exchange, token)
+                        if request['action'] == SubscribeAction.SUBSCRIBE:
+                            subscriptions.setdefault(key, [0, self.rng.randint(10_000, 500_000), 0])
+                        else:
+                            subscriptions.pop(key, None)
+
+        except ConnectionClosed:
+            pass
+        finally:
+            producer.cancel()
+
+    async def _produce(self, ws, subscriptions: dict) -> None:
+        interval = 1 / self.rate
+        sent = 0
+        next_at = time.perf_counter()
+
+        while True:
+            if not subscriptions:
+                await asyncio.sleep(0.01)
+                next_at = time.perf_counter()
+                continue
+
+            for (mode, exchange, token), state in list(subscriptions.items()):
+                state[0] += 1
+                state[1] = max(5, state[1] + self.rng.randint(-20, 20) * 5)
+                state[2] += self.rng.randint(1, 100)
+
+                frame = make_frame(
+                    mode, token, state[0], int(time.time() * 1000), state[1], state[2],
+                    exchange_type=exchange, rng=self.rng
+                )
+                if self.bad_frame_every is not None and (sent + 1) % self.bad_frame_every == 0:
+                    frame = bytes([SubscriptionMode.SNAP_QUOTE]) + frame[1:LTP_STRUCT.size]
+
+                await ws.send(frame)
+                sent += 1
+                self.frames_sent += 1
+
+                if self.disconnect_after is not None and sent >= self.disconnect_after:
+                    await ws.close()
+                    return
+
+                next_at += interval
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Local stand-in smart-stream server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--rate', type=float, default=1000, help="frames per second per connection")
+    parser.add_argument('--disconnect-after', type=int, default=None)
+    args = parser.parse_args()
+
+    async with StandInFeedServer(args.host, args.port, args.rate, args.disconnect_after) as server:
+        print(f"Serving on {server.url}")
+        await asyncio.Future()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
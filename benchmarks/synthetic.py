@@ -0,0 +1,88 @@
+"""
+    Synthetic smart-stream frames in the documented binary layout
+    refer: https://smartapi.angelbroking.com/docs/WebSocket2
+"""
+import time
+import random
+import struct
+
+from smartapi.connections import tick_decoder
+from smartapi.connections.api_types import SubscriptionMode, ExchangeType
+
+# the decoder skips the depth block, the encoder has to write it
+SNAP_QUOTE_ENCODER = struct.Struct(tick_decoder.QUOTE_LAYOUT + "qqq200sqqqq")
+
+MODE_ENCODERS = {
+    SubscriptionMode.LTP_MODE: tick_decoder.LTP_STRUCT,
+    SubscriptionMode.QUOTE: tick_decoder.QUOTE_STRUCT,
+    SubscriptionMode.SNAP_QUOTE: SNAP_QUOTE_ENCODER,
+}
+
+
+def make_depth(price: int, rng: random.Random) -> bytes:
+    "5 buy levels (flag 0) below and 5 sell levels (flag 1) above `price` (paise)"
+    packets = []
+    for flag, sign in ((0, -1), (1, 1)):
+        for level in range(5):
+            packets.append(struct.pack(
+                "<" + tick_decoder.DEPTH_PACKET_LAYOUT,
+                flag,
+                rng.randint(1, 5000),
+                price + sign * (level + 1) * 5,
+                rng.randint(1, 50)
+            ))
+    return b"".join(packets)
+
+
+def make_frame(mode: SubscriptionMode, token: str, sequence_number: int, exchange_epoch_ms: int,
+               price: int, volume: int = 0, exchange_type: ExchangeType = ExchangeType.NSE_FO,
+               rng: random.Random = None) -> bytes:
+    """
+        Packs one frame, prices are in paise like on the wire
+
+        Args:
+            mode:               LTP | QUOTE | SNAP_QUOTE
+            token:              symbol token
+            sequence_number:    feed sequence number
+            exchange_epoch_ms:  exchange timestamp (epoch ms)
+            price:              last traded price (paise)
+            volume:             volume traded for the day
+    """
+    rng = rng or random
+    values = [int(mode), int(exchange_type), token.encode('latin-1'), sequence_number, exchange_epoch_ms, price]
+
+    if mode >= SubscriptionMode.QUOTE:
+        values += [
+            rng.randint(1, 500), price, volume,
+            float(rng.randint(0, 10**6)), float(rng.randint(0, 10**6)),
+            price - 100, price + 200, price - 300, price - 50,
+        ]
+
+    if mode == SubscriptionMode.SNAP_QUOTE:
+        values += [
+            exchange_epoch_ms, rng.randint(0, 10**7), rng.randint(-100, 100),
+            make_depth(price, rng),
+            price * 2, price // 2, price + 10_000, price - 10_000,
+        ]
+
+    return MODE_ENCODERS[mode].pack(*values)
+
+
+def make_frames(mode: SubscriptionMode, count: int, tokens: int = 200, seed: int = 7) -> list[bytes]:
+    "`count` frames round robin over `tokens` tokens with a random walk on the price"
+    rng = random.Random(seed)
+    token_names = [str(40000 + i) for i in range(tokens)]
+    prices = [rng.randint(10_000, 500_000) for _ in range(tokens)]
+    volumes = [0] * tokens
+
+    now_ms = int(time.time() * 1000)
+    frames = []
+    for i in range(count):
+        idx = i % tokens
+        prices[idx] = max(5, prices[idx] + rng.randint(-20, 20) * 5)
+        volumes[idx] += rng.randint(1, 100)
+        frames.append(make_frame(
+            mode, token_names[idx], i, now_ms + i, prices[idx], volumes[idx], rng=rng
+        ))
+
+    return frames
@@ -0,0 +1,127 @@
+import time
+import asyncio
+
+from datetime import timedelta
+from contextlib import asynccontextmanager
+
+import asyncpg
+
+from smartapi.utils.latency import LatencyRecorder
+
+# run by name through `AsyncDB.fetch`, asyncpg prepares each once per connection (statement cache)
+STATEMENTS = {
+    'token_movements': "SELECT token, accel::float8, price::float8 FROM token_movements($1::interval)",
+}
+
+
+class AsyncDB:
+    """
+        asyncpg pool for the server, queries never block the event loop
+
+        Every query has a timeout (waiting for a connection counts towards it) and
+        the pool reports how long requests wait for a connection (`pool_wait`), how
+        long they hold one (`checkout`) and the query time per statement.
+
+            db = AsyncDB(database='futures', user='postgres', ...)
+            await db.start()
+            rows = await db.fetch('token_movements', timedelta(minutes=3))
+    """
+
+    def __init__(self, min_size: int = 2, max_size: int = 10, timeout: float = 5.0, **connect_kwargs) -> None:
+        """
+            Args:
+                min_size:       connections kept open
+                max_size:       most connections at once, more requests wait
+                timeout:        seconds a query may take, connection wait included
+                connect_kwargs: `asyncpg.connect` arguments (database, user, host ...)
+        """
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.connect_kwargs = connect_kwargs
+
+        self.pool: asyncpg.Pool = None
+
+        self.pool_wait = LatencyRecorder('db_pool_wait')
+        self.checkout = LatencyRecorder('db_checkout')
+        self.queries = {name: LatencyRecorder(f"db_{name}") for name in STATEMENTS}
+
+        self.waiting = 0
+        self.in_use = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    async def start(self) -> 'AsyncDB':
+        self.pool = await asyncpg.create_pool(min_size=self.min_size, max_size=self.max_size, **self.connect_kwargs)
+        return self
+
+    async def close(self) -> None:
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    @asynccontextmanager
+    async def acquire(self, timeout: float = None):
+        "Pooled connection, timed from the wait to the release"
+        start = time.perf_counter_ns()
+        self.waiting += 1
+        try:
+            conn = await self.pool.acquire(timeout=self.timeout if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.waiting -= 1
+
+        acquired = time.perf_counter_ns()
+        self.pool_wait.record(acquired - start)
+        self.in_use += 1
+        try:
+            yield conn
+        finally:
+            self.in_use -= 1
+            await self.pool.release(conn)
+            self.checkout.record(time.perf_counter_ns() - acquired)
+
+    async def fetch(self, name: str, *args, timeout: float = None) -> list[asyncpg.Record]:
+        """
+            Runs a prepared statement
+
+            Args:
+                name:       key of `STATEMENTS`
+                timeout:    (optional) seconds, overrides the default for this query
+        """
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+
+        async with self.acquire(timeout=max(0.0, deadline - time.monotonic())) as conn:
+            start = time.perf_counter_ns()
+            try:
+                return await conn.fetch(STATEMENTS[name], *args, timeout=max(0.001, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise
+            except Exception:
+                self.errors += 1
+                raise
+            finally:
+                self.queries[name].record(time.perf_counter_ns() - start)
+
+    async def token_movements(self, interval: timedelta, timeout: float = None) -> list[asyncpg.Record]:
+        "rows of `token_movements(interval)`: token, accel & price"
+        return await self.fetch('token_movements', interval, timeout=timeout)
+
+    def stats(self) -> dict:
+        stats = {
+            "size": self.pool.get_size() if self.pool is not None else 0,
+            "idle": self.pool.get_idle_size() if self.pool is not None else 0,
+            "max_size": self.max_size,
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "pool_wait_ms": self.pool_wait.snapshot(reset=False)["total"],
+            "checkout_ms": self.checkout.snapshot(reset=False)["total"],
+        }
+        for name, recorder in self.queries.items():
+            stats[f"{name}_ms"] = recorder.snapshot(reset=False)["total"]
+        return stats
@@ -0,0 +1,420 @@
+import time
+import threading
+import traceback
+
+from pathlib import Path
+from collections import deque
+from dataclasses import dataclass, astuple
+from datetime import datetime, timedelta
+
+from psycopg2 import pool as psql_pool
+from psycopg2.extras import execute_values
+
+from smartapi.connections.api_types import ExchangeType, TickInterval
+
+# NSE / NFO session start, every bar of a day is aligned to it
+SESSION_START = timedelta(hours=9, minutes=15)
+
+_DAY_MS = 24 * 3600 * 1000
+
+
+@dataclass(slots=True)
+class Bar:
+    exchange_type: ExchangeType
+    token: str
+    interval: TickInterval
+    start: datetime
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: int
+    ticks: int
+
+
+class BarAggregator:
+    """
+        Live OHLCV bars per token for every `TickInterval`, built tick by tick
+
+        Bars are aligned to the session start (09:15), e.g. 09:15, 09:18, 09:21 for
+        3 minutes, a day bar starts at 09:15 too. Volume is the delta of
+        `volume_trade_for_the_day` between ticks (LTP ticks carry no volume).
+
+        A bar is emitted to every sink (`sink(bars: list[Bar])`) once a tick of a later
+        bar arrives, or by `close_due` when its time (plus `close_grace`) is over
+        (quiet tokens, call it periodically or use `start`). `flush` emits the bars
+        still open. A tick of a bar that was already emitted is counted as `late` and
+        dropped, it would open a partial bar that overwrites the complete one.
+
+        Sinks run on the thread emitting the bar (the socket thread for `on_tick`),
+        wrap slow ones (db) in a `QueuedSink`.
+    """
+
+    def __init__(self, sinks=(), intervals=tuple(TickInterval), session_start: timedelta = SESSION_START,
+                 close_grace: float = 2.0) -> None:
+        """
+            Args:
+                sinks:          callables getting the completed bars
+                intervals:      `TickInterval`s to build
+                session_start:  bar anchor after local midnight
+                close_grace:    seconds `close_due` waits past a bar's end for lagging ticks
+        """
+        self.sinks = list(sinks)
+        self.intervals = [(interval, int(interval.value.total_seconds() * 1000)) for interval in intervals]
+        self.session_start_ms = int(session_start.total_seconds() * 1000)
+        self.close_grace_ms = int(close_grace * 1000)
+
+        # (exchange, token) -> {interval: [start_ms, open, high, low, close, volume, ticks]}
+        self._bars = {}
+        # (exchange, token) -> {interval: start_ms of the last bar emitted}
+        self._emitted = {}
+        # (exchange, token) -> last cumulative day volume
+        self._volumes = {}
+        self._lock = threading.Lock()
+
+        # local midnight of the current day, [start, end) in epoch ms
+        self._day = (0, 0)
+
+        self._thread = None
+        self._stop = threading.Event()
+
+        self.ticks = 0
+        self.late = 0
+        self.emitted = 0
+        self.sink_errors = 0
+
+    def _anchor_ms(self, epoch_ms: int) -> int:
+        "session start of the tick's local day"
+        start, end = self._day
+        if not start <= epoch_ms < end:
+            midnight = datetime.fromtimestamp(epoch_ms / 1000).replace(hour=0, minute=0, second=0, microsecond=0)
+            start = int(midnight.timestamp() * 1000)
+            self._day = start, start + _DAY_MS
+        return self._day[0] + self.session_start_ms
+
+    def on_tick(self, tick) -> None:
+        "Feeds a tick, refer `on_data` for using it as the socket handler"
+        completed = []
+        epoch_ms = tick.exchange_epoch_ms
+        price = tick.last_traded_price
+        key = (tick.exchange_type, tick.token)
+
+        with self._lock:
+            self.ticks += 1
+            anchor = self._anchor_ms(epoch_ms)
+
+            cumulative = getattr(tick, 'volume_trade_for_the_day', None)
+            delta = 0
+            if cumulative is not None:
+                # nothing to diff the first tick of a token against
+                last = self._volumes.get(key)
+                if last is not None:
+                    # a smaller day volume is a new session
+                    delta = cumulative if cumulative < last else cumulative - last
+                self._volumes[key] = cumulative
+
+            bars = self._bars.get(key)
+            if bars is None:
+                bars = self._bars[key] = {}
+                self._emitted.setdefault(key, {})
+            emitted = self._emitted[key]
+
+            for interval, span in self.intervals:
+                if span >= _DAY_MS:
+                    start = anchor
+                else:
+                    start = anchor + (epoch_ms - anchor) // span * span
+
+                if start <= emitted.get(interval, -1):
+                    self.late += 1
+                    continue
+
+                bar = bars.get(interval)
+                if bar is not None:
+                    if start < bar[0]:
+                        self.late += 1
+                        continue
+                    if start == bar[0]:
+                        if price > bar[2]:
+                            bar[2] = price
+                        elif price < bar[3]:
+                            bar[3] = price
+                        bar[4] = price
+                        bar[5] += delta
+                        bar[6] += 1
+                        continue
+                    completed.append(self._to_bar(key, interval, bar))
+                    emitted[interval] = bar[0]
+
+                bars[interval] = [start, price, price, price, price, delta, 1]
+
+        self._emit(completed)
+
+    def on_data(self, ws_conn, tick) -> None:
+        "`SocketConnection.on_data` compatible"
+        self.on_tick(tick)
+
+    @staticmethod
+    def _to_bar(key: tuple, interval: TickInterval, bar: list) -> Bar:
+        return Bar(key[0], key[1], interval, datetime.fromtimestamp(bar[0] / 1000), *bar[1:])
+
+    def _emit(self, bars: list[Bar]) -> None:
+        if not bars:
+            return
+
+        self.emitted += len(bars)
+        for sink in self.sinks:
+            try:
+                sink(bars)
+            except Exception:
+                self.sink_errors += 1
+                traceback.print_exc()
+
+    def close_due(self, now: datetime = None) -> int:
+        """
+            Emits the bars whose time is over
+
+            returns:
+                number of bars emitted
+        """
+        now_ms = int((now or datetime.now()).timestamp() * 1000) - self.close_grace_ms
+        completed = []
+
+        with self._lock:
+            for key, bars in self._bars.items():
+                for interval, span in self.intervals:
+                    bar = bars.get(interval)
+                    if bar is not None and bar[0] + span <= now_ms:
+                        completed.append(self._to_bar(key, interval, bar))
+                        self._emitted[key][interval] = bar[0]
+                        del bars[interval]
+
+        self._emit(completed)
+        return len(completed)
+
+    def flush(self) -> int:
+        "Emits every open bar (end of day / shutdown)"
+        with self._lock:
+            completed = []
+            for key, bars in self._bars.items():
+                for interval, bar in bars.items():
+                    completed.append(self._to_bar(key, interval, bar))
+                    self._emitted[key][interval] = bar[0]
+            self._bars = {}
+
+        self._emit(completed)
+        return len(completed)
+
+    def current(self, exchange_type: ExchangeType, token: str, interval: TickInterval) -> Bar | None:
+        "The bar being built right now"
+        with self._lock:
+            bar = self._bars.get((exchange_type, token), {}).get(interval)
+            return None if bar is None else self._to_bar((exchange_type, token), interval, bar)
+
+    def start(self, every: float = 1.0) -> 'BarAggregator':
+        "Calls `close_due` every `every` seconds on a background thread"
+        if self._thread is not None:
+            return self
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(every,), name="bar-aggregator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, flush: bool = True) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if flush:
+            self.flush()
+
+    def _run(self, every: float) -> None:
+        while not self._stop.wait(every):
+            self.close_due()
+
+    def stats(self) -> dict:
+        return {
+            "tokens": len(self._bars),
+            "ticks": self.ticks,
+            "late": self.late,
+            "emitted": self.emitted,
+            "sink_errors": self.sink_errors,
+        }
+
+
+class QueuedSink:
+    """
+        Runs a sink on its own thread, the emitting thread only queues the bars
+
+            BarAggregator([QueuedSink(PostgresBarSink(pool))])
+    """
+
+    def __init__(self, sink, max_batches: int = 10_000) -> None:
+        """
+            Args:
+                sink:           callable getting the bars
+                max_batches:    batches kept while the sink is behind, the oldest are dropped beyond
+        """
+        self.sink = sink
+        self._queue = deque(maxlen=max_batches)
+        self._cond = threading.Condition()
+        self._running = True
+
+        self.dropped = 0
+        self.errors = 0
+
+        self._thread = threading.Thread(target=self._run, name="bar-sink", daemon=True)
+        self._thread.start()
+
+    def __call__(self, bars: list[Bar]) -> None:
+        with self._cond:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += len(self._queue[0])
+            self._queue.append(bars)
+            self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while self._running and not self._queue:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                # one sink call for everything queued
+                batch = [bar for bars in self._queue for bar in bars]
+                self._queue.clear()
+
+            try:
+                self.sink(batch)
+            except Exception:
+                self.errors += 1
+                traceback.print_exc()
+
+    def close(self) -> None:
+        "Stops after handing the queued bars to the sink"
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join()
+
+
+CANDLES_DDL = """
+    CREATE TABLE IF NOT EXISTS candles (
+        token INTEGER NOT NULL,
+        interval TEXT NOT NULL,
+        time TIMESTAMP NOT NULL,
+        open NUMERIC(7, 2),
+        high NUMERIC(7, 2),
+        low NUMERIC(7, 2),
+        close NUMERIC(7, 2),
+        volume BIGINT,
+        ticks INTEGER,
+        PRIMARY KEY (token, interval, time)
+    );
+"""
+
+CANDLES_UPSERT_SQL = """
+    INSERT INTO candles (token, interval, time, open, high, low, close, volume, ticks)
+    VALUES %s
+    ON CONFLICT (token, interval, time) DO UPDATE
+    SET open = EXCLUDED.open, high = EXCLUDED.high, low = EXCLUDED.low, close = EXCLUDED.close,
+        volume = EXCLUDED.volume, ticks = EXCLUDED.ticks;
+"""
+
+
+class PostgresBarSink:
+    "Upserts bars into the `candles` table, one statement per batch"
+
+    def __init__(self, pool: psql_pool.AbstractConnectionPool, create_table: bool = True) -> None:
+        self.pool = pool
+        if create_table:
+            self._execute(CANDLES_DDL)
+
+    def _execute(self, sql: str, rows: list = None) -> None:
+        conn = self.pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                if rows is None:
+                    cur.execute(sql)
+                else:
+                    execute_values(cur, sql, rows, page_size=1000)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.pool.putconn(conn)
+
+    def __call__(self, bars: list[Bar]) -> None:
+        # a batch may hold the same bar twice (flush after close_due), the last one wins
+        rows = {
+            (int(bar.token), bar.interval.name, bar.start):
+            (int(bar.token), bar.interval.name, bar.start, bar.open, bar.high, bar.low, bar.close, bar.volume, bar.ticks)
+            for bar in bars
+        }
+        self._execute(CANDLES_UPSERT_SQL, list(rows.values()))
+
+
+class ParquetBarSink:
+    """
+        Buffers bars & writes them as parquet, one file per flush under
+        `directory/interval=<name>/date=<YYYY-MM-DD>/`
+    """
+
+    def __init__(self, directory, max_rows: int = 100_000) -> None:
+        """
+            Args:
+                max_rows:   write once this many bars are buffered (and on `close`)
+        """
+        # optional dependency, only needed for this sink, fail at setup rather than on the first flush
+        import pyarrow
+
+        self.directory = Path(directory)
+        self.max_rows = max_rows
+        self._rows = []
+        self._lock = threading.Lock()
+        self.files = 0
+
+    def __call__(self, bars: list[Bar]) -> None:
+        with self._lock:
+            self._rows.extend(astuple(bar) for bar in bars)
+            full = len(self._rows) >= self.max_rows
+        if full:
+            self.flush()
+
+    def flush(self) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if not rows:
+            return
+
+        groups = {}
+        for row in rows:
+            groups.setdefault((row[2].name, row[3].date()), []).append(row)
+
+        for (interval, day), group in groups.items():
+            group.sort(key=lambda row: (int(row[0]), row[1], row[3]))
+            columns = list(zip(*group))
+            table = pa.table({
+                'exchange_type': pa.array([int(value) for value in columns[0]], pa.int8()),
+                'token': pa.array(columns[1], pa.string()),
+                'time': pa.array(columns[3], pa.timestamp('ms')),
+                'open': pa.array(columns[4], pa.float64()),
+                'high': pa.array(columns[5], pa.float64()),
+                'low': pa.array(columns[6], pa.float64()),
+                'close': pa.array(columns[7], pa.float64()),
+                'volume': pa.array(columns[8], pa.int64()),
+                'ticks': pa.array(columns[9], pa.int32()),
+            })
+
+            folder = self.directory / f"interval={interval}" / f"date={day.isoformat()}"
+            folder.mkdir(parents=True, exist_ok=True)
+            pq.write_table(table, folder / f"part-{time.time_ns()}.parquet")
+            self.files += 1
+
+    def close(self) -> None:
+        self.flush()
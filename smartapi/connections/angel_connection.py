@@ -401,7 +401,8 @@ class SmartAPIConnect:
         )['data']
 
 
-    def get_candle_data(self, exchange: Exchange, symbol_token: str, interval: Interval, start_date: datetime.datetime, end_date: datetime.datetime) -> pd.DataFrame:
+    def get_candle_data(self, exchange: Exchange, symbol_token: str, interval: Interval, start_date: datetime.datetime, end_date: datetime.datetime,
+                        keep_volume: bool = False) -> pd.DataFrame:
         params = {
             "exchange": exchange.value.upper(),
             "symboltoken": symbol_token,
@@ -425,12 +426,14 @@ class SmartAPIConnect:
                 'high' : [],
                 'close' : [],
                 'low' : [],
+                **({'volume': []} if keep_volume else {}),
             }).set_index('time')
 
         df = pd.DataFrame.from_dict(data)
         df.columns = ['time', 'open', 'high', 'low', 'close', 'volume']
         df['time'] = pd.to_datetime(df['time'])
-        df.drop(['volume'], axis=1, inplace=True)
+        if not keep_volume:
+            df.drop(['volume'], axis=1, inplace=True)
         df.set_index('time', inplace=True)
 
         return df
@@ -186,6 +186,188 @@ class Price:
             stock=stock
         )
 
+
+EXCHANGE_TIME_FORMAT = "%Y-%b-%d %H:%M:%S"
+
+class LtpTick:
+    """
+        Parsed LTP frame from the smart-stream socket
+
+        Timestamps are kept as raw epoch ms, `exchange_timestamp` (datetime) &
+        `exchange_timestring` are only built when read. Supports the dict style
+        access (`tick['token']`, `.get`, `.keys`) of the old dict ticks.
+    """
+
+    __slots__ = (
+        'subscription_mode',
+        'exchange_type',
+        'token',
+        'sequence_number',
+        'exchange_epoch_ms',
+        'last_traded_price',
+    )
+
+    KEYS = (
+        'subscription_mode',
+        'exchange_type',
+        'token',
+        'sequence_number',
+        'exchange_timestamp',
+        'last_traded_price',
+        'exchange_timestring',
+    )
+
+    # dict keys which are not valid attribute names
+    KEY_ALIASES = {}
+
+    def __init__(self, subscription_mode: int, exchange_type: int, token: str, sequence_number: int,
+                 exchange_epoch_ms: int, last_traded_price: float) -> None:
+        self.subscription_mode = subscription_mode
+        self.exchange_type = exchange_type
+        self.token = token
+        self.sequence_number = sequence_number
+        self.exchange_epoch_ms = exchange_epoch_ms
+        self.last_traded_price = last_traded_price
+
+    @property
+    def exchange_timestamp(self) -> datetime:
+        return datetime.fromtimestamp(self.exchange_epoch_ms / 1000)
+
+    @property
+    def exchange_timestring(self) -> str:
+        return self.exchange_timestamp.strftime(EXCHANGE_TIME_FORMAT)
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, self.KEY_ALIASES.get(key, key))
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.KEYS
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self) -> int:
+        return len(self.KEYS)
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self) -> tuple:
+        return self.KEYS
+
+    def items(self) -> list:
+        return [(key, self[key]) for key in self.KEYS]
+
+    def to_dict(self) -> dict:
+        return dict(self.items())
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} {self.token} @ {self.last_traded_price}>"
+
+
+class QuoteTick(LtpTick):
+    "Parsed QUOTE frame, refer `LtpTick`"
+
+    __slots__ = (
+        'last_traded_quantity',
+        'average_traded_price',
+        'volume_trade_for_the_day',
+        'total_buy_quantity',
+        'total_sell_quantity',
+        'open_price_of_the_day',
+        'high_price_of_the_day',
+        'low_price_of_the_day',
+        'closed_price',
+    )
+
+    KEYS = LtpTick.KEYS + __slots__
+
+    def __init__(self, subscription_mode: int, exchange_type: int, token: str, sequence_number: int,
+                 exchange_epoch_ms: int, last_traded_price: float, last_traded_quantity: int,
+                 average_traded_price: float, volume_trade_for_the_day: int, total_buy_quantity: float,
+                 total_sell_quantity: float, open_price_of_the_day: float, high_price_of_the_day: float,
+                 low_price_of_the_day: float, closed_price: float) -> None:
+        super().__init__(subscription_mode, exchange_type, token, sequence_number, exchange_epoch_ms, last_traded_price)
+        self.last_traded_quantity = last_traded_quantity
+        self.average_traded_price = average_traded_price
+        self.volume_trade_for_the_day = volume_trade_for_the_day
+        self.total_buy_quantity = total_buy_quantity
+        self.total_sell_quantity = total_sell_quantity
+        self.open_price_of_the_day = open_price_of_the_day
+        self.high_price_of_the_day = high_price_of_the_day
+        self.low_price_of_the_day = low_price_of_the_day
+        self.closed_price = closed_price
+
+
+class SnapQuoteTick(QuoteTick):
+    "Parsed SNAP_QUOTE frame, refer `LtpTick`"
+
+    __slots__ = (
+        'last_traded_timestamp',
+        'open_interest',
+        'open_interest_change_percentage',
+        'upper_circuit_limit',
+        'lower_circuit_limit',
+        'week_52_high_price',
+        'week_52_low_price',
+        'depth',
+    )
+
+    KEYS = QuoteTick.KEYS + (
+        'last_traded_timestamp',
+        'open_interest',
+        'open_interest_change_percentage',
+        'upper_circuit_limit',
+        'lower_circuit_limit',
+        '52_week_high_price',
+        '52_week_low_price',
+        'best_5_buy_data',
+        'best_5_sell_data',
+    )
+
+    KEY_ALIASES = {
+        '52_week_high_price': 'week_52_high_price',
+        '52_week_low_price': 'week_52_low_price',
+    }
+
+    def __init__(self, subscription_mode: int, exchange_type: int, token: str, sequence_number: int,
+                 exchange_epoch_ms: int, last_traded_price: float, last_traded_quantity: int,
+                 average_traded_price: float, volume_trade_for_the_day: int, total_buy_quantity: float,
+                 total_sell_quantity: float, open_price_of_the_day: float, high_price_of_the_day: float,
+                 low_price_of_the_day: float, closed_price: float, last_traded_timestamp: int,
+                 open_interest: int, open_interest_change_percentage: int, upper_circuit_limit: int,
+                 lower_circuit_limit: int, week_52_high_price: int, week_52_low_price: int,
+                 depth) -> None:
+        super().__init__(
+            subscription_mode, exchange_type, token, sequence_number, exchange_epoch_ms, last_traded_price,
+            last_traded_quantity, average_traded_price, volume_trade_for_the_day, total_buy_quantity,
+            total_sell_quantity, open_price_of_the_day, high_price_of_the_day, low_price_of_the_day, closed_price
+        )
+        self.last_traded_timestamp = last_traded_timestamp
+        self.open_interest = open_interest
+        self.open_interest_change_percentage = open_interest_change_percentage
+        self.upper_circuit_limit = upper_circuit_limit
+        self.lower_circuit_limit = lower_circuit_limit
+        self.week_52_high_price = week_52_high_price
+        self.week_52_low_price = week_52_low_price
+        # `MarketDepth`, decodes the best-5 block on access
+        self.depth = depth
+
+    @property
+    def best_5_buy_data(self) -> list[dict]:
+        return self.depth.best_5_buy_data
+
+    @property
+    def best_5_sell_data(self) -> list[dict]:
+        return self.depth.best_5_sell_data
+
+
 if __name__ == '__main__':
     order = Order(
         variety=Variety.NORMAL,
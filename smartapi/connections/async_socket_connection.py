@@ -0,0 +1,226 @@
+import json
+import asyncio
+import traceback
+
+import websockets
+
+from smartapi.connections import tick_decoder
+from smartapi.connections.token_table import TokenTable
+from smartapi.connections.subscriptions import SubscriptionRegistry
+from smartapi.connections.socket_connection import SocketConnection
+from smartapi.connections.api_types import SubscribeAction, SubscriptionMode, ExchangeType
+
+# ends the tick iterator
+_CLOSED = object()
+
+
+class AsyncSocketConnection:
+    """
+        asyncio client for the smart-stream feed
+
+        Ticks are exposed as an async iterator:
+
+            async with AsyncSocketConnection(...) as feed:
+                await feed.subscribe('abc', SubscriptionMode.QUOTE, {ExchangeType.NSE_FO: ['48080']})
+                async for tick in feed:
+                    ...
+
+        Dropped connections are re-opened with backoff and every subscription is sent again,
+        a frame that doesn't decode is counted (`bad_frames`) & skipped.
+    """
+
+    ROOT_URL = SocketConnection.ROOT_URL
+    HEART_BEAT_MESSAGE = SocketConnection.HEART_BEAT_MESSAGE
+    HEART_BEAT_RESPONSE = SocketConnection.HEART_BEAT_RESPONSE
+    HEART_BEAT_INTERVAL = SocketConnection.HEART_BEAT_INTERVAL
+
+    def __init__(self, client_code: str, jwt_token: str, feed_token: str, api_key: str,
+                 url: str = None, queue_size: int = 10_000,
+                 reconnect_delay: float = 1, max_reconnect_delay: float = 30) -> None:
+        """
+            Args:
+                url:                    (optional) feed url, for a local stand-in server
+                queue_size:             ticks buffered for the consumer, the reader waits when full
+                reconnect_delay:        first wait before reconnecting, doubles up to `max_reconnect_delay`
+        """
+        self.__client_code = client_code
+        self.__jwt_token = jwt_token
+        self.__feed_token = feed_token
+        self.__api_key = api_key
+
+        self.url = url or self.ROOT_URL
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+
+        self.token_table = TokenTable()
+
+        self.subscriptions = SubscriptionRegistry()
+
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._ws = None
+        self._connected = asyncio.Event()
+        self._tasks = []
+        self._closing = False
+
+        self.reconnects = 0
+        self.bad_frames = 0
+
+    @property
+    def _headers(self) -> dict:
+        return {
+            "Authorization": self.__jwt_token,
+            "x-api-key": self.__api_key,
+            "x-client-code": self.__client_code,
+            "x-feed-token": self.__feed_token
+        }
+
+    async def connect(self) -> None:
+        "Opens the connection and starts the reader & heartbeat tasks"
+        self._closing = False
+        await self._open()
+
+        self._tasks = [
+            asyncio.create_task(self._read_loop()),
+            asyncio.create_task(self._heartbeat_loop()),
+        ]
+
+    async def _open(self) -> None:
+        self._ws = await websockets.connect(
+            self.url,
+            additional_headers=self._headers,
+            # smart-stream uses text "ping" / "pong" messages, refer `_heartbeat_loop`
+            ping_interval=None,
+            # on `close` nobody reads anymore, the server's close frame may sit behind
+            # buffered ticks, don't wait the default 10s for it
+            close_timeout=1
+        )
+        self._connected.set()
+
+    async def close(self) -> None:
+        self._closing = True
+        self._connected.clear()
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        if self._ws is not None:
+            await self._ws.close()
+            self._ws = None
+
+        # never wait on a full queue here, the consumer may be gone (`break` out of `async for`)
+        while True:
+            try:
+                self._queue.put_nowait(_CLOSED)
+                break
+            except asyncio.QueueFull:
+                # the oldest tick makes room for the end marker
+                self._queue.get_nowait()
+
+    async def __aenter__(self) -> 'AsyncSocketConnection':
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        tick = await self._queue.get()
+        if tick is _CLOSED:
+            raise StopAsyncIteration
+        return tick
+
+    async def send(self, data: dict) -> None:
+        await self._connected.wait()
+        await self._ws.send(json.dumps(data))
+
+    async def subscribe(self, correlation_id: str, mode: SubscriptionMode, exchange_token_map: dict[ExchangeType: list[str]]) -> None:
+        "refer `SocketConnection.subscribe`"
+        for exchange_type, tokens in exchange_token_map.items():
+            self.token_table.update(tokens, exchange_type=exchange_type)
+
+        added = self.subscriptions.add(mode, exchange_token_map)
+        for request_data in self.subscriptions.requests(SubscribeAction.SUBSCRIBE, mode, added, correlation_id):
+            await self.send(request_data)
+
+    async def unsubscribe(self, correlation_id: str, mode: SubscriptionMode, exchange_token_map: dict[ExchangeType: list[str]]) -> None:
+        removed = self.subscriptions.remove(mode, exchange_token_map)
+        for request_data in self.subscriptions.requests(SubscribeAction.UNSUBSCRIBE, mode, removed, correlation_id):
+            await self.send(request_data)
+
+    async def sync_subscriptions(self, correlation_id: str, mode: SubscriptionMode, exchange_token_map: dict[ExchangeType: list[str]]) -> None:
+        "refer `SocketConnection.sync_subscriptions`"
+        to_add, to_remove = self.subscriptions.diff(mode, exchange_token_map)
+
+        if to_remove:
+            await self.unsubscribe(correlation_id, mode, to_remove)
+        if to_add:
+            await self.subscribe(correlation_id, mode, to_add)
+
+    async def resubscribe(self) -> None:
+        "Sends every current subscription again, in as few requests as possible"
+        for request_data in self.subscriptions.resubscribe_requests():
+            await self.send(request_data)
+
+    async def _read_loop(self) -> None:
+        delay = self.reconnect_delay
+
+        while not self._closing:
+            try:
+                async for message in self._ws:
+                    if isinstance(message, bytes):
+                        if len(message) < tick_decoder.LTP_STRUCT.size:
+                            continue
+                        try:
+                            tick = tick_decoder.decode_frame(message, tokens=self.token_table)
+                        except Exception:
+                            # the connection is fine, only this frame is lost
+                            self.bad_frames += 1
+                            if self.bad_frames <= 10:
+                                traceback.print_exc()
+                            continue
+                        await self._queue.put(tick)
+
+                    elif message != self.HEART_BEAT_RESPONSE:
+                        # error / status messages from the server
+                        print(f"Message recieved : {message} !!")
+
+                    delay = self.reconnect_delay
+
+            except asyncio.CancelledError:
+                raise
+            except websockets.ConnectionClosed:
+                pass
+            except Exception:
+                traceback.print_exc()
+
+            if self._closing:
+                break
+
+            # connection dropped, retry with backoff & send all the subscriptions again
+            self._connected.clear()
+            await self._ws.close()
+            while not self._closing:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+                try:
+                    await self._open()
+                    self.reconnects += 1
+                    await self.resubscribe()
+                    break
+                except (OSError, websockets.WebSocketException):
+                    print(f"Reconnect failed, retrying in {delay}s")
+
+    async def _heartbeat_loop(self) -> None:
+        while not self._closing:
+            await asyncio.sleep(self.HEART_BEAT_INTERVAL)
+            try:
+                await self._connected.wait()
+                await self._ws.send(self.HEART_BEAT_MESSAGE)
+            except websockets.ConnectionClosed:
+                # the reader reconnects
+                continue
@@ -0,0 +1,166 @@
+from collections import defaultdict
+
+import numpy as np
+
+from smartapi.connections import tick_decoder
+from smartapi.connections.api_types import SubscriptionMode
+from smartapi.connections.market_depth import DEPTH_PACKET_DTYPE
+
+# numpy mirrors of the struct layouts in `tick_decoder`, packed & little endian
+LTP_FIELDS = [
+    ('subscription_mode', 'u1'),
+    ('exchange_type', 'u1'),
+    ('token', 'S25'),
+    ('sequence_number', '<i8'),
+    ('exchange_timestamp', '<i8'),
+    ('last_traded_price', '<i8'),
+]
+
+QUOTE_FIELDS = LTP_FIELDS + [
+    ('last_traded_quantity', '<i8'),
+    ('average_traded_price', '<i8'),
+    ('volume_trade_for_the_day', '<i8'),
+    ('total_buy_quantity', '<f8'),
+    ('total_sell_quantity', '<f8'),
+    ('open_price_of_the_day', '<i8'),
+    ('high_price_of_the_day', '<i8'),
+    ('low_price_of_the_day', '<i8'),
+    ('closed_price', '<i8'),
+]
+
+SNAP_QUOTE_FIELDS = QUOTE_FIELDS + [
+    ('last_traded_timestamp', '<i8'),
+    ('open_interest', '<i8'),
+    ('open_interest_change_percentage', '<i8'),
+    ('best_5', DEPTH_PACKET_DTYPE, (10,)),
+    ('upper_circuit_limit', '<i8'),
+    ('lower_circuit_limit', '<i8'),
+    ('52_week_high_price', '<i8'),
+    ('52_week_low_price', '<i8'),
+]
+
+LTP_DTYPE = np.dtype(LTP_FIELDS)
+QUOTE_DTYPE = np.dtype(QUOTE_FIELDS)
+SNAP_QUOTE_DTYPE = np.dtype(SNAP_QUOTE_FIELDS)
+
+assert LTP_DTYPE.itemsize == tick_decoder.LTP_STRUCT.size
+assert QUOTE_DTYPE.itemsize == tick_decoder.QUOTE_STRUCT.size
+assert SNAP_QUOTE_DTYPE.itemsize == tick_decoder.SNAP_QUOTE_STRUCT.size
+
+# fields sent in paise, converted to rupees like the dict parser does
+PRICE_FIELDS = {
+    'last_traded_price',
+    'average_traded_price',
+    'open_price_of_the_day',
+    'high_price_of_the_day',
+    'low_price_of_the_day',
+    'closed_price',
+}
+
+
+def _column_dtype(fields: list) -> np.dtype:
+    "Output dtype: token as int64, prices as float64 and the depth block split into columns"
+    columns = []
+    for name, dtype, *shape in fields:
+        if name == 'token':
+            columns.append((name, '<i8'))
+        elif name in PRICE_FIELDS:
+            columns.append((name, '<f8'))
+        elif name == 'best_5':
+            columns.extend([
+                ('depth_flag', '<u2', (10,)),
+                ('depth_quantity', '<i8', (10,)),
+                ('depth_price', '<f8', (10,)),
+                ('depth_orders', '<u2', (10,)),
+            ])
+        else:
+            columns.append((name, dtype, *shape))
+
+    return np.dtype(columns)
+
+
+MODE_DTYPES = {
+    SubscriptionMode.LTP_MODE: (LTP_DTYPE, _column_dtype(LTP_FIELDS)),
+    SubscriptionMode.QUOTE: (QUOTE_DTYPE, _column_dtype(QUOTE_FIELDS)),
+    SubscriptionMode.SNAP_QUOTE: (SNAP_QUOTE_DTYPE, _column_dtype(SNAP_QUOTE_FIELDS)),
+}
+
+
+# token column of frames whose token isn't numeric (e.g. empty)
+INVALID_TOKEN = -1
+
+
+def _token_column(fields: np.ndarray) -> np.ndarray:
+    "int64 tokens, each distinct field parsed once like `tick_decoder.decode_token`"
+    try:
+        # tokens are numeric strings, numpy strips the trailing \x00 of `S25`
+        return fields.astype(np.int64)
+    except ValueError:
+        # an empty / non numeric token (or bytes after its \x00) somewhere in the batch
+        pass
+
+    unique, inverse = np.unique(fields, return_inverse=True)
+    tokens = np.empty(len(unique), dtype=np.int64)
+    for idx, field in enumerate(unique):
+        token = tick_decoder.decode_token(field)
+        tokens[idx] = int(token) if token.isdigit() else INVALID_TOKEN
+    return tokens[inverse]
+
+
+def _to_columns(raw: np.ndarray, column_dtype: np.dtype) -> np.recarray:
+    out = np.empty(len(raw), dtype=column_dtype)
+
+    for name in raw.dtype.names:
+        if name == 'token':
+            # one bad token field mustn't fail the whole batch
+            out[name] = _token_column(raw[name])
+        elif name in PRICE_FIELDS:
+            out[name] = raw[name] / 100
+        elif name == 'best_5':
+            out['depth_flag'] = raw[name]['flag']
+            out['depth_quantity'] = raw[name]['quantity']
+            out['depth_price'] = raw[name]['price'] / 100
+            out['depth_orders'] = raw[name]['orders']
+        else:
+            out[name] = raw[name]
+
+    return out.view(np.recarray)
+
+
+def decode_frames(frames: list[bytes]) -> dict[SubscriptionMode, np.recarray]:
+    """
+        Decodes a batch of smart-stream binary frames into columnar record arrays
+
+        Frames are grouped by their subscription mode and every group is decoded
+        with one `np.frombuffer` call, the relative order of the frames is kept
+        inside a group. Frames which are too short for their mode (heartbeats etc.)
+        are skipped.
+
+        Args:
+            frames:     raw binary frames as received from the server
+
+        returns:
+            dict of subscription mode and a record array with one row per frame
+                token, sequence_number & exchange_timestamp (epoch ms) are int64,
+                a token which isn't numeric is `INVALID_TOKEN`
+                prices are float64 (rupees)
+    """
+    grouped = defaultdict(list)
+
+    for frame in frames:
+        if len(frame) == 0 or frame[0] not in MODE_DTYPES:
+            continue
+
+        size = MODE_DTYPES[frame[0]][0].itemsize
+        if len(frame) < size:
+            continue
+
+        grouped[frame[0]].append(frame if len(frame) == size else frame[:size])
+
+    decoded = {}
+    for mode, mode_frames in grouped.items():
+        raw_dtype, column_dtype = MODE_DTYPES[mode]
+        raw = np.frombuffer(b''.join(mode_frames), dtype=raw_dtype)
+        decoded[SubscriptionMode(mode)] = _to_columns(raw, column_dtype)
+
+    return decoded
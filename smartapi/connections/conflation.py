@@ -0,0 +1,112 @@
+import time
+import threading
+import traceback
+
+
+class TickConflator:
+    """
+        Keeps only the latest tick per (exchange, token) for a slow `on_data` handler
+
+        The socket thread only swaps the tick into a dict, a delivery thread hands the
+        latest ticks to the handler either every `interval` seconds or, without an
+        interval, as soon as the handler is done with the previous batch.
+    """
+
+    def __init__(self, handler, interval: float = None) -> None:
+        """
+            Args:
+                handler:    called as `handler(ws_conn, tick)` like `on_data`
+                interval:   (optional) delivery cadence in seconds
+        """
+        self.handler = handler
+        self.interval = interval
+
+        self._latest = {}
+        self._ws_conn = None
+        self._cond = threading.Condition()
+
+        self._running = False
+        self._thread = None
+
+        self.received = 0
+        self.delivered = 0
+        self.conflated = 0
+        self.batches = 0
+        self.handler_errors = 0
+
+    def start(self) -> None:
+        if self._running:
+            return
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="tick-conflator", daemon=True)
+        self._thread.start()
+
+    def stop(self, drain: bool = True) -> None:
+        "Stops the delivery thread, by default after handing over what is pending"
+        with self._cond:
+            self._running = False
+            if not drain:
+                self._latest = {}
+            self._cond.notify()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def push(self, ws_conn, tick) -> None:
+        "Called from the socket thread"
+        key = (tick.exchange_type, tick.token)
+
+        with self._cond:
+            if key in self._latest:
+                self.conflated += 1
+
+            self._latest[key] = tick
+            self._ws_conn = ws_conn
+            self.received += 1
+            self._cond.notify()
+
+    @property
+    def pending(self) -> int:
+        return len(self._latest)
+
+    def stats(self) -> dict:
+        return {
+            "received": self.received,
+            "delivered": self.delivered,
+            "conflated": self.conflated,
+            "pending": self.pending,
+            "batches": self.batches,
+            "handler_errors": self.handler_errors,
+        }
+
+    def _run(self) -> None:
+        while True:
+            started = time.monotonic()
+
+            with self._cond:
+                while self._running and not self._latest:
+                    self._cond.wait()
+
+                if not self._running and not self._latest:
+                    return
+
+                batch, self._latest = self._latest, {}
+                ws_conn = self._ws_conn
+
+            for tick in batch.values():
+                try:
+                    self.handler(ws_conn, tick)
+                except Exception:
+                    # a bad tick shouldn't kill the delivery thread
+                    self.handler_errors += 1
+                    traceback.print_exc()
+                self.delivered += 1
+
+            self.batches += 1
+
+            if self.interval and self._running:
+                wait = self.interval - (time.monotonic() - started)
+                if wait > 0:
+                    time.sleep(wait)
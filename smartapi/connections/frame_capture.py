@@ -0,0 +1,150 @@
+import os
+import mmap
+import time
+import struct
+import threading
+
+from pathlib import Path
+from datetime import datetime
+
+# every record: receive time (epoch ns), payload length, payload
+RECORD_HEADER = struct.Struct("<qI")
+FILE_MAGIC = b"SMFC\x01"
+
+FILE_PREFIX = "frames_"
+FILE_SUFFIX = ".bin"
+
+
+class FrameRecorder:
+    """
+        Append-only log of raw socket frames, rotated daily
+
+        Files are named `frames_<YYYY-MM-DD>.bin` inside `directory` and hold
+        `FILE_MAGIC` followed by (receive time ns, length, frame) records.
+    """
+
+    def __init__(self, directory: Path, buffer_size: int = 1 << 20) -> None:
+        self.directory = Path(directory).absolute()
+        self.directory.mkdir(exist_ok=True, parents=True)
+
+        self.buffer_size = buffer_size
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._file_date = None
+
+        self.frames_written = 0
+        self.bytes_written = 0
+
+    def path_for(self, date) -> Path:
+        return self.directory / f"{FILE_PREFIX}{date.isoformat()}{FILE_SUFFIX}"
+
+    def _rotate(self, date) -> None:
+        if self._file is not None:
+            self._file.close()
+
+        path = self.path_for(date)
+        is_new = not path.exists() or path.stat().st_size == 0
+
+        self._file = open(path.as_posix(), 'ab', buffering=self.buffer_size)
+        if is_new:
+            self._file.write(FILE_MAGIC)
+        self._file_date = date
+
+    def write(self, frame: bytes, recv_ns: int = None) -> None:
+        "Appends one frame, `recv_ns` defaults to now"
+        if recv_ns is None:
+            recv_ns = time.time_ns()
+
+        with self._lock:
+            date = datetime.fromtimestamp(recv_ns / 1e9).date()
+            if date != self._file_date:
+                self._rotate(date)
+
+            self._file.write(RECORD_HEADER.pack(recv_ns, len(frame)))
+            self._file.write(frame)
+
+        self.frames_written += 1
+        self.bytes_written += RECORD_HEADER.size + len(frame)
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                self._file_date = None
+
+
+def capture_files(path: Path) -> list[Path]:
+    "A capture file or every capture file (in date order) of a directory"
+    path = Path(path)
+    if path.is_dir():
+        return sorted(path.glob(f"{FILE_PREFIX}*{FILE_SUFFIX}"))
+    return [path]
+
+
+def read_frames(path: Path):
+    """
+        Iterates over (receive time ns, frame) of a capture file / directory
+
+        A truncated record at the end of a file (crash while writing) is ignored.
+    """
+    for file_path in capture_files(path):
+        if file_path.stat().st_size == 0:
+            continue
+
+        with open(file_path, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(FILE_MAGIC)] != FILE_MAGIC:
+                raise ValueError(f"Not a frame capture file: {file_path}")
+
+            offset = len(FILE_MAGIC)
+            end = len(data)
+
+            while offset + RECORD_HEADER.size <= end:
+                recv_ns, length = RECORD_HEADER.unpack_from(data, offset)
+                offset += RECORD_HEADER.size
+
+                if offset + length > end:
+                    break
+
+                yield recv_ns, data[offset: offset + length]
+                offset += length
+
+
+def replay_frames(path: Path, handler, paced: bool = False, speed: float = 1.0) -> int:
+    """
+        Feeds captured frames to `handler(frame)`
+
+        Args:
+            path:       capture file or directory
+            handler:    called with every raw frame
+            paced:      sleep to keep the original gaps between frames
+            speed:      pacing multiplier, 2.0 replays twice as fast
+
+        returns:
+            number of frames replayed
+    """
+    count = 0
+    first_recv_ns = None
+    start_ns = time.perf_counter_ns()
+
+    for recv_ns, frame in read_frames(path):
+        if paced:
+            if first_recv_ns is None:
+                first_recv_ns = recv_ns
+
+            due_ns = start_ns + (recv_ns - first_recv_ns) / speed
+            wait_ns = due_ns - time.perf_counter_ns()
+            if wait_ns > 0:
+                time.sleep(wait_ns / 1e9)
+
+        handler(frame)
+        count += 1
+
+    return count
@@ -0,0 +1,303 @@
+import time
+import queue
+import threading
+import traceback
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from smartapi.connections.api_types import ExchangeType, ExchangeMap, Interval, TickInterval
+
+# ends the backfill thread
+_STOP = object()
+
+
+@dataclass
+class Gap:
+    "Range of a token's ticks which never reached us"
+    exchange_type: ExchangeType
+    token: str
+    start: datetime
+    end: datetime
+    # reconnect | silence | sequence
+    reason: str
+    # cumulative day volume of the last tick before the gap (None for LTP ticks)
+    last_volume: int = None
+
+
+class GapTracker:
+    """
+        Per token (sequence number, exchange time) of the last accepted tick
+
+        `accept` drops duplicate (same exchange time as the token's last tick) / out of
+        order (older exchange time) ticks and reports gaps to `on_gap`:
+            - reconnect:    first tick of a token after the connection was re-opened
+            - silence:      exchange time jumped by more than `max_silence`
+            - sequence:     sequence number skipped (only with `sequence_gaps`, smart-stream
+                            doesn't document sequence numbers as per token)
+
+        A token is only checked when it ticks again, so an illiquid token's gap is found late.
+        Sequence numbers may be per connection, one going backwards is only counted
+        (`out_of_sequence`), never a reason to drop the tick.
+    """
+
+    def __init__(self, on_gap=None, max_silence: timedelta = None, reconnect_gap: timedelta = timedelta(seconds=1),
+                 sequence_gaps: bool = False) -> None:
+        """
+            Args:
+                on_gap:         (optional) called as `on_gap(gap)`
+                max_silence:    (optional) report a gap when a token is quiet for longer than this
+                reconnect_gap:  ignore reconnect windows shorter than this
+                sequence_gaps:  also report skipped sequence numbers
+        """
+        self.on_gap = on_gap
+        self.max_silence_ms = None if max_silence is None else max_silence.total_seconds() * 1000
+        self.reconnect_gap_ms = reconnect_gap.total_seconds() * 1000
+        self.sequence_gaps = sequence_gaps
+
+        # (exchange, token) -> [sequence_number, exchange_epoch_ms, session, volume]
+        self._last = {}
+        # bumped on every reconnect, sequence numbers are only compared within a session
+        self.session = 0
+
+        self.accepted = 0
+        self.duplicates = 0
+        self.out_of_order = 0
+        self.out_of_sequence = 0
+        self.gaps = 0
+
+    def new_session(self) -> None:
+        "Call when the connection drops, the next tick of every token is checked for a gap"
+        self.session += 1
+
+    def accept(self, tick) -> bool:
+        "False when the tick has the same / an older exchange time than the last one of its token"
+        key = (tick.exchange_type, tick.token)
+        epoch_ms = tick.exchange_epoch_ms
+        state = self._last.get(key)
+
+        if state is None:
+            self._last[key] = [tick.sequence_number, epoch_ms, self.session, getattr(tick, 'volume_trade_for_the_day', None)]
+            self.accepted += 1
+            return True
+
+        sequence, last_epoch_ms, session, volume = state
+
+        if epoch_ms < last_epoch_ms:
+            self.out_of_order += 1
+            return False
+
+        if epoch_ms == last_epoch_ms:
+            self.duplicates += 1
+            return False
+
+        if session == self.session and tick.sequence_number <= sequence:
+            self.out_of_sequence += 1
+
+        reason = None
+        if session != self.session:
+            if epoch_ms - last_epoch_ms > self.reconnect_gap_ms:
+                reason = 'reconnect'
+        elif self.max_silence_ms is not None and epoch_ms - last_epoch_ms > self.max_silence_ms:
+            reason = 'silence'
+        elif self.sequence_gaps and tick.sequence_number > sequence + 1:
+            reason = 'sequence'
+
+        if reason is not None:
+            self.gaps += 1
+            if self.on_gap is not None:
+                self.on_gap(Gap(
+                    tick.exchange_type, tick.token,
+                    datetime.fromtimestamp(last_epoch_ms / 1000), datetime.fromtimestamp(epoch_ms / 1000),
+                    reason, volume
+                ))
+
+        state[0] = tick.sequence_number
+        state[1] = epoch_ms
+        state[2] = self.session
+        state[3] = getattr(tick, 'volume_trade_for_the_day', volume)
+        self.accepted += 1
+        return True
+
+    def last_seen(self, exchange_type: ExchangeType, token: str) -> datetime | None:
+        state = self._last.get((exchange_type, token))
+        return None if state is None else datetime.fromtimestamp(state[1] / 1000)
+
+    def stats(self) -> dict:
+        return {
+            "tokens": len(self._last),
+            "session": self.session,
+            "accepted": self.accepted,
+            "duplicates": self.duplicates,
+            "out_of_order": self.out_of_order,
+            "out_of_sequence": self.out_of_sequence,
+            "gaps": self.gaps,
+        }
+
+
+class BackfillWorker:
+    """
+        Fills gaps from the historical candle api on a background thread
+
+        Every candle closing inside a gap becomes a row shaped like a tick (`token`,
+        `exchange_type`, `exchange_timestamp`, `last_traded_price` (close),
+        `volume_trade_for_the_day`, `open` / `high` / `low` / `close`) with
+        `backfilled = True`, handed to `sink(row)`. Requests are spaced by
+        `request_interval` to stay under the api rate limit.
+
+        The candle holding the gap's last tick is skipped, part of its volume was
+        already received, so the backfilled day volume doesn't count it twice.
+    """
+
+    def __init__(self, api, sink, interval: Interval = Interval.ONE_MINUTE, min_gap: timedelta = timedelta(minutes=1),
+                 request_interval: float = 0.35, retries: int = 3) -> None:
+        """
+            Args:
+                api:                logged in `SmartAPIConnect`
+                sink:               called as `sink(row)` for every backfilled row
+                interval:           candle interval to backfill with
+                min_gap:            gaps shorter than this are skipped
+                request_interval:   min seconds between candle requests
+                retries:            attempts per gap before giving up
+        """
+        self.api = api
+        self.sink = sink
+        self.interval = interval
+        self.min_gap = min_gap
+        self.request_interval = request_interval
+        self.retries = retries
+
+        self._candle_span = TickInterval[interval.name].value
+        self._queue = queue.Queue()
+        self._thread = None
+        self._last_request = 0.0
+
+        self.jobs = 0
+        self.rows = 0
+        self.skipped = 0
+        self.unsupported = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+
+        self._thread = threading.Thread(target=self._run, name="gap-backfill", daemon=True)
+        self._thread.start()
+
+    def stop(self, drain: bool = True) -> None:
+        "Stops the backfill thread, by default after the queued gaps are done"
+        if not drain:
+            while not self._queue.empty():
+                self._queue.get_nowait()
+
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, gap: Gap) -> None:
+        "Queues a gap, safe to call from the socket thread"
+        if gap.end - gap.start < self.min_gap:
+            self.skipped += 1
+            return
+
+        self._queue.put(gap)
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _run(self) -> None:
+        while True:
+            gap = self._queue.get()
+            if gap is _STOP:
+                return
+
+            try:
+                self.backfill(gap)
+            except Exception:
+                self.failed += 1
+                traceback.print_exc()
+
+    def _throttle(self) -> None:
+        wait = self._last_request + self.request_interval - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self._last_request = time.monotonic()
+
+    def backfill(self, gap: Gap) -> int:
+        """
+            Fetches the candles of `gap` & hands them to the sink
+
+            returns:
+                number of rows backfilled
+        """
+        exchange = ExchangeMap.get(ExchangeType(gap.exchange_type))
+        if exchange is None:
+            self.unsupported += 1
+            return 0
+
+        self.jobs += 1
+        start = gap.start.replace(second=0, microsecond=0)
+
+        for attempt in range(self.retries):
+            self._throttle()
+            try:
+                candles = self.api.get_candle_data(exchange, gap.token, self.interval, start, gap.end, keep_volume=True)
+                break
+            except Exception:
+                traceback.print_exc()
+                time.sleep(2 ** attempt)
+        else:
+            self.failed += 1
+            return 0
+
+        rows = 0
+        volume = gap.last_volume
+        day = gap.start.date()
+
+        for candle in candles.itertuples():
+            candle_time = candle.Index.to_pydatetime()
+            if candle_time.tzinfo is not None:
+                # same local naive time as the ticks' `exchange_timestamp`
+                candle_time = candle_time.astimezone().replace(tzinfo=None)
+
+            close_time = candle_time + self._candle_span - timedelta(seconds=1)
+            # started before the gap, its volume partly is in `last_volume`
+            if candle_time <= gap.start or close_time >= gap.end:
+                continue
+
+            # day volume restarts every session
+            if close_time.date() != day:
+                day = close_time.date()
+                volume = 0 if volume is not None else None
+            if volume is not None:
+                volume += int(candle.volume)
+
+            self.sink({
+                'token': gap.token,
+                'exchange_type': gap.exchange_type,
+                'exchange_timestamp': close_time,
+                'last_traded_price': candle.close,
+                'volume_trade_for_the_day': volume,
+                'open': candle.open,
+                'high': candle.high,
+                'low': candle.low,
+                'close': candle.close,
+                'backfilled': True,
+            })
+            rows += 1
+
+        self.rows += rows
+        return rows
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "jobs": self.jobs,
+            "rows": self.rows,
+            "skipped": self.skipped,
+            "unsupported": self.unsupported,
+            "failed": self.failed,
+        }
@@ -0,0 +1,132 @@
+import numpy as np
+
+# one of the 10 packets in the best-5 block of a SNAP_QUOTE frame
+DEPTH_PACKET_DTYPE = np.dtype([
+    ('flag', '<u2'),
+    ('quantity', '<i8'),
+    ('price', '<i8'),
+    ('orders', '<u2'),
+])
+
+DEPTH_SIZE = DEPTH_PACKET_DTYPE.itemsize * 10
+
+# same convention as `tick_decoder.decode_depth`
+BUY_FLAG = 0
+
+
+class MarketDepth:
+    """
+        Lazy view over the 200 byte best-5 block of a SNAP_QUOTE frame
+
+        Nothing is decoded until one of the accessors is read, the packets are then
+        mapped (zero copy) into a NumPy structured array over the frame buffer.
+        Levels are in the order sent by the server (best first).
+    """
+
+    __slots__ = ('_view', '_packets', '_bids', '_asks')
+
+    def __init__(self, binary_data, offset: int = 0) -> None:
+        """
+            Args:
+                binary_data:    bytes-like holding the depth block
+                offset:         where the depth block starts inside `binary_data`
+        """
+        self._view = memoryview(binary_data)[offset: offset + DEPTH_SIZE]
+        self._packets = None
+        self._bids = None
+        self._asks = None
+
+    @property
+    def packets(self) -> np.ndarray:
+        "All 10 packets as (flag, quantity, price, orders), prices are in paise"
+        if self._packets is None:
+            self._packets = np.frombuffer(self._view, dtype=DEPTH_PACKET_DTYPE)
+        return self._packets
+
+    @property
+    def bids(self) -> np.ndarray:
+        if self._bids is None:
+            packets = self.packets
+            self._bids = packets[packets['flag'] == BUY_FLAG]
+        return self._bids
+
+    @property
+    def asks(self) -> np.ndarray:
+        if self._asks is None:
+            packets = self.packets
+            self._asks = packets[packets['flag'] != BUY_FLAG]
+        return self._asks
+
+    @property
+    def bid_prices(self) -> np.ndarray:
+        return self.bids['price'] / 100
+
+    @property
+    def bid_quantities(self) -> np.ndarray:
+        return self.bids['quantity']
+
+    @property
+    def bid_orders(self) -> np.ndarray:
+        return self.bids['orders']
+
+    @property
+    def ask_prices(self) -> np.ndarray:
+        return self.asks['price'] / 100
+
+    @property
+    def ask_quantities(self) -> np.ndarray:
+        return self.asks['quantity']
+
+    @property
+    def ask_orders(self) -> np.ndarray:
+        return self.asks['orders']
+
+    def top_of_book(self) -> tuple[float, int, float, int]:
+        "Returns (bid price, bid quantity, ask price, ask quantity), 0 for an empty side"
+        bids, asks = self.bids, self.asks
+        bid_price, bid_qty = (bids[0]['price'] / 100, int(bids[0]['quantity'])) if len(bids) else (0.0, 0)
+        ask_price, ask_qty = (asks[0]['price'] / 100, int(asks[0]['quantity'])) if len(asks) else (0.0, 0)
+        return float(bid_price), bid_qty, float(ask_price), ask_qty
+
+    def spread(self) -> float:
+        bid_price, _, ask_price, _ = self.top_of_book()
+        return ask_price - bid_price
+
+    def imbalance(self, levels: int = 5) -> float:
+        """
+            Order book imbalance over the top `levels` levels
+
+            returns:
+                (bid qty - ask qty) / (bid qty + ask qty), in [-1, 1] (0 for an empty book)
+        """
+        bid_qty = int(self.bids['quantity'][:levels].sum())
+        ask_qty = int(self.asks['quantity'][:levels].sum())
+        total = bid_qty + ask_qty
+        return (bid_qty - ask_qty) / total if total else 0.0
+
+    @staticmethod
+    def _to_dicts(packets: np.ndarray) -> list[dict]:
+        return [
+            {
+                "flag": int(packet['flag']),
+                "quantity": int(packet['quantity']),
+                "price": int(packet['price']) / 100,
+                "no of orders": int(packet['orders'])
+            } for packet in packets
+        ]
+
+    @property
+    def best_5_buy_data(self) -> list[dict]:
+        "Old list of dicts format, refer `tick_decoder.decode_depth`"
+        return self._to_dicts(self.bids)
+
+    @property
+    def best_5_sell_data(self) -> list[dict]:
+        return self._to_dicts(self.asks)
+
+    def __reduce__(self):
+        # memoryviews can't be pickled, ship a copy of the block
+        return (MarketDepth, (self._view.tobytes(),))
+
+    def __repr__(self) -> str:
+        return "<MarketDepth (lazy)>" if self._packets is None else f"<MarketDepth {self.top_of_book()}>"
@@ -0,0 +1,225 @@
+import time
+import zlib
+import threading
+import traceback
+
+from enum import StrEnum
+
+# token field inside every frame, used to keep per token ordering
+TOKEN_SLICE = slice(2, 27)
+
+# shortest valid frame (LTP)
+MIN_FRAME_SIZE = 51
+
+
+class BackpressurePolicy(StrEnum):
+    # receive thread waits for space (feed lag grows in the kernel instead)
+    BLOCK = 'block'
+    # oldest queued frame is dropped
+    DROP_OLDEST = 'drop_oldest'
+    # a queued frame of the same token is replaced, else the oldest one is dropped
+    CONFLATE = 'conflate'
+
+
+class FrameRing:
+    "Bounded ring buffer of (key, frame) for a single worker"
+
+    def __init__(self, capacity: int, policy: BackpressurePolicy = BackpressurePolicy.BLOCK) -> None:
+        self.capacity = capacity
+        self.policy = BackpressurePolicy(policy)
+
+        self._slots = [None] * capacity
+        self._head = 0
+        self._count = 0
+
+        # key -> slot of its latest queued frame (only for CONFLATE)
+        self._key_slots = {}
+
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.conflated = 0
+        self.high_watermark = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def put(self, key: bytes, item) -> None:
+        with self._lock:
+            if self._count == self.capacity:
+                if self.policy == BackpressurePolicy.BLOCK:
+                    while self._count == self.capacity:
+                        self._not_full.wait()
+
+                elif self.policy == BackpressurePolicy.CONFLATE and key in self._key_slots:
+                    # newer frame takes the place of the queued one, order per key is kept
+                    self._slots[self._key_slots[key]] = (key, item)
+                    self.conflated += 1
+                    return
+
+                else:
+                    self._pop()
+                    self.dropped += 1
+
+            slot = (self._head + self._count) % self.capacity
+            self._slots[slot] = (key, item)
+            self._count += 1
+
+            if self.policy == BackpressurePolicy.CONFLATE:
+                self._key_slots[key] = slot
+
+            self.enqueued += 1
+            if self._count > self.high_watermark:
+                self.high_watermark = self._count
+
+            self._not_empty.notify()
+
+    def _pop(self):
+        slot = self._head
+        key, item = self._slots[slot]
+        self._slots[slot] = None
+        self._head = (self._head + 1) % self.capacity
+        self._count -= 1
+
+        if self._key_slots.get(key) == slot:
+            del self._key_slots[key]
+
+        return item
+
+    def get(self, timeout: float = None):
+        "Oldest item, None if nothing came in `timeout` seconds"
+        with self._lock:
+            if self._count == 0:
+                self._not_empty.wait(timeout)
+                if self._count == 0:
+                    return None
+
+            item = self._pop()
+            self._not_full.notify()
+            return item
+
+    def clear(self) -> None:
+        with self._lock:
+            while self._count:
+                self._pop()
+            self._not_full.notify_all()
+
+    def wake(self) -> None:
+        with self._lock:
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+
+class FramePipeline:
+    """
+        Moves parsing & `on_data` off the socket receive thread
+
+        The receive thread only drops raw frames into one of the workers' bounded ring
+        buffers, picked by a hash of the token field so every token is always handled by
+        the same worker (in order). Workers parse the frame and call the handler.
+    """
+
+    def __init__(self, parse, handler, workers: int = 4, capacity: int = 10_000,
+                 policy: BackpressurePolicy = BackpressurePolicy.BLOCK) -> None:
+        """
+            Args:
+                parse:      frame -> tick
+                handler:    called as `handler(ws_conn, tick)`
+                workers:    number of worker threads
+                capacity:   ring buffer size per worker
+                policy:     what to do when a worker's buffer is full
+        """
+        self.parse = parse
+        self.handler = handler
+        self.workers = workers
+
+        self._rings = [FrameRing(capacity, policy) for _ in range(workers)]
+        self._threads = []
+        self._running = False
+
+        self._worker_stats = [
+            {"handled": 0, "errors": 0, "busy_ns": 0, "max_ns": 0} for _ in range(workers)
+        ]
+
+    def start(self) -> None:
+        if self._running:
+            return
+
+        self._running = True
+        self._threads = [
+            threading.Thread(target=self._run, args=(idx,), name=f"frame-worker-{idx}", daemon=True)
+            for idx in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, drain: bool = True) -> None:
+        self._running = False
+
+        if not drain:
+            for ring in self._rings:
+                ring.clear()
+
+        for ring in self._rings:
+            ring.wake()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def submit(self, ws_conn, frame: bytes) -> None:
+        "Called from the receive thread, only hashes the token & enqueues"
+        if len(frame) < MIN_FRAME_SIZE:
+            return
+
+        key = frame[TOKEN_SLICE]
+        self._rings[zlib.crc32(key) % self.workers].put(key, (ws_conn, frame))
+
+    def _run(self, idx: int) -> None:
+        ring = self._rings[idx]
+        stats = self._worker_stats[idx]
+
+        while self._running or len(ring):
+            item = ring.get(timeout=0.5)
+            if item is None:
+                continue
+
+            ws_conn, frame = item
+            start = time.perf_counter_ns()
+            try:
+                self.handler(ws_conn, self.parse(frame))
+            except Exception:
+                stats["errors"] += 1
+                traceback.print_exc()
+
+            elapsed = time.perf_counter_ns() - start
+            stats["handled"] += 1
+            stats["busy_ns"] += elapsed
+            if elapsed > stats["max_ns"]:
+                stats["max_ns"] = elapsed
+
+    def stats(self) -> dict:
+        workers = []
+        for ring, stats in zip(self._rings, self._worker_stats):
+            handled = stats["handled"]
+            workers.append({
+                "queue_depth": len(ring),
+                "high_watermark": ring.high_watermark,
+                "enqueued": ring.enqueued,
+                "dropped": ring.dropped,
+                "conflated": ring.conflated,
+                "handled": handled,
+                "errors": stats["errors"],
+                "avg_handler_ms": stats["busy_ns"] / handled / 1e6 if handled else 0.0,
+                "max_handler_ms": stats["max_ns"] / 1e6,
+            })
+
+        return {
+            "queue_depth": sum(w["queue_depth"] for w in workers),
+            "dropped": sum(w["dropped"] for w in workers),
+            "conflated": sum(w["conflated"] for w in workers),
+            "handled": sum(w["handled"] for w in workers),
+            "workers": workers,
+        }
@@ -0,0 +1,400 @@
+import math
+import time
+import zlib
+import queue
+import bisect
+import threading
+import traceback
+
+from enum import StrEnum
+from collections import defaultdict
+
+from smartapi.connections.token_table import TokenTable
+from smartapi.connections.socket_connection import SocketConnection
+from smartapi.connections.subscriptions import MAX_TOKENS_PER_REQUEST
+from smartapi.connections.api_types import SubscribeAction, SubscriptionMode, ExchangeType
+
+# ends the dispatcher thread
+_STOP = object()
+
+
+class ShardStrategy(StrEnum):
+    # consistent hash of (exchange, token) with bounded shard loads
+    HASH = 'hash'
+    # every token of an exchange on the same shard
+    EXCHANGE = 'exchange'
+
+
+class HashRing:
+    "Consistent hash ring over shard indices, with virtual nodes"
+
+    def __init__(self, shards: int, replicas: int = 64) -> None:
+        points = sorted(
+            (zlib.crc32(f"shard-{idx}-{replica}".encode()), idx)
+            for idx in range(shards) for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._shards = [idx for _, idx in points]
+
+    def walk(self, key: str):
+        "Shards in ring order starting at `key`, every shard once"
+        start = bisect.bisect(self._hashes, zlib.crc32(key.encode()))
+        seen = set()
+        for offset in range(len(self._hashes)):
+            shard = self._shards[(start + offset) % len(self._hashes)]
+            if shard not in seen:
+                seen.add(shard)
+                yield shard
+
+
+class SocketShardPool:
+    """
+        Splits the subscribed token universe over N `SocketConnection`s
+
+        Every shard runs its own socket thread (and reconnects on its own). Ticks of all
+        the shards are merged into one queue and handed to `on_data` by a single
+        dispatcher thread, a token always lives on one shard so its ticks stay in order
+        (a tick with an older exchange time than the last delivered one of its token is
+        dropped, which covers tokens moved by a rebalance).
+
+        Assignment is a consistent hash with bounded loads: a token goes to the first
+        shard on the ring (from its hash) which has room, so adding / removing tokens
+        only moves what has to move. `rebalance` evens the shards out when they drift.
+    """
+
+    def __init__(self, client_code: str, jwt_token: str, feed_token: str, api_key: str,
+                 shards: int = 4, strategy: ShardStrategy = ShardStrategy.HASH,
+                 max_tokens_per_shard: int = MAX_TOKENS_PER_REQUEST, load_factor: float = 1.25,
+                 queue_size: int = 100_000, url: str = None, socket_factory=None) -> None:
+        """
+            Args:
+                shards:                 number of websocket connections
+                strategy:               hash | exchange
+                max_tokens_per_shard:   per connection token limit of the server
+                load_factor:            a shard may hold up to `load_factor` x the average load
+                queue_size:             merged tick queue size (shards wait when it's full)
+                url:                    (optional) feed url, for a local stand-in server
+                socket_factory:         (optional) builds a shard, defaults to `SocketConnection`
+        """
+        self.strategy = ShardStrategy(strategy)
+        self.max_tokens_per_shard = max_tokens_per_shard
+        self.load_factor = load_factor
+
+        socket_factory = socket_factory or SocketConnection
+        self.token_table = TokenTable()
+
+        self._shards: list[SocketConnection] = []
+        for idx in range(shards):
+            shard = socket_factory(client_code, jwt_token, feed_token, api_key)
+            shard.token_table = self.token_table
+            if url is not None:
+                shard.ROOT_URL = url
+            shard.on_open = self.__shard_handler(self._handle_open, idx)
+            shard.on_data = self.__shard_handler(self._handle_data, idx)
+            shard.on_error = self.__shard_handler(self._handle_error, idx)
+            shard.on_message = lambda *args: None
+            self._shards.append(shard)
+
+        self._ring = HashRing(shards)
+
+        # (mode, exchange, token) -> shard
+        self._assignment: dict[tuple, int] = {}
+        self._loads = [0] * shards
+        self._lock = threading.RLock()
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._dispatcher = None
+        self._running = False
+
+        # (exchange, token) -> exchange time of the last delivered tick
+        self._last_tick_time = {}
+
+        self._shard_stats = [
+            {"connected": False, "ticks": 0, "errors": 0, "reconnects": 0, "last_tick": None,
+             "last_error": None, "_rate_ticks": 0, "_rate_time": time.monotonic()}
+            for _ in range(shards)
+        ]
+        self.delivered = 0
+        self.dropped_out_of_order = 0
+        self.moved = 0
+
+        self.on_data = None
+        self.on_error = None
+
+    @staticmethod
+    def __shard_handler(handler, idx: int):
+        return lambda ws_conn, *args: handler(idx, ws_conn, *args)
+
+    @property
+    def shards(self) -> int:
+        return len(self._shards)
+
+    # ---------------------------------------------------------------- lifecycle
+
+    def connect(self) -> None:
+        "Starts every shard on its own thread plus the dispatcher, doesn't block"
+        self._running = True
+
+        self._dispatcher = threading.Thread(target=self._dispatch, name="shard-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+        self._threads = [
+            threading.Thread(target=self._run_shard, args=(idx,), name=f"socket-shard-{idx}", daemon=True)
+            for idx in range(self.shards)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def close_connection(self) -> None:
+        self._running = False
+
+        for shard in self._shards:
+            try:
+                shard.close_connection()
+            except Exception:
+                traceback.print_exc()
+
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+        if self._dispatcher is not None:
+            self._queue.put(_STOP)
+            self._dispatcher.join()
+            self._dispatcher = None
+
+    def _run_shard(self, idx: int) -> None:
+        shard = self._shards[idx]
+        stats = self._shard_stats[idx]
+        delay = 1
+
+        while self._running:
+            # always go through `on_open`, it re-sends this shard's subscriptions
+            shard.RESUBSCRIBE_FLAG = False
+            try:
+                shard.connect()
+                delay = 1
+            except Exception as err:
+                stats["errors"] += 1
+                stats["last_error"] = str(err)
+                traceback.print_exc()
+
+            stats["connected"] = False
+            if not self._running:
+                break
+
+            stats["reconnects"] += 1
+            time.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    # ------------------------------------------------------------ subscriptions
+
+    def _load_cap(self, total: int) -> int:
+        average = total / self.shards
+        return max(1, min(self.max_tokens_per_shard, math.ceil(average * self.load_factor)))
+
+    def _pick_shard(self, mode: SubscriptionMode, exchange_type: ExchangeType, token: str, loads: list[int], cap: int) -> int:
+        if self.strategy == ShardStrategy.EXCHANGE:
+            return next(self._ring.walk(f"exchange-{int(exchange_type)}"))
+
+        for idx in self._ring.walk(f"{int(exchange_type)}:{token}"):
+            if loads[idx] < cap:
+                return idx
+
+        raise ValueError(f"All {self.shards} shards are full ({self.max_tokens_per_shard} tokens each)")
+
+    def _apply(self, changes: dict, action: SubscribeAction, correlation_id: str) -> None:
+        """
+            changes: shard -> mode -> exchange -> tokens
+
+            Every shard's registry is updated before anything is sent, `on_open` sends a
+            shard's registry again, so a request lost to a dropping socket is only late.
+        """
+        sends = []
+        for idx, mode_map in changes.items():
+            registry = self._shards[idx].subscriptions
+            for mode, exchange_token_map in mode_map.items():
+                if action == SubscribeAction.SUBSCRIBE:
+                    changed = registry.add(mode, exchange_token_map)
+                else:
+                    changed = registry.remove(mode, exchange_token_map)
+                if changed:
+                    sends.append((idx, mode, changed))
+
+        for idx, mode, changed in sends:
+            stats = self._shard_stats[idx]
+            if not stats["connected"]:
+                continue
+
+            shard = self._shards[idx]
+            try:
+                for request_data in shard.subscriptions.requests(action, mode, changed, correlation_id):
+                    shard.send(request_data)
+            except Exception as err:
+                # the other shards still get theirs, this one re-sends on reconnect
+                stats["errors"] += 1
+                stats["last_error"] = str(err)
+                traceback.print_exc()
+
+    @staticmethod
+    def _changes() -> dict:
+        return defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
+
+    def subscribe(self, correlation_id: str, mode: SubscriptionMode, exchange_token_map: dict[ExchangeType: list[str]]) -> None:
+        "refer `SocketConnection.subscribe`, tokens are spread over the shards"
+        changes = self._changes()
+
+        with self._lock:
+            new_keys = [
+                (mode, exchange_type, token)
+                for exchange_type, tokens in exchange_token_map.items() for token in tokens
+                if token != '' and (mode, exchange_type, token) not in self._assignment
+            ]
+            cap = self._load_cap(len(self._assignment) + len(new_keys))
+
+            for key in new_keys:
+                idx = self._pick_shard(*key, self._loads, cap)
+                self._assignment[key] = idx
+                self._loads[idx] += 1
+                changes[idx][key[0]][key[1]].append(key[2])
+                self.token_table.add(key[2], exchange_type=key[1])
+
+            self._apply(changes, SubscribeAction.SUBSCRIBE, correlation_id)
+
+    def unsubscribe(self, correlation_id: str, mode: SubscriptionMode, exchange_token_map: dict[ExchangeType: list[str]]) -> None:
+        "refer `SocketConnection.unsubscribe`, rebalances when a shard ends up over its share"
+        changes = self._changes()
+
+        with self._lock:
+            for exchange_type, tokens in exchange_token_map.items():
+                for token in tokens:
+                    idx = self._assignment.pop((mode, exchange_type, token), None)
+                    if idx is None:
+                        continue
+                    self._loads[idx] -= 1
+                    changes[idx][mode][exchange_type].append(token)
+
+            self._apply(changes, SubscribeAction.UNSUBSCRIBE, correlation_id)
+
+            if self.strategy == ShardStrategy.HASH and max(self._loads) > self._load_cap(len(self._assignment)):
+                self.rebalance(correlation_id)
+
+    def rebalance(self, correlation_id: str = None) -> int:
+        """
+            Recomputes the bounded load assignment of every token, only the tokens whose
+            shard changed are moved (unsubscribed from the old shard, subscribed on the new)
+
+            returns:
+                number of tokens moved
+        """
+        to_remove, to_add = self._changes(), self._changes()
+
+        with self._lock:
+            loads = [0] * self.shards
+            cap = self._load_cap(len(self._assignment))
+            assignment = {}
+
+            # tokens stay on their shard while it has room, the rest are placed again
+            for key, idx in sorted(self._assignment.items()):
+                if self.strategy == ShardStrategy.EXCHANGE or loads[idx] >= cap:
+                    idx = self._pick_shard(*key, loads, cap)
+                assignment[key] = idx
+                loads[idx] += 1
+
+            moved = 0
+            for key, idx in assignment.items():
+                old = self._assignment[key]
+                if old != idx:
+                    to_remove[old][key[0]][key[1]].append(key[2])
+                    to_add[idx][key[0]][key[1]].append(key[2])
+                    moved += 1
+
+            self._assignment = assignment
+            self._loads = loads
+
+            self._apply(to_remove, SubscribeAction.UNSUBSCRIBE, correlation_id)
+            self._apply(to_add, SubscribeAction.SUBSCRIBE, correlation_id)
+
+        self.moved += moved
+        return moved
+
+    def shard_of(self, mode: SubscriptionMode, exchange_type: ExchangeType, token: str) -> int | None:
+        return self._assignment.get((mode, exchange_type, token))
+
+    # ----------------------------------------------------------------- handlers
+
+    def _handle_open(self, idx: int, ws_conn) -> None:
+        self._shard_stats[idx]["connected"] = True
+        self._shards[idx].resubscribe()
+
+    def _handle_error(self, idx: int, ws_conn, error) -> None:
+        stats = self._shard_stats[idx]
+        stats["errors"] += 1
+        stats["last_error"] = str(error)
+        if self.on_error is not None:
+            self.on_error(ws_conn, error)
+
+    def _handle_data(self, idx: int, ws_conn, tick) -> None:
+        stats = self._shard_stats[idx]
+        stats["ticks"] += 1
+        stats["last_tick"] = time.time()
+        self._queue.put((ws_conn, tick))
+
+    def _dispatch(self) -> None:
+        last_tick_time = self._last_tick_time
+
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+
+            ws_conn, tick = item
+
+            # text messages are passed through as is
+            # sequence numbers restart with the connection, the exchange time doesn't
+            if hasattr(tick, 'exchange_epoch_ms'):
+                key = (tick.exchange_type, tick.token)
+                last = last_tick_time.get(key)
+                if last is not None and tick.exchange_epoch_ms < last:
+                    self.dropped_out_of_order += 1
+                    continue
+                last_tick_time[key] = tick.exchange_epoch_ms
+
+            try:
+                self.on_data(ws_conn, tick)
+            except Exception:
+                traceback.print_exc()
+            self.delivered += 1
+
+    # -------------------------------------------------------------------- stats
+
+    def stats(self) -> dict:
+        "Per shard health & throughput (ticks/sec since the previous call)"
+        now = time.monotonic()
+        shards = []
+
+        for idx, stats in enumerate(self._shard_stats):
+            elapsed = now - stats["_rate_time"]
+            rate = (stats["ticks"] - stats["_rate_ticks"]) / elapsed if elapsed > 0 else 0.0
+            stats["_rate_ticks"], stats["_rate_time"] = stats["ticks"], now
+
+            shards.append({
+                "shard": idx,
+                "connected": stats["connected"],
+                "tokens": self._loads[idx],
+                "ticks": stats["ticks"],
+                "ticks_per_sec": rate,
+                "last_tick": stats["last_tick"],
+                "errors": stats["errors"],
+                "last_error": stats["last_error"],
+                "reconnects": stats["reconnects"],
+            })
+
+        return {
+            "shards": shards,
+            "queue_depth": self._queue.qsize(),
+            "delivered": self.delivered,
+            "dropped_out_of_order": self.dropped_out_of_order,
+            "moved": self.moved,
+        }
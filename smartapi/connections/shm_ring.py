@@ -0,0 +1,164 @@
+import time
+import struct
+import platform
+
+from multiprocessing import shared_memory, resource_tracker
+
+# head (written by the producer) & tail (by the consumer) on separate cache lines
+_HEAD = 0
+_FULL_WAITS = 8
+_TAIL = 64
+HEADER_SIZE = 128
+
+_COUNTER = struct.Struct('<q')
+_LENGTH = struct.Struct('<H')
+
+# stores reach the other cores in program order (total store order), the ring has no fences
+TSO_MACHINES = ('x86_64', 'amd64', 'i386', 'i686')
+
+
+def check_store_order() -> None:
+    "Raises `RuntimeError` where a consumer could see a head before the record it publishes"
+    machine = platform.machine()
+    if machine.lower() not in TSO_MACHINES:
+        raise RuntimeError(f"ShmRing needs x86 store ordering, {machine} (e.g. ARM / Apple silicon) may read torn records")
+
+
+class ShmRing:
+    """
+        Single producer / single consumer ring of fixed size slots in shared memory
+
+        Slots hold up to `slot_size - 2` bytes (2 byte length prefix). The producer
+        only writes `head`, the consumer only writes `tail`, both are monotonic
+        counters so `head - tail` is the depth. Payload stores happen before the head
+        store, which keeps records complete on x86 (total store order) only, python has
+        no fences for ARM (Apple silicon), so creating a ring elsewhere raises
+        `RuntimeError` (refer `check_store_order`).
+
+        Create it in the supervisor (`create=True`) and `attach` in the stages by name,
+        the ring outlives a crashed stage.
+    """
+
+    def __init__(self, name: str = None, slots: int = 65_536, slot_size: int = 384, create: bool = False) -> None:
+        self.slots = slots
+        self.slot_size = slot_size
+        self.create = create
+
+        if create:
+            check_store_order()
+
+        self._shm = shared_memory.SharedMemory(name=name, create=create, size=HEADER_SIZE + slots * slot_size)
+        self._buf = self._shm.buf
+        if create:
+            self._buf[:HEADER_SIZE] = bytes(HEADER_SIZE)
+        else:
+            # only the creator frees it, else the first stage to exit would unlink the ring
+            resource_tracker.unregister(self._shm._name, 'shared_memory')
+
+        # producer side cache of the consumer's tail (and the other way round)
+        self._tail_cache = 0
+        self._head_cache = 0
+
+    @classmethod
+    def attach(cls, spec: tuple) -> 'ShmRing':
+        "spec: `ShmRing.spec` of the ring created by the supervisor"
+        name, slots, slot_size = spec
+        return cls(name, slots, slot_size)
+
+    @property
+    def spec(self) -> tuple:
+        "picklable (name, slots, slot_size) for `attach`"
+        return self._shm.name, self.slots, self.slot_size
+
+    @property
+    def head(self) -> int:
+        return _COUNTER.unpack_from(self._buf, _HEAD)[0]
+
+    @property
+    def tail(self) -> int:
+        return _COUNTER.unpack_from(self._buf, _TAIL)[0]
+
+    @property
+    def full_waits(self) -> int:
+        return _COUNTER.unpack_from(self._buf, _FULL_WAITS)[0]
+
+    def __len__(self) -> int:
+        return self.head - self.tail
+
+    def put(self, data: bytes) -> bool:
+        "False when the ring is full"
+        buf = self._buf
+        head = _COUNTER.unpack_from(buf, _HEAD)[0]
+
+        if head - self._tail_cache >= self.slots:
+            self._tail_cache = _COUNTER.unpack_from(buf, _TAIL)[0]
+            if head - self._tail_cache >= self.slots:
+                return False
+
+        offset = HEADER_SIZE + (head % self.slots) * self.slot_size
+        _LENGTH.pack_into(buf, offset, len(data))
+        buf[offset + 2: offset + 2 + len(data)] = data
+        _COUNTER.pack_into(buf, _HEAD, head + 1)
+        return True
+
+    def put_wait(self, data: bytes, stop=None, pause: float = 0.0002) -> bool:
+        """
+            Waits while the ring is full (the consumer is behind)
+
+            returns:
+                False when `stop` (an Event) was set before there was room
+        """
+        if self.put(data):
+            return True
+
+        _COUNTER.pack_into(self._buf, _FULL_WAITS, self.full_waits + 1)
+        while not self.put(data):
+            if stop is not None and stop.is_set():
+                return False
+            time.sleep(pause)
+        return True
+
+    def peek_many(self, max_items: int = 1024) -> list[bytes]:
+        "Up to `max_items` records without consuming them, refer `advance`"
+        buf = self._buf
+        tail = _COUNTER.unpack_from(buf, _TAIL)[0]
+
+        if self._head_cache - tail <= 0:
+            self._head_cache = _COUNTER.unpack_from(buf, _HEAD)[0]
+
+        count = min(self._head_cache - tail, max_items)
+        items = []
+        for seq in range(tail, tail + count):
+            offset = HEADER_SIZE + (seq % self.slots) * self.slot_size
+            length = _LENGTH.unpack_from(buf, offset)[0]
+            items.append(bytes(buf[offset + 2: offset + 2 + length]))
+        return items
+
+    def advance(self, count: int) -> None:
+        "Frees `count` records returned by `peek_many`"
+        _COUNTER.pack_into(self._buf, _TAIL, self.tail + count)
+
+    def get_many(self, max_items: int = 1024) -> list[bytes]:
+        items = self.peek_many(max_items)
+        if items:
+            self.advance(len(items))
+        return items
+
+    def close(self) -> None:
+        self._buf = None
+        self._shm.close()
+
+    def unlink(self) -> None:
+        "Supervisor only, frees the shared memory"
+        # spawned stages share the supervisor's resource tracker, their `attach` dropped the name
+        resource_tracker.register(self._shm._name, 'shared_memory')
+        self._shm.unlink()
+
+    def stats(self) -> dict:
+        head, tail = self.head, self.tail
+        return {
+            "produced": head,
+            "consumed": tail,
+            "depth": head - tail,
+            "full_waits": self.full_waits,
+        }
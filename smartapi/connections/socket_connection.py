@@ -1,6 +1,7 @@
 import json
 
 import ssl
+import time
 import socket
 import websocket
 
@@ -11,6 +12,14 @@ import threading
 from collections import defaultdict
 
 import smartapi.utils as utils
+from smartapi.connections import tick_decoder, batch_decoder
+from smartapi.connections.token_table import TokenTable
+from smartapi.connections.subscriptions import SubscriptionRegistry
+from smartapi.connections.frame_capture import FrameRecorder, replay_frames
+from smartapi.connections.conflation import TickConflator
+from smartapi.connections.pipeline import FramePipeline, BackpressurePolicy
+from smartapi.connections.gap_tracker import GapTracker, BackfillWorker
+from smartapi.connections.telemetry import FeedTelemetry
 from smartapi.connections.api_types import SubscribeAction, SubscriptionMode, ExchangeType
 
 class SocketConnection:
@@ -51,9 +60,6 @@ class SocketConnection:
 
     CONNECTION_ACTIVE = False
 
-    # dict[mode : {exchange : [tokens]}]
-    # input_request_dict = defaultdict(lambda : {})
-    mode_exchange_tokens_map: dict[SubscriptionMode: dict[ExchangeType: list[str]]] = defaultdict(lambda : {})
     current_retry_attempt = 0
 
     def __init__(self, client_code:str, jwt_token: str, feed_token: str, api_key: str) -> None:
@@ -67,6 +73,28 @@ class SocketConnection:
 
         self._ws_conn = None
 
+        # (mode, exchange) -> set of tokens, per connection
+        self.subscriptions = SubscriptionRegistry()
+
+        # interned tokens of everything subscribed, shared by all the parsed ticks
+        self.token_table = TokenTable()
+
+        # raw frame capture, refer `start_capture`
+        self._recorder: FrameRecorder = None
+
+        # latest tick per token for slow handlers, refer `enable_conflation`
+        self._conflator: TickConflator = None
+
+        # parse & on_data off the receive thread, refer `enable_pipeline`
+        self._pipeline: FramePipeline = None
+
+        # per token sequence / time state & candle backfill, refer `enable_backfill`
+        self._gaps: GapTracker = None
+        self._backfill: BackfillWorker = None
+
+        # latency histograms & tick rates, refer `enable_telemetry`
+        self.telemetry: FeedTelemetry = None
+
         self._last_ping_timestamp = None
         self._last_pong_timestamp = None
         self.MAX_RETRY_ATTEMPT = 2
@@ -77,6 +105,8 @@ class SocketConnection:
         self.on_message = None
         self.on_data = None
         self.on_error = None
+        # (optional) gets the raw binary frames instead of `on_data`, e.g. a receiver process
+        self.on_frame = None
 
     def send(self, data: dict) -> bool:
         "Send dict to binary - JSON data"
@@ -125,6 +155,10 @@ class SocketConnection:
         "Closes connection"
         self.RESUBSCRIBE_FLAG = False
 
+        # ticks after the next connect are checked for the outage window
+        if self._gaps is not None:
+            self._gaps.new_session()
+
         # TODO add logs
         if self._ws_conn and self.CONNECTION_ACTIVE:
             self._ws_conn.close()
@@ -134,6 +168,130 @@ class SocketConnection:
         "Sends the given in json string to server"
         self._ws_conn.send(json.dumps(data))
 
+    def start_capture(self, directory) -> FrameRecorder:
+        "Appends every raw binary frame with its receive time to daily files in `directory`"
+        self.stop_capture()
+        self._recorder = FrameRecorder(directory)
+        return self._recorder
+
+    def stop_capture(self):
+        if self._recorder is not None:
+            self._recorder.close()
+            self._recorder = None
+
+    def enable_conflation(self, interval: float = None) -> TickConflator:
+        """
+            Deliver only the latest tick per token to `on_data`, from a separate thread
+
+            Args:
+                interval:   (optional) delivery cadence in seconds, without it ticks are
+                            delivered whenever the handler is free
+
+            returns:
+                the conflator, refer `TickConflator.stats` for the counters
+        """
+        self.disable_conflation()
+        self._conflator = TickConflator(lambda ws_conn, tick: self.on_data(ws_conn, tick), interval=interval)
+        self._conflator.start()
+        return self._conflator
+
+    def disable_conflation(self, drain: bool = True):
+        if self._conflator is not None:
+            self._conflator.stop(drain=drain)
+            self._conflator = None
+
+    def enable_pipeline(self, workers: int = 4, capacity: int = 10_000,
+                        policy: BackpressurePolicy = BackpressurePolicy.BLOCK) -> FramePipeline:
+        """
+            Receive thread only enqueues raw frames, a pool of worker threads parses them
+            & calls `on_data` (same token -> same worker, so per token order is kept)
+
+            Args:
+                workers:    number of worker threads
+                capacity:   ring buffer size per worker
+                policy:     block | drop_oldest | conflate when a buffer is full
+
+            returns:
+                the pipeline, refer `FramePipeline.stats` for queue depth & handler latency
+        """
+        self.disable_pipeline()
+        self._pipeline = FramePipeline(
+            self._parse_timed, self.__dispatch_tick,
+            workers=workers, capacity=capacity, policy=policy
+        )
+        self._pipeline.start()
+        return self._pipeline
+
+    def disable_pipeline(self, drain: bool = True):
+        if self._pipeline is not None:
+            self._pipeline.stop(drain=drain)
+            self._pipeline = None
+
+    def enable_backfill(self, api, sink=None, max_silence: timedelta = None,
+                        min_gap: timedelta = timedelta(minutes=1)) -> GapTracker:
+        """
+            Drops duplicate / out of order ticks and backfills what was missed (reconnect
+            windows, tokens quiet for longer than `max_silence`) from the candle api
+
+            Args:
+                api:            logged in `SmartAPIConnect`
+                sink:           (optional) called as `sink(row)` for backfilled rows, defaults
+                                to `on_data(None, row)`, rows have `backfilled = True`
+                max_silence:    (optional) refer `GapTracker`
+                min_gap:        shorter gaps aren't backfilled
+
+            returns:
+                the tracker, `stats()` of it & of `self._backfill` count drops and jobs
+        """
+        self.disable_backfill()
+
+        self._backfill = BackfillWorker(api, sink or (lambda row: self.on_data(None, row)), min_gap=min_gap)
+        self._gaps = GapTracker(on_gap=self._backfill.submit, max_silence=max_silence)
+        self._backfill.start()
+        return self._gaps
+
+    def disable_backfill(self, drain: bool = True):
+        self._gaps = None
+        if self._backfill is not None:
+            self._backfill.stop(drain=drain)
+            self._backfill = None
+
+    def enable_telemetry(self, name: str = 'default') -> FeedTelemetry:
+        """
+            Tracks exchange -> receive latency, parse & handler time, ping round trips and
+            ticks/sec per token / exchange, read with `telemetry.stats()` or
+            `telemetry.prometheus()`
+
+            With `enable_pipeline` the latency is taken when a worker parses the frame,
+            so it includes the time spent in the ring buffer.
+        """
+        self.telemetry = FeedTelemetry(name)
+        return self.telemetry
+
+    def disable_telemetry(self):
+        self.telemetry = None
+
+    def replay(self, path, paced: bool = False, speed: float = 1.0) -> int:
+        """
+            Feeds a capture (file or directory) through the same parse -> `on_data` path
+            as the live socket, as fast as possible or paced to the original timing,
+            a running capture doesn't record the replayed frames
+
+            Args:
+                path:   capture file or directory, refer `start_capture`
+                paced:  keep the original gaps between frames
+                speed:  pacing multiplier
+
+            returns:
+                number of frames replayed
+        """
+        return replay_frames(
+            path,
+            lambda frame: self.__process_data(self._ws_conn, frame, 2),
+            paced=paced,
+            speed=speed
+        )
+
     def subscribe(self, correlation_id: str, mode: SubscriptionMode, exchange_token_map: dict[ExchangeType: list[str]]):
         """
             Subscribe for given tokens from the server
@@ -152,124 +310,74 @@ class SocketConnection:
                         { "exchangeType": 1, "tokens": ["10626", "5290"]},
                         {"exchangeType": 5, "tokens": [ "234230", "234235", "234219"]}
                     ]
-        """
-        request_data = {
-            "correlationID": correlation_id,
-            "action": SubscribeAction.SUBSCRIBE.value,
-            "params": {
-                "mode": mode.value,
-                "tokenList": [
-                    {"exchangeType": exchange.value, "tokens": tokens} for exchange, tokens in exchange_token_map.items()
-                ]
-            }
-        }
-
-        # dict[mode : {exchange : [tokens]}]
-        # self.mode_exchange_tokens_map
 
-        # having an account of all the items in subscriptions
+            Only tokens which are not subscribed yet are sent, in chunks of at most
+            `subscriptions.max_tokens_per_request` tokens.
+        """
         for exchange_type, tokens in exchange_token_map.items():
-            if exchange_type in self.mode_exchange_tokens_map[mode]:
-                self.mode_exchange_tokens_map[mode][exchange_type].extend(tokens)
-            else:
-                self.mode_exchange_tokens_map[mode][exchange_type] = tokens
+            self.token_table.update(tokens, exchange_type=exchange_type)
+
+        added = self.subscriptions.add(mode, exchange_token_map)
+        for request_data in self.subscriptions.requests(SubscribeAction.SUBSCRIBE, mode, added, correlation_id):
+            self.send(request_data)
 
-        self.send(request_data)
         self.RESUBSCRIBE_FLAG = True
 
     def resubscribe(self):
-        "Re-subscribe to all tokens in each mode"
-
-        # for key, val in self.mode_exchange_tokens_map.items():
-        for mode, exchange_tokens_map in self.mode_exchange_tokens_map.items():
-            token_list = []
-            for exchange_type, tokens in exchange_tokens_map.items():
-                if len(tokens) == 0: continue
-                temp_data = {
-                    'exchangeType': exchange_type.value,
-                    'tokens': tokens
-                }
-                token_list.append(temp_data)
+        "Re-subscribe to all tokens in each mode, in as few requests as possible"
+        for request_data in self.subscriptions.resubscribe_requests():
+            self.send(request_data)
 
-            if len(token_list) == 0:
-                return
+    def unsubscribe(self, correlation_id: str, mode: SubscriptionMode, exchange_token_map: dict[ExchangeType: list[str]]):
+        """
+            Unsubscribe the given tokens, only the ones which are subscribed are sent
 
-            request_data = {
-                "action": SubscribeAction.SUBSCRIBE.value,
-                "params": {
-                    "mode": mode.value,
-                    "tokenList": token_list
-                }
+            Args:
+                correlation_id:         refer `subscribe`
+                mode:                   Specifies LTP | Quote | Snap
+                exchange_token_map:     dicts of exchange type and tokens (also takes the
+                                        `[{"exchangeType": 1, "tokens": [...]}]` format)
+        """
+        if isinstance(exchange_token_map, list):
+            exchange_token_map = {
+                ExchangeType(entry['exchangeType']): entry['tokens'] for entry in exchange_token_map
             }
+
+        removed = self.subscriptions.remove(mode, exchange_token_map)
+        for request_data in self.subscriptions.requests(SubscribeAction.UNSUBSCRIBE, mode, removed, correlation_id):
             self.send(request_data)
 
-    def unsubscribe(self, correlation_id: str, mode: SubscriptionMode, token_list: dict):
-        request_data = {
-            "correlationID": correlation_id,
-            "action": SubscribeAction.UNSUBSCRIBE.value,
-            "params": {
-                "mode": mode.value,
-                "tokenList": token_list
-            }
-        }
+        self.RESUBSCRIBE_FLAG = True
 
-        self._ws_conn.send(json.dumps(request_data))
+    def sync_subscriptions(self, correlation_id: str, mode: SubscriptionMode, exchange_token_map: dict[ExchangeType: list[str]]):
+        """
+            Makes `mode` subscribed to exactly `exchange_token_map`, only the difference
+            to the current set is sent (e.g. when the option strikes move)
+        """
+        to_add, to_remove = self.subscriptions.diff(mode, exchange_token_map)
 
-        for _ in token_list.items():
-            exchange_type, tokens = _['exchangeType'], _['tokens']
-            
-            # remove the tokens
-            for token in tokens:
-                self.mode_exchange_tokens_map[mode][exchange_type].remove(token)
+        if to_remove:
+            self.unsubscribe(correlation_id, mode, to_remove)
+        if to_add:
+            self.subscribe(correlation_id, mode, to_add)
 
-        self.RESUBSCRIBE_FLAG = True
+    @property
+    def mode_exchange_tokens_map(self) -> dict[SubscriptionMode: dict[ExchangeType: list[str]]]:
+        "dict[mode : {exchange : [tokens]}] of everything subscribed"
+        return {
+            mode: {exchange: sorted(tokens) for exchange, tokens in self.subscriptions.exchange_tokens_map(mode).items()}
+            for mode in self.subscriptions.modes()
+        }
 
-    def _parse_token_value(self, binary_str: str) -> str:
+    def _parse_token_value(self, binary_str: bytes) -> str:
         "Parse till \x00 for token information"
-        token = ""
-        for char in map(chr, binary_str):
-            if char == '\x00':
-                return token
-
-            token += char
-
-        return token
+        return self.token_table.token(binary_str)
 
     def _parse_best_5_buy_and_sell_data(self, binary_data):
+        "Unpacks the 200 byte best-5 block"
+        return tick_decoder.decode_depth(binary_data, offset=0)
 
-        def split_packets(binary_packets):
-            packets = []
-
-            i = 0
-            while i < len(binary_packets):
-                packets.append(binary_packets[i: i+20])
-                i += 20
-            return packets
-
-        best_5_buy_sell_packets = split_packets(binary_data)
-
-        best_5_buy_data = []
-        best_5_sell_data = []
-
-        for packet in best_5_buy_sell_packets:
-            each_data = {
-                "flag": utils.unpack_binary_str(packet, 0, 2, byte_format="H")[0],
-                "quantity": utils.unpack_binary_str(packet, 2, 10, byte_format="q")[0],
-                "price": utils.unpack_binary_str(packet, 10, 18, byte_format="q")[0] / 100,
-                "no of orders": utils.unpack_binary_str(packet, 18, 20, byte_format="H")[0]
-            }
-
-            if each_data["flag"] == 0:
-                best_5_buy_data.append(each_data)
-            else:
-                best_5_sell_data.append(each_data)
-
-        return {
-            "best_5_buy_data": best_5_buy_data,
-            "best_5_sell_data": best_5_sell_data
-        }
-
-    def _parse_binary_data(self, binary_data: str):
+    def _parse_binary_data(self, binary_data: bytes):
         """
             Unpacks binary data to a specified dict format
             refer: https://smartapi.angelbroking.com/docs/WebSocket2
@@ -278,49 +386,32 @@ class SocketConnection:
                 binary_data:    Binary response from server
 
             returns:
-                dict of all specified data
+                `LtpTick` | `QuoteTick` | `SnapQuoteTick` (supports dict style access)
         """
+        # TODO add way to show token and also the symbol name in the parsed data
+        return tick_decoder.decode_frame(binary_data, tokens=self.token_table)
 
-        parsed_data = {
-           "subscription_mode" : utils.unpack_binary_str(binary_data, 0, 1, byte_format="B")[0],
-           "exchange_type": utils.unpack_binary_str(binary_data, 1, 2, byte_format="B")[0],
-           "token": self._parse_token_value(binary_data[2:27]),
-           "sequence_number": utils.unpack_binary_str(binary_data, 27, 35, byte_format="q")[0],
-           "exchange_timestamp": utils.unpack_binary_str(binary_data, 35, 43, byte_format="q")[0],
-           "last_traded_price": utils.unpack_binary_str(binary_data, 43, 51, byte_format="q")[0] / 100,
-        }
+    def _parse_timed(self, binary_data):
+        "`_parse_binary_data`, recording latency & parse time when telemetry is on"
+        telemetry = self.telemetry
+        if telemetry is None:
+            return self._parse_binary_data(binary_data)
 
-        # TODO add way to show token and also the symbol name in the parsed data
-        exchange_time = datetime.fromtimestamp(parsed_data['exchange_timestamp']/1000)
-        parsed_data['exchange_timestamp'] = exchange_time
-        parsed_data['exchange_timestring'] = datetime.strftime(exchange_time,"%Y-%b-%d %H:%M:%S")
-
-        if parsed_data["subscription_mode"] in [SubscriptionMode.QUOTE, SubscriptionMode.SNAP_QUOTE]:
-            parsed_data["last_traded_quantity"] = utils.unpack_binary_str(binary_data, 51, 59, byte_format="q")[0]
-            parsed_data["average_traded_price"] = utils.unpack_binary_str(binary_data, 59, 67, byte_format="q")[0]/ 100
-            parsed_data["volume_trade_for_the_day"] = utils.unpack_binary_str(binary_data, 67, 75, byte_format="q")[0]
-            parsed_data["total_buy_quantity"] = utils.unpack_binary_str(binary_data, 75, 83, byte_format="d")[0]
-            parsed_data["total_sell_quantity"] = utils.unpack_binary_str(binary_data, 83, 91, byte_format="d")[0]
-            parsed_data["open_price_of_the_day"] = utils.unpack_binary_str(binary_data, 91, 99, byte_format="q")[0] / 100
-            parsed_data["high_price_of_the_day"] = utils.unpack_binary_str(binary_data, 99, 107, byte_format="q")[0] / 100
-            parsed_data["low_price_of_the_day"] = utils.unpack_binary_str(binary_data, 107, 115, byte_format="q")[0] / 100
-            parsed_data["closed_price"] = utils.unpack_binary_str(binary_data, 115, 123, byte_format="q")[0] / 100
-
-        if parsed_data["subscription_mode"] == SubscriptionMode.SNAP_QUOTE:
-            parsed_data["last_traded_timestamp"] = utils.unpack_binary_str(binary_data, 123, 131, byte_format="q")[0]
-            parsed_data["open_interest"] = utils.unpack_binary_str(binary_data, 131, 139, byte_format="q")[0]
-            parsed_data["open_interest_change_percentage"] = utils.unpack_binary_str(binary_data, 139, 147, byte_format="q")[0]
-            parsed_data["upper_circuit_limit"] = utils.unpack_binary_str(binary_data, 347, 355, byte_format="q")[0]
-            parsed_data["lower_circuit_limit"] = utils.unpack_binary_str(binary_data, 355, 363, byte_format="q")[0]
-            parsed_data["52_week_high_price"] = utils.unpack_binary_str(binary_data, 363, 371, byte_format="q")[0]
-            parsed_data["52_week_low_price"] = utils.unpack_binary_str(binary_data, 371, 379, byte_format="q")[0]
-
-            # TODO implement the best 5 buy and sell for the API - UI thing
-            best_5_buy_and_sell_data = self._parse_best_5_buy_and_sell_data(binary_data[147:347])
-            parsed_data["best_5_buy_data"] = best_5_buy_and_sell_data["best_5_buy_data"]
-            parsed_data["best_5_sell_data"] = best_5_buy_and_sell_data["best_5_sell_data"]
-
-        return parsed_data
+        recv_ns = time.time_ns()
+        start = time.perf_counter_ns()
+        tick = self._parse_binary_data(binary_data)
+        parse_ns = time.perf_counter_ns() - start
+
+        if not isinstance(tick, bytes):
+            telemetry.record_tick(tick, recv_ns, parse_ns)
+        return tick
+
+    def parse_frames(self, frames: list[bytes]):
+        """
+            Decodes a batch of binary frames into columnar record arrays, one per mode
+            refer: `batch_decoder.decode_frames`
+        """
+        return batch_decoder.decode_frames(frames)
 
 
     def __handle_error(self, ws_conn, error: str):
@@ -344,15 +435,49 @@ class SocketConnection:
         self.close_connection()
 
     def __handle_data(self, ws_conn, data, data_type, continue_flag: bool):
+        if data_type == 2 and self._recorder is not None:
+            self._recorder.write(data)
+
+        self.__process_data(ws_conn, data, data_type)
+
+    def __process_data(self, ws_conn, data, data_type):
+        "Everything after the capture, `replay` starts here so a running capture doesn't get the frames again"
+        if data_type == 2 and self.on_frame is not None:
+            self.on_frame(data)
+            return
+
+        if data_type == 2 and self._pipeline is not None:
+            self._pipeline.submit(ws_conn, data)
+            return
+
         if data_type == 2:
-            msg = self._parse_binary_data(data)
+            msg = self._parse_timed(data)
         else:
             msg = data
 
         if msg == b'\x00':
             return
 
-        self.on_data(ws_conn, msg)
+        if data_type == 2:
+            self.__dispatch_tick(ws_conn, msg)
+        else:
+            self.on_data(ws_conn, msg)
+
+    def __dispatch_tick(self, ws_conn, tick):
+        telemetry = self.telemetry
+        if telemetry is not None:
+            start = time.perf_counter_ns()
+
+        if self._gaps is not None and not self._gaps.accept(tick):
+            return
+
+        if self._conflator is not None:
+            self._conflator.push(ws_conn, tick)
+        else:
+            self.on_data(ws_conn, tick)
+
+        if telemetry is not None:
+            telemetry.record_handler(time.perf_counter_ns() - start)
 
     def __handle_message(self, ws_conn, message: str):
         if message != self.HEART_BEAT_RESPONSE:
@@ -362,15 +487,17 @@ class SocketConnection:
             self.on_message(ws_conn, message)
 
     def __handle_ping(self, ws_conn, data):
-        now = datetime.now()
-        print(f"Ping function: [Data] {data}, [Timestamp] {now.strftime('%d-%m-%y %H:%M:%S')}")
-        self._last_ping_timestamp = now
+        self._last_ping_timestamp = datetime.now()
+        if self.telemetry is not None:
+            self.telemetry.server_pings += 1
 
     def __handle_pong(self, ws_conn, data):
+        # round trip of our heartbeat ping, timed by websocket-client
+        if self.telemetry is not None and ws_conn.last_ping_tm and ws_conn.last_pong_tm > ws_conn.last_ping_tm:
+            self.telemetry.record_ping_rtt(int((ws_conn.last_pong_tm - ws_conn.last_ping_tm) * 1e9))
+
         if data == b'\x00':
-            now = datetime.now()
-            print(f"Pong function:, [Timestamp] {now.strftime('%d-%m-%y %H:%M:%S')}")
-            self._last_pong_timestamp = now
+            self._last_pong_timestamp = datetime.now()
 
         else:
             # if not a pong - send to handle data
@@ -0,0 +1,142 @@
+from collections import defaultdict
+
+from smartapi.connections.api_types import SubscribeAction, SubscriptionMode, ExchangeType
+
+# smart-stream caps the tokens of a single subscribe / unsubscribe request
+MAX_TOKENS_PER_REQUEST = 1000
+
+
+class SubscriptionRegistry:
+    """
+        Set backed subscription state of one socket, keyed by (mode, exchange)
+
+        `add` / `remove` return only what actually changed, so callers can send
+        diffs to the server. `requests` / `resubscribe_requests` build the request
+        payloads, packed into as few frames as the per request token cap allows.
+    """
+
+    def __init__(self, max_tokens_per_request: int = MAX_TOKENS_PER_REQUEST) -> None:
+        self.max_tokens_per_request = max_tokens_per_request
+        self._tokens: dict[tuple[SubscriptionMode, ExchangeType], set[str]] = defaultdict(set)
+
+    def add(self, mode: SubscriptionMode, exchange_token_map: dict[ExchangeType: list[str]]) -> dict[ExchangeType, list[str]]:
+        "Registers tokens, returns the ones which were not subscribed yet"
+        added = {}
+        for exchange_type, tokens in exchange_token_map.items():
+            current = self._tokens[(mode, exchange_type)]
+            new_tokens = set(tokens) - current
+            new_tokens.discard('')
+
+            if new_tokens:
+                current |= new_tokens
+                added[exchange_type] = sorted(new_tokens)
+        return added
+
+    def remove(self, mode: SubscriptionMode, exchange_token_map: dict[ExchangeType: list[str]]) -> dict[ExchangeType, list[str]]:
+        "Drops tokens, returns the ones which were actually subscribed"
+        removed = {}
+        for exchange_type, tokens in exchange_token_map.items():
+            key = (mode, exchange_type)
+            current = self._tokens.get(key)
+            if not current:
+                continue
+
+            gone = current & set(tokens)
+            if gone:
+                current -= gone
+                removed[exchange_type] = sorted(gone)
+
+            if not current:
+                del self._tokens[key]
+        return removed
+
+    def diff(self, mode: SubscriptionMode, exchange_token_map: dict[ExchangeType: list[str]]) -> tuple[dict, dict]:
+        """
+            What has to change for `mode` to be subscribed to exactly `exchange_token_map`
+
+            returns:
+                (to subscribe, to unsubscribe) as exchange -> tokens maps
+        """
+        to_add, to_remove = {}, {}
+
+        exchanges = set(exchange_token_map) | {exchange for m, exchange in self._tokens if m == mode}
+        for exchange_type in exchanges:
+            target = set(exchange_token_map.get(exchange_type, ()))
+            current = self._tokens.get((mode, exchange_type), set())
+
+            if target - current:
+                to_add[exchange_type] = sorted(target - current)
+            if current - target:
+                to_remove[exchange_type] = sorted(current - target)
+
+        return to_add, to_remove
+
+    def tokens(self, mode: SubscriptionMode, exchange_type: ExchangeType) -> set[str]:
+        return set(self._tokens.get((mode, exchange_type), ()))
+
+    def exchange_tokens_map(self, mode: SubscriptionMode) -> dict[ExchangeType, set[str]]:
+        return {exchange: set(tokens) for (m, exchange), tokens in self._tokens.items() if m == mode and tokens}
+
+    def modes(self) -> list[SubscriptionMode]:
+        return sorted({mode for (mode, _), tokens in self._tokens.items() if tokens})
+
+    def all_tokens(self) -> set[tuple[ExchangeType, str]]:
+        return {(exchange, token) for (_, exchange), tokens in self._tokens.items() for token in tokens}
+
+    def __contains__(self, key: tuple[SubscriptionMode, ExchangeType, str]) -> bool:
+        mode, exchange_type, token = key
+        return token in self._tokens.get((mode, exchange_type), ())
+
+    def __len__(self) -> int:
+        return sum(len(tokens) for tokens in self._tokens.values())
+
+    def clear(self) -> None:
+        self._tokens.clear()
+
+    def requests(self, action: SubscribeAction, mode: SubscriptionMode,
+                 exchange_token_map: dict[ExchangeType: list[str]], correlation_id: str = None) -> list[dict]:
+        """
+            Request payloads for `exchange_token_map`, each with at most
+            `max_tokens_per_request` tokens (exchanges share a request when they fit)
+        """
+        requests = []
+        token_list = []
+        count = 0
+
+        for exchange_type, tokens in exchange_token_map.items():
+            tokens = list(tokens)
+            start = 0
+            while start < len(tokens):
+                if count == self.max_tokens_per_request:
+                    requests.append(token_list)
+                    token_list, count = [], 0
+
+                chunk = tokens[start: start + self.max_tokens_per_request - count]
+                token_list.append({"exchangeType": int(exchange_type), "tokens": chunk})
+                count += len(chunk)
+                start += len(chunk)
+
+        if token_list:
+            requests.append(token_list)
+
+        payloads = []
+        for token_list in requests:
+            request_data = {
+                "action": action.value,
+                "params": {
+                    "mode": mode.value,
+                    "tokenList": token_list
+                }
+            }
+            if correlation_id is not None:
+                request_data["correlationID"] = correlation_id
+            payloads.append(request_data)
+
+        return payloads
+
+    def resubscribe_requests(self) -> list[dict]:
+        "Subscribe payloads for everything registered, fewest frames per mode"
+        payloads = []
+        for mode in self.modes():
+            payloads.extend(self.requests(SubscribeAction.SUBSCRIBE, mode, self.exchange_tokens_map(mode)))
+        return payloads
@@ -0,0 +1,167 @@
+import time
+
+from collections import defaultdict
+
+from smartapi.utils.histogram import LatencyHistogram
+from smartapi.connections.api_types import ExchangeType
+
+# ns -> seconds for the prometheus export
+_NS = 1e9
+EXPORT_QUANTILES = (50, 90, 99, 99.9)
+
+
+class FeedTelemetry:
+    """
+        Latency histograms & tick rates of one feed connection
+
+            latency:    receive time - exchange time of the tick, broker + network lag
+            parse:      binary frame -> tick
+            handler:    `on_data` (incl. conflation / backfill bookkeeping)
+            ping_rtt:   websocket ping -> pong round trip
+
+        Histograms are fixed memory (refer `LatencyHistogram`), tick counts are kept
+        per token, per exchange & for the connection. Counters are updated without a
+        lock, with `enable_pipeline` workers they can be off by a few ticks.
+    """
+
+    def __init__(self, name: str = 'default') -> None:
+        """
+            Args:
+                name:   `connection` label of the prometheus export
+        """
+        self.name = name
+
+        # exchange time only has ms resolution, so does the latency
+        self.latency = LatencyHistogram()
+        self.parse = LatencyHistogram(max_value=10 ** 9)
+        self.handler = LatencyHistogram()
+        self.ping_rtt = LatencyHistogram()
+
+        self.ticks = 0
+        self.token_ticks = defaultdict(int)
+        self.exchange_ticks = defaultdict(int)
+        # exchange time ahead of our clock
+        self.negative_latency = 0
+        self.server_pings = 0
+
+        self._started = time.monotonic()
+        self._rate_time = self._started
+        self._rate_ticks = 0
+        self._rate_token_ticks = {}
+        self._rate_exchange_ticks = {}
+
+    def record_tick(self, tick, recv_ns: int, parse_ns: int) -> None:
+        "recv_ns: `time.time_ns()` at receive, parse_ns: time taken to decode"
+        latency = recv_ns - tick.exchange_epoch_ms * 1_000_000
+        if latency < 0:
+            self.negative_latency += 1
+
+        self.latency.record(latency)
+        self.parse.record(parse_ns)
+
+        self.ticks += 1
+        self.token_ticks[(tick.exchange_type, tick.token)] += 1
+        self.exchange_ticks[tick.exchange_type] += 1
+
+    def record_handler(self, elapsed_ns: int) -> None:
+        self.handler.record(elapsed_ns)
+
+    def record_ping_rtt(self, rtt_ns: int) -> None:
+        self.ping_rtt.record(rtt_ns)
+
+    def _rates(self, counts: dict, previous: dict, elapsed: float) -> dict:
+        return {key: (count - previous.get(key, 0)) / elapsed for key, count in counts.items()}
+
+    def stats(self, top_tokens: int = 20) -> dict:
+        """
+            Histogram summaries (ms) & ticks/sec since the previous call
+
+            Args:
+                top_tokens:     only the busiest tokens are listed, None for all of them
+        """
+        now = time.monotonic()
+        elapsed = max(now - self._rate_time, 1e-9)
+
+        token_ticks = dict(self.token_ticks)
+        exchange_ticks = dict(self.exchange_ticks)
+
+        token_rates = self._rates(token_ticks, self._rate_token_ticks, elapsed)
+        exchange_rates = self._rates(exchange_ticks, self._rate_exchange_ticks, elapsed)
+        rate = (self.ticks - self._rate_ticks) / elapsed
+
+        self._rate_time = now
+        self._rate_ticks = self.ticks
+        self._rate_token_ticks = token_ticks
+        self._rate_exchange_ticks = exchange_ticks
+
+        busiest = sorted(token_rates.items(), key=lambda item: item[1], reverse=True)
+        if top_tokens is not None:
+            busiest = busiest[:top_tokens]
+
+        return {
+            "connection": self.name,
+            "uptime_s": now - self._started,
+            "ticks": self.ticks,
+            "ticks_per_sec": rate,
+            "exchange_ticks_per_sec": {ExchangeType(exchange).name: value for exchange, value in exchange_rates.items()},
+            "token_ticks_per_sec": {f"{ExchangeType(exchange).name}:{token}": value for (exchange, token), value in busiest},
+            "latency_ms": self.latency.summary(scale=1e6),
+            "parse_ms": self.parse.summary(scale=1e6),
+            "handler_ms": self.handler.summary(scale=1e6),
+            "ping_rtt_ms": self.ping_rtt.summary(scale=1e6),
+            "negative_latency": self.negative_latency,
+            "server_pings": self.server_pings,
+        }
+
+    def prometheus(self, prefix: str = 'smartapi_feed', per_token: bool = False) -> str:
+        """
+            Prometheus text exposition, histograms as summaries in seconds
+
+            Args:
+                per_token:  also export a tick counter per token (high cardinality)
+        """
+        label = f'connection="{self.name}"'
+        lines = []
+
+        for name, hist, help_text in (
+            ('latency_seconds', self.latency, "Receive time minus exchange time of a tick"),
+            ('parse_seconds', self.parse, "Time to decode a binary frame"),
+            ('handler_seconds', self.handler, "Time spent in on_data"),
+            ('ping_rtt_seconds', self.ping_rtt, "Websocket ping round trip"),
+        ):
+            metric = f"{prefix}_{name}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} summary")
+            for pct, value in hist.percentiles(EXPORT_QUANTILES).items():
+                lines.append(f'{metric}{{{label},quantile="{pct / 100:g}"}} {value / _NS:.9f}')
+            lines.append(f"{metric}_sum{{{label}}} {hist.total / _NS:.9f}")
+            lines.append(f"{metric}_count{{{label}}} {hist.count}")
+
+        metric = f"{prefix}_ticks_total"
+        lines.append(f"# HELP {metric} Ticks received")
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric}{{{label}}} {self.ticks}")
+
+        metric = f"{prefix}_exchange_ticks_total"
+        lines.append(f"# HELP {metric} Ticks received per exchange")
+        lines.append(f"# TYPE {metric} counter")
+        for exchange, count in sorted(self.exchange_ticks.items()):
+            lines.append(f'{metric}{{{label},exchange="{ExchangeType(exchange).name}"}} {count}')
+
+        if per_token:
+            metric = f"{prefix}_token_ticks_total"
+            lines.append(f"# HELP {metric} Ticks received per token")
+            lines.append(f"# TYPE {metric} counter")
+            for (exchange, token), count in sorted(self.token_ticks.items()):
+                lines.append(f'{metric}{{{label},exchange="{ExchangeType(exchange).name}",token="{token}"}} {count}')
+
+        for name, value, help_text in (
+            ('negative_latency_total', self.negative_latency, "Ticks with an exchange time ahead of the local clock"),
+            ('server_pings_total', self.server_pings, "Pings received from the server"),
+        ):
+            metric = f"{prefix}_{name}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{{{label}}} {value}")
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,115 @@
+import struct
+
+from smartapi.connections.api_types import SubscriptionMode, LtpTick, QuoteTick, SnapQuoteTick
+from smartapi.connections.market_depth import MarketDepth
+from smartapi.connections.token_table import TokenTable
+
+# refer: https://smartapi.angelbroking.com/docs/WebSocket2
+# All the packets are little endian, fields are laid out back to back (no padding)
+
+# mode, exchange, token, sequence_number, exchange_timestamp, ltp
+LTP_LAYOUT = "<BB25sqqq"
+
+# + ltq, atp, volume, total buy qty, total sell qty, open, high, low, close
+QUOTE_LAYOUT = LTP_LAYOUT + "qqqddqqqq"
+
+# + ltt, oi, oi change %, best 5 depth block, upper circuit, lower circuit, 52w high, 52w low
+# (the depth block is skipped, `MarketDepth` reads it lazily)
+SNAP_QUOTE_LAYOUT = QUOTE_LAYOUT + "qqq200xqqqq"
+
+# 10 packets of (flag, quantity, price, no of orders)
+DEPTH_PACKET_LAYOUT = "HqqH"
+DEPTH_LAYOUT = "<" + DEPTH_PACKET_LAYOUT * 10
+
+LTP_STRUCT = struct.Struct(LTP_LAYOUT)
+QUOTE_STRUCT = struct.Struct(QUOTE_LAYOUT)
+SNAP_QUOTE_STRUCT = struct.Struct(SNAP_QUOTE_LAYOUT)
+DEPTH_STRUCT = struct.Struct(DEPTH_LAYOUT)
+
+MODE_STRUCTS = {
+    SubscriptionMode.LTP_MODE: LTP_STRUCT,
+    SubscriptionMode.QUOTE: QUOTE_STRUCT,
+    SubscriptionMode.SNAP_QUOTE: SNAP_QUOTE_STRUCT,
+}
+
+DEPTH_OFFSET = 147
+DEPTH_SIZE = DEPTH_STRUCT.size
+
+
+def decode_token(token_field: bytes) -> str:
+    "Token is a null terminated string inside a 25 byte field"
+    return token_field.partition(b'\x00')[0].decode('latin-1')
+
+
+def decode_depth(binary_data, offset: int = DEPTH_OFFSET) -> dict:
+    """
+        Unpacks the 200 byte best-5 block in one go
+
+        Args:
+            binary_data:    whole frame (or just the depth block with offset=0)
+            offset:         where the depth block starts
+
+        returns:
+            dict with `best_5_buy_data` & `best_5_sell_data` lists
+    """
+    values = DEPTH_STRUCT.unpack_from(binary_data, offset)
+
+    best_5_buy_data = []
+    best_5_sell_data = []
+
+    for i in range(0, len(values), 4):
+        each_data = {
+            "flag": values[i],
+            "quantity": values[i+1],
+            "price": values[i+2] / 100,
+            "no of orders": values[i+3]
+        }
+
+        if each_data["flag"] == 0:
+            best_5_buy_data.append(each_data)
+        else:
+            best_5_sell_data.append(each_data)
+
+    return {
+        "best_5_buy_data": best_5_buy_data,
+        "best_5_sell_data": best_5_sell_data
+    }
+
+
+def decode_frame(binary_data: bytes, tokens: TokenTable = None) -> LtpTick:
+    """
+        Single pass decoder for a smart-stream binary frame, the layout is picked
+        from the subscription mode byte and unpacked with one `unpack_from` call
+
+        Args:
+            binary_data:    Binary response from server
+            tokens:         (optional) intern table for the token field
+
+        returns:
+            `LtpTick` | `QuoteTick` | `SnapQuoteTick` with the same fields (and dict
+            style access) as the old `SocketConnection._parse_binary_data` dicts
+    """
+    view = memoryview(binary_data)
+    layout = MODE_STRUCTS.get(view[0], LTP_STRUCT)
+    values = layout.unpack_from(view)
+
+    token = tokens.token(values[2]) if tokens is not None else decode_token(values[2])
+
+    if layout is LTP_STRUCT:
+        return LtpTick(values[0], values[1], token, values[3], values[4], values[5] / 100)
+
+    if layout is QUOTE_STRUCT:
+        return QuoteTick(
+            values[0], values[1], token, values[3], values[4], values[5] / 100,
+            values[6], values[7] / 100, values[8], values[9], values[10],
+            values[11] / 100, values[12] / 100, values[13] / 100, values[14] / 100
+        )
+
+    # depth is only decoded when the consumer reads it
+    return SnapQuoteTick(
+        values[0], values[1], token, values[3], values[4], values[5] / 100,
+        values[6], values[7] / 100, values[8], values[9], values[10],
+        values[11] / 100, values[12] / 100, values[13] / 100, values[14] / 100,
+        values[15], values[16], values[17], values[18], values[19], values[20], values[21],
+        MarketDepth(view, DEPTH_OFFSET)
+    )
@@ -0,0 +1,110 @@
+from smartapi.connections.api_types import ExchangeType
+
+# width of the null padded token field in every binary frame
+TOKEN_FIELD_SIZE = 25
+
+
+class TokenInfo:
+    "Shared (interned) details of a subscribed token"
+
+    __slots__ = ('token', 'token_id', 'symbol', 'exchange_type')
+
+    def __init__(self, token: str, symbol: str = None, exchange_type: ExchangeType = None) -> None:
+        self.token = token
+        # angel one tokens are numeric, the int form joins with the lookup table index
+        self.token_id = int(token) if token.isdigit() else None
+        self.symbol = symbol
+        self.exchange_type = exchange_type
+
+    def __repr__(self) -> str:
+        return f"<TokenInfo {self.token} {self.symbol}>"
+
+
+class TokenTable:
+    """
+        Intern table for the token field of the socket frames
+
+        Maps the raw 25 byte token field straight to a shared token string, so decoding
+        the token of a frame is one dict lookup. Tokens not registered up front (via
+        `add`, `from_token_map`, `from_lookup`) are interned on first sight. Only the
+        zero padded field of a token is cached, a field with other bytes after the
+        token's \x00 is stripped on every lookup instead of growing the cache.
+    """
+
+    def __init__(self) -> None:
+        # raw field -> token string (hot path) & token string -> TokenInfo
+        self._fields: dict[bytes, str] = {}
+        self._infos: dict[str, TokenInfo] = {}
+
+    @staticmethod
+    def to_field(token: str) -> bytes:
+        return token.encode('latin-1').ljust(TOKEN_FIELD_SIZE, b'\x00')
+
+    def add(self, token: str, symbol: str = None, exchange_type: ExchangeType = None) -> TokenInfo:
+        "Registers a token, updates symbol / exchange of a known one"
+        token = str(token)
+        info = self._infos.get(token)
+
+        if info is None:
+            info = TokenInfo(token, symbol=symbol, exchange_type=exchange_type)
+            self._infos[token] = info
+            self._fields[self.to_field(token)] = token
+        else:
+            info.symbol = symbol or info.symbol
+            info.exchange_type = exchange_type or info.exchange_type
+
+        return info
+
+    def update(self, tokens: list[str], exchange_type: ExchangeType = None) -> None:
+        for token in tokens:
+            self.add(token, exchange_type=exchange_type)
+
+    def token(self, token_field: bytes) -> str:
+        "Token string for the raw 25 byte field of a frame"
+        token = self._fields.get(token_field)
+        if token is None:
+            token = self._intern(token_field)
+        return token
+
+    def _intern(self, token_field: bytes) -> str:
+        # only the null terminated prefix is the token, the rest might not be zeroed
+        token = bytes(token_field).partition(b'\x00')[0].decode('latin-1')
+        # `add` caches the zero padded field
+        return self.add(token).token
+
+    def info(self, token: str) -> TokenInfo | None:
+        return self._infos.get(token)
+
+    def token_id(self, token: str) -> int | None:
+        info = self._infos.get(token)
+        return info.token_id if info else None
+
+    def symbol(self, token: str) -> str | None:
+        info = self._infos.get(token)
+        return info.symbol if info else None
+
+    def __contains__(self, token: str) -> bool:
+        return token in self._infos
+
+    def __len__(self) -> int:
+        return len(self._infos)
+
+    @classmethod
+    def from_token_map(cls, token_map: dict, exchange_type: ExchangeType = None) -> 'TokenTable':
+        """
+            Args:
+                token_map:  token -> [trading symbol, name], refer notebooks/token_map.json
+        """
+        table = cls()
+        for token, names in token_map.items():
+            table.add(token, symbol=names[0] if names else None, exchange_type=exchange_type)
+        return table
+
+    @classmethod
+    def from_lookup(cls, lookup_df, token_column: str = 'token', symbol_column: str = 'symbol') -> 'TokenTable':
+        "Builds from the lookup table, refer `SmartAPIConnect.load_lookup_table`"
+        table = cls()
+        tokens = lookup_df.index if lookup_df.index.name == token_column else lookup_df[token_column]
+        for token, symbol in zip(tokens.astype(str), lookup_df[symbol_column]):
+            table.add(token, symbol=symbol)
+        return table
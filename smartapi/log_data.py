@@ -11,9 +11,39 @@ import smartapi.utils as utils
 from smartapi.configs import app_config
 from smartapi.connections import SmartAPIConnect, SocketConnection
 from smartapi.connections.api_types import *
-
-
-PSQL_POOL = psql_pool.ThreadedConnectionPool(**app_config['server']['db'])
+from smartapi.connections.token_table import TokenTable
+from smartapi.tick_writer import TickWriter
+from smartapi.tick_spool import TickSpool, SpoolDrainer
+from smartapi.bar_aggregator import BarAggregator, PostgresBarSink, QueuedSink
+from smartapi.utils.latency import LatencyRecorder
+
+
+# created in `init_pool`, kept global so `on_data` can be benchmarked against any db
+PSQL_POOL: psql_pool.ThreadedConnectionPool = None
+
+# every tick lands here first, `DRAINER` ships it to the db, refer `init_spool`
+SPOOL: TickSpool = None
+DRAINER: SpoolDrainer = None
+
+# live OHLCV bars of every interval, written to `candles`
+BARS: BarAggregator = None
+
+def init_pool(**db_config) -> psql_pool.ThreadedConnectionPool:
+    global PSQL_POOL
+    PSQL_POOL = psql_pool.ThreadedConnectionPool(**(db_config or app_config['server']['db']))
+    return PSQL_POOL
+
+def init_spool(directory=None, **spool_config) -> SpoolDrainer:
+    """
+        Needs `init_pool` first, whatever a previous run left in the spool is
+        written before the new ticks
+    """
+    global SPOOL, DRAINER
+    SPOOL = TickSpool(directory or app_config['server']['spool']['directory'], **spool_config)
+    writer = TickWriter(PSQL_POOL)
+    writer.copy_rows = DB_FLUSH_LATENCY.timed(writer.copy_rows)
+    DRAINER = SpoolDrainer(SPOOL, writer).start()
+    return DRAINER
 
 def run_query(query: str, one: bool = False):
     conn = PSQL_POOL.getconn()
@@ -35,9 +65,23 @@ upsert_sql = """
     SET price = EXCLUDED.price, volume = EXCLUDED.volume;
 """
 
-times = []
+# constant memory timings of the ingestion path
+ON_DATA_LATENCY = LatencyRecorder('on_data')
+UPSERT_LATENCY = LatencyRecorder('upsert_tick')
+DB_FLUSH_LATENCY = LatencyRecorder('db_flush')
 
 def on_data(_, data):
+    start = time.perf_counter_ns()
+    SPOOL.append(data)
+
+    # backfilled rows are already bars
+    if BARS is not None and not data.get('backfilled'):
+        BARS.on_tick(data)
+    ON_DATA_LATENCY.record(time.perf_counter_ns() - start)
+
+
+def upsert_tick(_, data):
+    "Single row upsert & commit per tick, what `on_data` did before `TickWriter`"
     data_to_upsert = {
         'token': data['token'],
         'time': data['exchange_timestamp'].strftime("%Y-%m-%d %H:%M:%S"),
@@ -54,21 +98,19 @@ def on_data(_, data):
             cur.close()
 
         conn.commit()
-    except:
-        ...
+    except Exception:
+        conn.rollback()
+        traceback.print_exc()
+
+        # keep the tick for the drainer instead of losing it
+        if SPOOL is not None:
+            SPOOL.append(data)
     finally:
         PSQL_POOL.putconn(conn=conn)
         
-    end = time.perf_counter_ns()
-    elapsed = (end-start)
-    times.append(elapsed)
-
-    # print(f"Time taken : {elapsed/1e6 :.3f}")
+    UPSERT_LATENCY.record(time.perf_counter_ns() - start)
 
 
-token_map = utils.read_json(Path('/Users/you-know-who/Code/Project/stock_server/notebooks/token_map.json'))
-subscribe_keys = set(token_map.keys())
-
 def on_open(ws_conn):
     ws_obj.subscribe(
         str.ljust('try_1', 10),
@@ -87,45 +129,111 @@ def on_error(ws_conn, err: str):
     ws_obj.close_connection()
     ws_obj.connect()
 
-# if __name__ == '__main__':
+if __name__ == '__main__':
+
+    import argparse
+    from smartapi.configs import user_config
+
+    parser = argparse.ArgumentParser(description="Log the live feed into tick_data")
+    parser.add_argument('--pipeline', type=int, metavar='PARSERS',
+                        help="parse & write in separate processes, refer `ProcessPipeline`")
+    args = parser.parse_args()
+
+    if args.pipeline:
+        from smartapi.process_pipeline import ProcessPipeline, SocketSource, PostgresSink
+        from smartapi.connections.shm_ring import check_store_order
+
+        # before logging in, the rings can't be created here
+        try:
+            check_store_order()
+        except RuntimeError as e:
+            parser.error(str(e))
+
+        token_map = utils.read_json(Path('/Users/you-know-who/Code/Project/stock_server/notebooks/token_map.json'))
+        api_obj = SmartAPIConnect(
+            client_code=user_config['client_code'],
+            pin=user_config['angel_pin'],
+            totp=user_config['keys']['qr_otp'],
+            api_key=user_config['keys']['trading']
+        )
+        tokens = api_obj.generate_session()
+
+        source = SocketSource(
+            user_config['client_code'], tokens['jwtToken'], tokens['feedToken'], user_config['keys']['feed'],
+            SubscriptionMode.QUOTE, {ExchangeType.NSE_FO: list(token_map.keys())}
+        )
+        pipeline = ProcessPipeline(source, PostgresSink(), parsers=args.pipeline).start()
+        try:
+            pipeline.wait_source()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            print(f"Pipeline: {pipeline.stats()}")
+            pipeline.stop()
+            api_obj.terminate_session()
+        raise SystemExit
+
+    init_pool()
+    init_spool()
+    # bars closing in `on_data` are written from the sink's thread, not the socket's
+    bar_sink = QueuedSink(PostgresBarSink(PSQL_POOL))
+    BARS = BarAggregator([bar_sink]).start()
+
+    ON_DATA_LATENCY.start_logging(every=60)
+    DB_FLUSH_LATENCY.start_logging(every=60)
+
+    token_map = utils.read_json(Path('/Users/you-know-who/Code/Project/stock_server/notebooks/token_map.json'))
+    subscribe_keys = set(token_map.keys())
+
+    api_obj = SmartAPIConnect(
+        client_code=user_config['client_code'],
+        pin=user_config['angel_pin'],
+        totp=user_config['keys']['qr_otp'],
+        api_key=user_config['keys']['trading']
+    )
 
-from smartapi.configs import user_config
+    tokens = api_obj.generate_session()
 
-api_obj = SmartAPIConnect(
-    client_code=user_config['client_code'],
-    pin=user_config['angel_pin'],
-    totp=user_config['keys']['qr_otp'],
-    api_key=user_config['keys']['trading']
-)
+    ws_obj = SocketConnection(
+        client_code=user_config['client_code'],
+        jwt_token=tokens['jwtToken'],
+        feed_token=tokens['feedToken'],
+        api_key=user_config['keys']['feed']
+    )
+    ws_obj.token_table = TokenTable.from_token_map(token_map, exchange_type=ExchangeType.NSE_FO)
 
-tokens = api_obj.generate_session()
+    # ticks missed while reconnecting (`on_error`) are upserted from the candle api
+    ws_obj.enable_backfill(api_obj)
+    telemetry = ws_obj.enable_telemetry('log_data')
 
-ws_obj = SocketConnection(
-    client_code=user_config['client_code'],
-    jwt_token=tokens['jwtToken'],
-    feed_token=tokens['feedToken'],
-    api_key=user_config['keys']['feed']
-)
+    ws_obj.on_close = lambda _: print("Connection Closed !!")
+    ws_obj.on_message = lambda _, data: print(f"Message recieved : {data} !!")
 
-ws_obj.on_close = lambda _: print("Connection Closed !!")
-ws_obj.on_message = lambda _, data: print(f"Message recieved : {data} !!")
+    ws_obj.on_data = on_data
+    ws_obj.on_open = on_open
+    ws_obj.on_error = on_error
 
-ws_obj.on_data = on_data
-ws_obj.on_open = on_open
-ws_obj.on_error = on_error
+    try:
+        ws_obj.connect()
 
-try:
-    ws_obj.connect()
+    except KeyboardInterrupt:
+        ws_obj.close_connection()
+        api_obj.terminate_session()
 
-except KeyboardInterrupt:
-    ws_obj.close_connection()
-    api_obj.terminate_session()
-    PSQL_POOL.closeall()
+        BARS.stop()
+        bar_sink.close()
+        DRAINER.stop()
+        SPOOL.close()
+        print(f"Spool: {DRAINER.stats()}")
+        PSQL_POOL.closeall()
+
+        for recorder in (ON_DATA_LATENCY, DB_FLUSH_LATENCY):
+            recorder.stop_logging()
+            print(f"{recorder.name} (ms): {recorder.snapshot()['total']}")
 
-    if len(times) > 0:
-        print(f"Avg Upsert time: {(sum(times)/(1e6*len(times))) :.3f}")
-        print(f"Max: {max(times)/1e6 :.3f}")
-        print(f"Min: {min(times)/1e6 :.3f}")
+        stats = telemetry.stats()
+        print(f"Feed latency (ms): {stats['latency_ms']}")
+        print(f"Handler (ms): {stats['handler_ms']}")
 
-finally:
-    ...
\ No newline at end of file
+    finally:
+        ...
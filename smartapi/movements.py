@@ -0,0 +1,351 @@
+import threading
+import traceback
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import psycopg2 as psql
+import pandas as pd
+
+# minutes, like `token_movements(interval '3 minutes')`
+WINDOWS = (1, 3, 5, 15)
+
+# trim a token's history once this many entries fell out of every window
+_TRIM_AFTER = 1024
+
+
+class MovementsEngine:
+    """
+        Rolling window movements of every token, updated tick by tick
+
+        For each window (minutes) and token:
+            change: % move of the LTP over the window
+            accel:  % move of the window's second half minus that of its first half
+            ltp:    last traded price
+
+        A token keeps one price per second (the last one) for the longest window, each
+        window only moves a cursor over it, so a tick & a token's share of `snapshot`
+        are amortized O(1). Quiet tokens age out against the feed clock (latest tick).
+    """
+
+    def __init__(self, windows=WINDOWS) -> None:
+        """
+            Args:
+                windows:    window lengths in minutes
+        """
+        self.windows = tuple(sorted(windows))
+
+        # every boundary a window needs: its start & its middle, seconds before now
+        self._spans = sorted({span for minutes in self.windows for span in (minutes * 60, minutes * 30)})
+        self._span_idx = {span: idx for idx, span in enumerate(self._spans)}
+
+        # token -> [seconds, prices, cursors], cursors[i] is the last entry at or before now - spans[i]
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+        # latest second seen, the clock windows are evaluated against
+        self.clock = 0
+
+        self.ticks = 0
+        self.late = 0
+
+    def update(self, token: int, epoch_ms: int, price: float) -> None:
+        second = epoch_ms // 1000
+
+        with self._lock:
+            self.ticks += 1
+            state = self._tokens.get(token)
+            if state is None:
+                state = self._tokens[token] = [[second], [price], [0] * len(self._spans)]
+            else:
+                seconds, prices, _ = state
+                last = seconds[-1]
+                if second < last:
+                    self.late += 1
+                    return
+                if second == last:
+                    prices[-1] = price
+                else:
+                    seconds.append(second)
+                    prices.append(price)
+                    self._advance(state, second)
+
+            if second > self.clock:
+                self.clock = second
+
+    def on_tick(self, tick) -> None:
+        self.update(int(tick.token), tick.exchange_epoch_ms, tick.last_traded_price)
+
+    def on_data(self, ws_conn, tick) -> None:
+        "`SocketConnection.on_data` compatible"
+        self.on_tick(tick)
+
+    def _advance(self, state: list, now: int) -> None:
+        seconds, prices, cursors = state
+        last = len(seconds) - 1
+
+        for idx, span in enumerate(self._spans):
+            cutoff = now - span
+            cursor = cursors[idx]
+            while cursor < last and seconds[cursor + 1] <= cutoff:
+                cursor += 1
+            cursors[idx] = cursor
+
+        # the longest window's cursor is the oldest one
+        drop = cursors[-1]
+        if drop >= _TRIM_AFTER:
+            del seconds[:drop]
+            del prices[:drop]
+            for idx in range(len(cursors)):
+                cursors[idx] -= drop
+
+    def snapshot(self, minutes: int, now: datetime = None) -> pd.DataFrame:
+        """
+            Movements of every token over a window
+
+            Args:
+                minutes:    one of `windows`
+                now:        (optional) end of the window, the feed clock by default
+
+            returns:
+                DataFrame with token, change, accel & ltp columns
+        """
+        if minutes not in self.windows:
+            raise ValueError(f"No {minutes} minute window, tracked: {self.windows}")
+
+        start_idx = self._span_idx[minutes * 60]
+        mid_idx = self._span_idx[minutes * 30]
+
+        tokens, starts, mids, ltps = [], [], [], []
+        with self._lock:
+            clock = self.clock if now is None else int(now.timestamp())
+            start_cutoff = clock - minutes * 60
+            mid_cutoff = clock - minutes * 30
+
+            # only this window's two cursors move here, `update` moves (and trims) the rest
+            for token, (seconds, prices, cursors) in self._tokens.items():
+                last = len(seconds) - 1
+
+                start = cursors[start_idx]
+                while start < last and seconds[start + 1] <= start_cutoff:
+                    start += 1
+                cursors[start_idx] = start
+
+                mid = cursors[mid_idx]
+                if mid < start:
+                    mid = start
+                while mid < last and seconds[mid + 1] <= mid_cutoff:
+                    mid += 1
+                cursors[mid_idx] = mid
+
+                tokens.append(token)
+                starts.append(prices[start])
+                mids.append(prices[mid])
+                ltps.append(prices[-1])
+
+        start, mid, ltp = (np.array(values, dtype=float) for values in (starts, mids, ltps))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            first_half = np.where(start != 0, (mid - start) / start * 100, 0.0)
+            second_half = np.where(mid != 0, (ltp - mid) / mid * 100, 0.0)
+            change = np.where(start != 0, (ltp - start) / start * 100, 0.0)
+
+        return pd.DataFrame({'token': tokens, 'change': change, 'accel': second_half - first_half, 'ltp': ltp})
+
+    def movements(self, minutes: int, now: datetime = None) -> pd.DataFrame:
+        """
+            `/movements` columns: token, change & ltp, where change is the window's
+            accel, what `token_movements` returns as accel & the dashboard shows as change
+        """
+        df = self.snapshot(minutes, now)
+        return df[['token', 'accel', 'ltp']].rename(columns={'accel': 'change'})
+
+    def stats(self) -> dict:
+        return {
+            "tokens": len(self._tokens),
+            "ticks": self.ticks,
+            "late": self.late,
+            "clock": datetime.fromtimestamp(self.clock) if self.clock else None,
+        }
+
+
+def symbol_index(lookup: pd.DataFrame) -> pd.Series:
+    "token -> symbol of a lookup indexed by token, the first row of a repeated token wins"
+    symbols = lookup['symbol']
+    return symbols[~symbols.index.duplicated()]
+
+
+def movements_payload(df: pd.DataFrame, symbols: pd.Series, growth_threshold: float = .2) -> list[dict]:
+    """
+        `/movements` rows of the tokens with a symbol, built column wise
+
+        Args:
+            df:                 token, change & ltp columns
+            symbols:            refer `symbol_index`
+            growth_threshold:   isUp is 1 / -1 when change is at least this far up / down, else 0
+    """
+    df = df[df['token'].isin(symbols.index)]
+    change = df['change'].to_numpy(dtype=float)
+    is_up = np.select([change >= growth_threshold, change <= -growth_threshold], [1, -1], 0)
+
+    columns = (
+        df['token'].tolist(),
+        symbols.reindex(df['token']).tolist(),
+        change.tolist(),
+        df['ltp'].tolist(),
+        is_up.tolist(),
+    )
+    keys = ('token', 'symbol', 'change', 'ltp', 'isUp')
+    return [dict(zip(keys, row)) for row in zip(*columns)]
+
+
+# CONCURRENTLY doesn't block the ingestion's inserts while it builds, it can't run in a transaction
+TIME_INDEX_DDL = "CREATE INDEX CONCURRENTLY IF NOT EXISTS tick_data_time_idx ON tick_data (time)"
+
+
+def create_time_index(**connect_kwargs) -> None:
+    "One off migration for `TickTail`, refer `TIME_INDEX_DDL`"
+    conn = psql.connect(**connect_kwargs)
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(TIME_INDEX_DDL)
+    finally:
+        conn.close()
+
+
+class TickTail:
+    """
+        Feeds a `MovementsEngine` from `tick_data`, for processes that aren't on the socket
+
+        Polls the rows from `lookback` seconds before the last second seen onwards (a
+        second's row is upserted until it's over, the engine keeps the last price of a
+        second), after loading the engine's longest window on start. Rows commit late
+        (the spool drainer's flush, backfilled gaps), the lookback re-reads those that
+        landed behind the last poll; a row older than what its token already has is
+        skipped.
+
+        Needs an index on `tick_data (time)` (the primary key leads with token), create
+        it once with `python -m smartapi.movements --create-index`.
+    """
+
+    def __init__(self, engine: MovementsEngine, poll_interval: float = 1.0, lookback: float = 5.0,
+                 **connect_kwargs) -> None:
+        """
+            Args:
+                poll_interval:  seconds between polls
+                lookback:       seconds re-read behind the last row seen, keep it above the
+                                writers' commit lag (`SpoolDrainer` / `TickWriter` flushes)
+                connect_kwargs: `psycopg2.connect` arguments, the tail keeps its own connection
+        """
+        self.engine = engine
+        self.poll_interval = poll_interval
+        self.lookback = timedelta(seconds=lookback)
+        self.connect_kwargs = connect_kwargs
+
+        self._since = None
+        # token -> epoch ms of the newest row fed
+        self._fed = {}
+        self._thread = None
+        self._stop = threading.Event()
+        self.ready = threading.Event()
+
+        self.polls = 0
+        self.rows = 0
+        self.errors = 0
+
+    def start(self) -> 'TickTail':
+        if self._thread is not None:
+            return self
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="tick-tail", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        conn = None
+        while not self._stop.is_set():
+            try:
+                if conn is None or conn.closed:
+                    conn = psql.connect(**self.connect_kwargs)
+                    conn.autocommit = True
+
+                self.poll(conn)
+                self.ready.set()
+            except Exception:
+                self.errors += 1
+                traceback.print_exc()
+                if conn is not None:
+                    conn.close()
+
+            self._stop.wait(self.poll_interval)
+
+        if conn is not None:
+            conn.close()
+
+    def poll(self, conn) -> int:
+        "Feeds the rows since the last poll (and the lookback), returns how many were read"
+        if self._since is None:
+            since = datetime.now() - timedelta(minutes=max(self.engine.windows))
+        else:
+            since = self._since - self.lookback
+
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT token, time, price::float8 FROM tick_data WHERE time >= %s ORDER BY time",
+                (since,)
+            )
+            rows = cur.fetchall()
+
+        update = self.engine.update
+        fed = self._fed
+        for token, tick_time, price in rows:
+            if price is None:
+                continue
+            epoch_ms = int(tick_time.timestamp() * 1000)
+            # read again in the lookback, or behind what the token already has
+            if epoch_ms < fed.get(token, epoch_ms):
+                continue
+            fed[token] = epoch_ms
+            update(token, epoch_ms, price)
+
+        if rows and (self._since is None or rows[-1][1] > self._since):
+            self._since = rows[-1][1]
+
+        self.polls += 1
+        self.rows += len(rows)
+        return len(rows)
+
+    def stats(self) -> dict:
+        return {
+            "polls": self.polls,
+            "rows": self.rows,
+            "errors": self.errors,
+            "since": self._since,
+        }
+
+
+def main():
+    import argparse
+    from smartapi.configs import app_config
+
+    parser = argparse.ArgumentParser(description="tick_data migrations for the movements tail")
+    parser.add_argument('--create-index', action='store_true', help="index tick_data on time, without blocking writes")
+    args = parser.parse_args()
+
+    if args.create_index:
+        db_config = {k: v for k, v in app_config['server']['db'].items() if k not in ('minconn', 'maxconn')}
+        create_time_index(**db_config)
+        print("tick_data_time_idx ready")
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
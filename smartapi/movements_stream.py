@@ -0,0 +1,195 @@
+import asyncio
+import traceback
+
+import pandas as pd
+
+from smartapi.movements import MovementsEngine, movements_payload
+
+
+class Subscriber:
+    """
+        One stream client, with its token subset & the rows waiting to be sent
+
+        Pending rows are kept per token, a client that reads slower than the updates
+        only gets the latest row of each token (coalesced), so a slow client costs at
+        most one row per token.
+    """
+
+    def __init__(self, interval: int, tokens: set = None) -> None:
+        self.interval = interval
+        self.tokens = tokens
+
+        self._pending = {}
+        self._ready = asyncio.Event()
+
+        self.sent = 0
+        self.coalesced = 0
+
+    def wants(self, token: int) -> bool:
+        return self.tokens is None or token in self.tokens
+
+    def push(self, rows: list[dict]) -> None:
+        pending = self._pending
+        for row in rows:
+            token = row['token']
+            if not self.wants(token):
+                continue
+            if token in pending:
+                self.coalesced += 1
+            pending[token] = row
+
+        if pending:
+            self._ready.set()
+
+    async def next(self) -> list[dict]:
+        "Waits for rows to send, the latest of every token changed since the last call"
+        await self._ready.wait()
+        self._ready.clear()
+        rows, self._pending = list(self._pending.values()), {}
+        self.sent += len(rows)
+        return rows
+
+
+class MovementsStream:
+    """
+        Pushes `/movements` rows to subscribers: a snapshot on subscribe, then the
+        rows of the tokens whose change (2 decimals), isUp or ltp moved
+
+        Every `every` seconds each window with subscribers is snapshotted once and
+        diffed against the previous rows, deltas go to every subscriber of the window.
+
+            stream = MovementsStream(engine, symbols).start()
+            subscriber, snapshot = stream.subscribe(3, tokens={48105, 48326})
+            while True:
+                rows = await subscriber.next()
+    """
+
+    def __init__(self, engine: MovementsEngine, symbols: pd.Series, every: float = 1.0, growth_threshold: float = .2) -> None:
+        """
+            Args:
+                symbols:            token -> symbol, refer `symbol_index`
+                every:              seconds between diffs, keep it at the tick cadence
+                growth_threshold:   refer `movements_payload`
+        """
+        self.engine = engine
+        self.symbols = symbols
+        self.every = every
+        self.growth_threshold = growth_threshold
+
+        # interval -> subscribers / token -> last row pushed
+        self._subscribers: dict[int, set[Subscriber]] = {}
+        self._rows: dict[int, dict[int, dict]] = {}
+
+        self._task = None
+
+        self.diffs = 0
+        self.deltas = 0
+        # of the subscribers that left
+        self.sent = 0
+        self.coalesced = 0
+
+    def start(self) -> 'MovementsStream':
+        "Needs a running event loop (e.g. a startup handler)"
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _payload(self, interval: int) -> list[dict]:
+        return movements_payload(self.engine.movements(interval), self.symbols, self.growth_threshold)
+
+    @staticmethod
+    def _state(row: dict) -> tuple:
+        return round(row['change'], 2), row['isUp'], row['ltp']
+
+    def validate(self, interval: int) -> None:
+        "Raises `ValueError` when the engine has no `interval` window"
+        if interval not in self.engine.windows:
+            raise ValueError(f"No {interval} minute window, tracked: {self.engine.windows}")
+
+    def subscribe(self, interval: int, tokens: set = None) -> tuple[Subscriber, list[dict]]:
+        """
+            Args:
+                interval:   one of the engine's windows (minutes)
+                tokens:     (optional) tokens to stream, all by default
+
+            returns:
+                the subscriber & its snapshot
+        """
+        self.validate(interval)
+
+        subscriber = Subscriber(interval, tokens)
+        self._subscribers.setdefault(interval, set()).add(subscriber)
+
+        if interval not in self._rows:
+            self._rows[interval] = {row['token']: row for row in self._payload(interval)}
+
+        return subscriber, self.snapshot(subscriber)
+
+    def snapshot(self, subscriber: Subscriber) -> list[dict]:
+        "latest rows of the subscriber's tokens, e.g. after it changed them"
+        return [row for token, row in self._rows.get(subscriber.interval, {}).items() if subscriber.wants(token)]
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        subscribers = self._subscribers.get(subscriber.interval)
+        if subscribers is None:
+            return
+
+        if subscriber in subscribers:
+            subscribers.discard(subscriber)
+            self.sent += subscriber.sent
+            self.coalesced += subscriber.coalesced
+
+        if not subscribers:
+            # nobody left to diff for
+            del self._subscribers[subscriber.interval]
+            self._rows.pop(subscriber.interval, None)
+
+    def diff(self, interval: int) -> list[dict]:
+        "Rows of `interval` that moved since the last diff, also remembered as the latest"
+        last = self._rows.setdefault(interval, {})
+        state = self._state
+
+        changed = []
+        for row in self._payload(interval):
+            previous = last.get(row['token'])
+            if previous is None or state(previous) != state(row):
+                last[row['token']] = row
+                changed.append(row)
+
+        self.diffs += 1
+        self.deltas += len(changed)
+        return changed
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.every)
+            for interval, subscribers in list(self._subscribers.items()):
+                try:
+                    changed = self.diff(interval)
+                except Exception:
+                    traceback.print_exc()
+                    continue
+
+                if changed:
+                    for subscriber in list(subscribers):
+                        subscriber.push(changed)
+
+    def stats(self) -> dict:
+        subscribers = [subscriber for group in self._subscribers.values() for subscriber in group]
+        return {
+            "subscribers": len(subscribers),
+            "intervals": sorted(self._subscribers),
+            "diffs": self.diffs,
+            "deltas": self.deltas,
+            "sent": self.sent + sum(subscriber.sent for subscriber in subscribers),
+            "coalesced": self.coalesced + sum(subscriber.coalesced for subscriber in subscribers),
+        }
@@ -0,0 +1,417 @@
+"""
+    Multi process ingestion: receiver -> N parsers / bar aggregators -> writer
+
+    Stages hand fixed size records to each other through `ShmRing`s (shared memory,
+    no pickling). A frame goes to the parser of its token (crc32, like `FramePipeline`)
+    so per token order & bars stay in one process. `ProcessPipeline` is the supervisor,
+    it owns the rings and restarts a stage that dies, the rings keep what it hadn't
+    consumed: a parser frees frames once their records are in its out ring, the
+    writer frees records once the sink committed them. So ticks are delivered at
+    least once, the bars a parser had open when it died are lost.
+"""
+import time
+import zlib
+import struct
+import threading
+import traceback
+import multiprocessing as mp
+
+from datetime import timedelta
+
+from smartapi.connections import tick_decoder
+from smartapi.connections.shm_ring import ShmRing
+from smartapi.connections.pipeline import TOKEN_SLICE, MIN_FRAME_SIZE
+from smartapi.connections.token_table import TokenTable
+from smartapi.connections.api_types import SubscriptionMode, ExchangeType, TickInterval
+from smartapi.tick_writer import tick_row, PG_EPOCH
+
+# parser -> writer records, first byte is the kind
+TICK_RECORD = struct.Struct('<Biqdq')        # kind, token, time (us since 2000-01-01), price, volume (-1 = null)
+BAR_RECORD = struct.Struct('<BiBqddddqi')    # kind, token, interval, start, o, h, l, c, volume, ticks
+TICK_KIND = 0
+BAR_KIND = 1
+
+FRAME_SLOT_SIZE = 384
+RECORD_SLOT_SIZE = 64
+
+INTERVALS = list(TickInterval)
+
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def frame_route(frame: bytes, parsers: int) -> int:
+    "parser of a frame, by its token bytes (same key as `FramePipeline`)"
+    return zlib.crc32(frame[TOKEN_SLICE]) % parsers
+
+
+class SyntheticSource:
+    "Benchmark source, `count` frames in the documented layout (refer `benchmarks.synthetic`)"
+
+    def __init__(self, count: int, mode: SubscriptionMode = SubscriptionMode.QUOTE, tokens: int = 200, seed: int = 7) -> None:
+        self.count = count
+        self.mode = mode
+        self.tokens = tokens
+        self.seed = seed
+
+    def prepare(self) -> None:
+        from benchmarks.synthetic import make_frames
+        self._frames = make_frames(self.mode, self.count, tokens=self.tokens, seed=self.seed)
+
+    def run(self, emit, stop) -> None:
+        for frame in self._frames:
+            if not emit(frame):
+                return
+
+
+class SocketSource:
+    "Live smart-stream feed, frames are forwarded without parsing"
+
+    def __init__(self, client_code: str, jwt_token: str, feed_token: str, api_key: str,
+                 mode: SubscriptionMode, exchange_token_map: dict[ExchangeType: list[str]], url: str = None) -> None:
+        self.credentials = (client_code, jwt_token, feed_token, api_key)
+        self.mode = mode
+        self.exchange_token_map = exchange_token_map
+        self.url = url
+
+    def prepare(self) -> None:
+        ...
+
+    def run(self, emit, stop) -> None:
+        from smartapi.connections.socket_connection import SocketConnection
+
+        ws_obj = SocketConnection(*self.credentials)
+        if self.url is not None:
+            ws_obj.ROOT_URL = self.url
+
+        ws_obj.on_frame = emit
+        ws_obj.on_open = lambda _: ws_obj.subscribe('pipeline', self.mode, self.exchange_token_map)
+        ws_obj.on_error = lambda _, err: print(f"Receiver error: {err}")
+
+        threading.Thread(target=lambda: (stop.wait(), ws_obj.close_connection()), daemon=True).start()
+
+        # reconnect until asked to stop
+        while not stop.is_set():
+            ws_obj.connect()
+            stop.wait(1)
+
+
+class PostgresSink:
+    """
+        Writer stage output: ticks COPY'd into `tick_data`, bars into `candles`
+
+        `write` returns once both are committed, the writer only frees the ring
+        records after that
+    """
+
+    def __init__(self, **db_config) -> None:
+        self.db_config = db_config
+
+    def open(self) -> None:
+        from psycopg2 import pool as psql_pool
+        from smartapi.configs import app_config
+        from smartapi.tick_writer import TickWriter
+        from smartapi.bar_aggregator import PostgresBarSink
+
+        self._pool = psql_pool.ThreadedConnectionPool(**(self.db_config or app_config['server']['db']))
+        # only its synchronous `copy_rows`, no flush thread buffering rows the ring already freed
+        self._writer = TickWriter(self._pool)
+        self._bars = PostgresBarSink(self._pool)
+
+    def write(self, rows: list[tuple], bars: list) -> None:
+        if rows:
+            # the last tick of a second wins, like `TickWriter.write_row`
+            self._writer.copy_rows(list({(row[0], row[1]): row for row in rows}.values()))
+        if bars:
+            self._bars(bars)
+
+    def close(self) -> None:
+        self._pool.closeall()
+
+
+class CountingSink:
+    "Writer stage output for benchmarks, only counts"
+
+    def open(self) -> None:
+        self.rows = 0
+        self.bars = 0
+
+    def write(self, rows: list[tuple], bars: list) -> None:
+        self.rows += len(rows)
+        self.bars += len(bars)
+
+    def close(self) -> None:
+        print(f"Writer: {self.rows} ticks, {self.bars} bars")
+
+
+def run_receiver(source, out_specs: list, ready, go, stop) -> None:
+    rings = [ShmRing.attach(spec) for spec in out_specs]
+    parsers = len(rings)
+    source.prepare()
+
+    def emit(frame: bytes) -> bool:
+        if len(frame) < MIN_FRAME_SIZE:
+            return True
+        return rings[frame_route(frame, parsers)].put_wait(frame, stop)
+
+    ready.set()
+    go.wait()
+    try:
+        source.run(emit, stop)
+    finally:
+        for ring in rings:
+            ring.close()
+
+
+def run_parser(in_spec: tuple, out_spec: tuple, intervals: list, bad_frames, ready, go, stop) -> None:
+    from smartapi.bar_aggregator import BarAggregator
+
+    in_ring = ShmRing.attach(in_spec)
+    out_ring = ShmRing.attach(out_spec)
+    tokens = TokenTable()
+
+    def push_bars(bars) -> None:
+        for bar in bars:
+            out_ring.put_wait(BAR_RECORD.pack(
+                BAR_KIND, int(bar.token), INTERVALS.index(bar.interval),
+                (bar.start - PG_EPOCH) // _MICROSECOND,
+                bar.open, bar.high, bar.low, bar.close, bar.volume, bar.ticks
+            ))
+
+    bars = BarAggregator([push_bars], intervals=[TickInterval[name] for name in intervals]) if intervals else None
+    # bars of tokens which went quiet are closed on the clock, like `BarAggregator.start`
+    next_close = time.monotonic() + 1.0
+
+    ready.set()
+    go.wait()
+
+    while True:
+        if bars is not None and time.monotonic() >= next_close:
+            bars.close_due()
+            next_close = time.monotonic() + 1.0
+
+        frames = in_ring.peek_many(1024)
+        if not frames:
+            if stop.is_set():
+                break
+            time.sleep(0.0005)
+            continue
+
+        for frame in frames:
+            # a frame that doesn't decode is skipped, re-reading it after a restart would crash again
+            try:
+                tick = tick_decoder.decode_frame(frame, tokens=tokens)
+                token, tick_time, price, volume = tick_row(tick)
+                record = TICK_RECORD.pack(
+                    TICK_KIND, token, (tick_time - PG_EPOCH) // _MICROSECOND, price, -1 if volume is None else volume
+                )
+            except Exception:
+                bad_frames.value += 1
+                if bad_frames.value <= 10:
+                    traceback.print_exc()
+                continue
+
+            out_ring.put_wait(record)
+            if bars is not None:
+                bars.on_tick(tick)
+
+        in_ring.advance(len(frames))
+
+    if bars is not None:
+        bars.flush()
+    in_ring.close()
+    out_ring.close()
+
+
+def run_writer(in_specs: list, sink, ready, go, stop, max_retry_delay: float = 30) -> None:
+    from smartapi.bar_aggregator import Bar
+
+    rings = [ShmRing.attach(spec) for spec in in_specs]
+    sink.open()
+
+    ready.set()
+    go.wait()
+
+    retry_delay = 0
+    while True:
+        idle = True
+        for ring in rings:
+            records = ring.peek_many(20_000)
+            if not records:
+                continue
+
+            idle = False
+            rows, bars = [], []
+            for record in records:
+                if record[0] == TICK_KIND:
+                    _, token, micros, price, volume = TICK_RECORD.unpack(record)
+                    rows.append((token, PG_EPOCH + micros * _MICROSECOND, price, None if volume == -1 else volume))
+                else:
+                    _, token, interval, micros, *values = BAR_RECORD.unpack(record)
+                    bars.append(Bar(None, str(token), INTERVALS[interval], PG_EPOCH + micros * _MICROSECOND, *values))
+
+            try:
+                sink.write(rows, bars)
+            except Exception:
+                # records stay in the ring, retried with a backoff (& by the next writer if this one dies)
+                traceback.print_exc()
+                retry_delay = min(max_retry_delay, retry_delay * 2 or 0.5)
+                time.sleep(retry_delay)
+                break
+
+            retry_delay = 0
+            ring.advance(len(records))
+
+        if idle:
+            if stop.is_set():
+                break
+            time.sleep(0.0005)
+
+    sink.close()
+    for ring in rings:
+        ring.close()
+
+
+class ProcessPipeline:
+    """
+        Supervisor of the receiver, parser & writer processes
+
+            pipeline = ProcessPipeline(SocketSource(...), PostgresSink(), parsers=4).start()
+            ...
+            pipeline.stop()     # receiver first, then the rest once their input is drained
+    """
+
+    def __init__(self, source, sink, parsers: int = 4, intervals=tuple(TickInterval),
+                 frame_slots: int = 65_536, record_slots: int = 131_072, check_interval: float = 1.0) -> None:
+        """
+            Args:
+                source:         `SocketSource` / `SyntheticSource`, runs in the receiver
+                sink:           `PostgresSink` / `CountingSink`, runs in the writer
+                parsers:        number of parser / bar aggregator processes
+                intervals:      bar intervals to build, empty for none
+                frame_slots:    slots of each receiver -> parser ring
+                record_slots:   slots of each parser -> writer ring
+                check_interval: seconds between liveness checks of the stages
+        """
+        self.source = source
+        self.sink = sink
+        self.parsers = parsers
+        self.intervals = [interval.name for interval in intervals]
+        self.check_interval = check_interval
+
+        # spawn works the same on linux & mac and doesn't copy the parent's threads
+        self._ctx = mp.get_context('spawn')
+
+        self._frame_rings = [ShmRing(slots=frame_slots, slot_size=FRAME_SLOT_SIZE, create=True) for _ in range(parsers)]
+        self._record_rings = [ShmRing(slots=record_slots, slot_size=RECORD_SLOT_SIZE, create=True) for _ in range(parsers)]
+
+        # frames a parser couldn't decode, shared so they survive its restarts
+        self._bad_frames = [self._ctx.Value('q', 0, lock=False) for _ in range(parsers)]
+
+        self._go = self._ctx.Event()
+        # per stage kind, so stopping can go front to back
+        self._stop = {stage: self._ctx.Event() for stage in ('receiver', 'parser', 'writer')}
+
+        # name -> [process, ready event, restarts]
+        self._stages = {}
+        self._monitor = None
+        self._running = False
+        self._halt = threading.Event()
+
+    def _stage_args(self, name: str) -> tuple:
+        if name == 'receiver':
+            return run_receiver, (self.source, [ring.spec for ring in self._frame_rings])
+        if name == 'writer':
+            return run_writer, ([ring.spec for ring in self._record_rings], self.sink)
+
+        idx = int(name.split('-')[1])
+        return run_parser, (self._frame_rings[idx].spec, self._record_rings[idx].spec, self.intervals, self._bad_frames[idx])
+
+    def _spawn(self, name: str) -> None:
+        target, args = self._stage_args(name)
+        kind = name.split('-')[0]
+        ready = self._ctx.Event()
+
+        process = self._ctx.Process(
+            target=target, args=(*args, ready, self._go, self._stop[kind]), name=f"pipeline-{name}", daemon=True
+        )
+        process.start()
+
+        restarts = self._stages[name][2] + 1 if name in self._stages else 0
+        self._stages[name] = [process, ready, restarts]
+
+    def start(self, timeout: float = 60) -> 'ProcessPipeline':
+        "Starts every stage and returns once all of them are ready to go"
+        names = ['writer'] + [f"parser-{idx}" for idx in range(self.parsers)] + ['receiver']
+        for name in names:
+            self._spawn(name)
+
+        deadline = time.monotonic() + timeout
+        for name in names:
+            if not self._stages[name][1].wait(max(0, deadline - time.monotonic())):
+                self.stop(drain=False)
+                raise TimeoutError(f"Pipeline stage {name} didn't start")
+
+        self._running = True
+        self._halt.clear()
+        self._go.set()
+
+        self._monitor = threading.Thread(target=self._supervise, name="pipeline-supervisor", daemon=True)
+        self._monitor.start()
+        return self
+
+    def _supervise(self) -> None:
+        while not self._halt.wait(self.check_interval):
+            for name, (process, _, _) in list(self._stages.items()):
+                kind = name.split('-')[0]
+                # a clean exit (e.g. a finite source) isn't restarted
+                if not self._running or self._stop[kind].is_set() or process.is_alive() or process.exitcode == 0:
+                    continue
+                print(f"Pipeline stage {name} died (exit code {process.exitcode}), restarting")
+                try:
+                    self._spawn(name)
+                except Exception:
+                    traceback.print_exc()
+
+    def wait_source(self, timeout: float = None) -> bool:
+        "Waits for the receiver to end (finite sources), True when it did"
+        process = self._stages['receiver'][0]
+        process.join(timeout)
+        return not process.is_alive()
+
+    def stop(self, drain: bool = True, timeout: float = 30) -> None:
+        """
+            Stops the stages front to back, with `drain` every stage first empties its
+            input ring
+        """
+        self._running = False
+        self._halt.set()
+        if self._monitor is not None:
+            self._monitor.join()
+            self._monitor = None
+
+        self._go.set()
+        for kind in ('receiver', 'parser', 'writer'):
+            if not drain:
+                for event in self._stop.values():
+                    event.set()
+            self._stop[kind].set()
+            for name, (process, _, _) in self._stages.items():
+                if name.split('-')[0] == kind:
+                    process.join(timeout)
+                    if process.is_alive():
+                        process.terminate()
+
+        for ring in self._frame_rings + self._record_rings:
+            ring.close()
+            ring.unlink()
+
+    def stats(self) -> dict:
+        return {
+            "stages": {
+                name: {"pid": process.pid, "alive": process.is_alive(), "restarts": restarts}
+                for name, (process, _, restarts) in self._stages.items()
+            },
+            "bad_frames": sum(counter.value for counter in self._bad_frames),
+            "frame_rings": [ring.stats() for ring in self._frame_rings],
+            "record_rings": [ring.stats() for ring in self._record_rings],
+        }
@@ -0,0 +1,141 @@
+import time
+import asyncio
+import hashlib
+
+from dataclasses import dataclass
+
+from fastapi import Request, Response
+
+from smartapi.utils.latency import LatencyRecorder
+
+
+@dataclass(slots=True)
+class CachedBody:
+    body: bytes
+    etag: str
+    expires: float
+    media_type: str = "application/json"
+
+
+class ResponseCache:
+    """
+        Shared TTL cache of rendered read responses, keyed on path & query params
+
+        Concurrent misses of a key wait for one recomputation (single flight) and the
+        ETag is a hash of the body, so a client sending `If-None-Match` gets a 304
+        without a body as long as the content didn't change, even across recomputes.
+
+            CACHE = ResponseCache(ttl=1.0)
+
+            @app.get("/movements")
+            async def get_movements(request: Request, interval: int = 3):
+                return await CACHE.respond(request, lambda: build_body(interval))
+    """
+
+    def __init__(self, ttl: float = 1.0, max_entries: int = 256) -> None:
+        """
+            Args:
+                ttl:            seconds a body is served before it's recomputed, keep it at
+                                the cadence the data changes (e.g. `TickTail.poll_interval`)
+                max_entries:    keys kept, the oldest go first
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._entries: dict[tuple, CachedBody] = {}
+        self._inflight: dict[tuple, asyncio.Future] = {}
+
+        self.recompute = LatencyRecorder('response_recompute')
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.not_modified = 0
+        self.errors = 0
+
+    @staticmethod
+    def key_of(request: Request) -> tuple:
+        return request.url.path, tuple(sorted(request.query_params.multi_items()))
+
+    async def get(self, key: tuple, compute) -> CachedBody:
+        """
+            Cached body of `key`, recomputed with `await compute()` (returns bytes) once expired
+
+            Raises whatever `compute` raised, errors aren't cached
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires > time.monotonic():
+            self.hits += 1
+            return entry
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        self.misses += 1
+        future = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            with self.recompute.time():
+                body = await compute()
+            entry = CachedBody(body, f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"', time.monotonic() + self.ttl)
+            self._store(key, entry)
+            future.set_result(entry)
+            return entry
+
+        except BaseException as e:
+            self.errors += 1
+            future.set_exception(e)
+            # nobody else may be waiting, don't let asyncio warn about it
+            future.exception()
+            raise
+
+        finally:
+            del self._inflight[key]
+
+    def _store(self, key: tuple, entry: CachedBody) -> None:
+        self._entries.pop(key, None)
+        if len(self._entries) >= self.max_entries:
+            now = time.monotonic()
+            for stale in [k for k, v in self._entries.items() if v.expires <= now]:
+                del self._entries[stale]
+            while len(self._entries) >= self.max_entries:
+                del self._entries[next(iter(self._entries))]
+        self._entries[key] = entry
+
+    async def respond(self, request: Request, compute, key: tuple = None) -> Response:
+        """
+            The cached response of `request`, a 304 when its `If-None-Match` still matches
+
+            Args:
+                compute:    async callable returning the body (bytes)
+                key:        (optional) defaults to the path & query params
+        """
+        entry = await self.get(self.key_of(request) if key is None else key, compute)
+        headers = {"ETag": entry.etag, "Cache-Control": f"max-age={int(self.ttl)}, must-revalidate"}
+
+        if entry.etag in request.headers.get("if-none-match", ""):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+
+        return Response(entry.body, media_type=entry.media_type, headers=headers)
+
+    def invalidate(self, key: tuple = None) -> None:
+        "Drops `key`, or everything"
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "not_modified": self.not_modified,
+            "errors": self.errors,
+            "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            "recompute_ms": self.recompute.snapshot(reset=False)["total"],
+        }
@@ -1,8 +1,17 @@
-from fastapi import FastAPI
-import psycopg2
-from psycopg2 import pool
+from datetime import timedelta
+
+import asyncio
+
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+import orjson
 import pandas as pd
 
+from smartapi.async_db import AsyncDB
+from smartapi.movements import MovementsEngine, TickTail, symbol_index, movements_payload
+from smartapi.response_cache import ResponseCache
+from smartapi.movements_stream import MovementsStream
+
 app = FastAPI()
 
 # PostgreSQL connection parameters
@@ -12,62 +21,174 @@ db_params = {
     "password": "postgres",
     "host": "localhost",
     "port": "5432",
-    "minconn": 1,
-    "maxconn": 3,
 }
 
-
-CONN_POOL = psycopg2.pool.SimpleConnectionPool(**db_params)
+# asyncpg pool, queries don't block the event loop (refer `AsyncDB`)
+DB = AsyncDB(min_size=1, max_size=10, timeout=5.0, **db_params)
 
 lookup = pd.read_csv('/Users/you-know-who/Code/Project/stock_server/smartapi/.lookup/2023_week_32.csv')
 lookup.dropna(how='any', inplace=True)
 lookup.set_index('token', inplace=True)
+SYMBOLS = symbol_index(lookup)
+
+# 1 / 3 / 5 / 15 minute movements kept in memory, fed from tick_data
+MOVEMENTS = MovementsEngine()
+TICK_TAIL = TickTail(MOVEMENTS, **db_params)
+
+# every dashboard polls the same urls, one build per key per new batch of ticks
+RESPONSE_CACHE = ResponseCache(ttl=TICK_TAIL.poll_interval)
+
+# /movements/stream & /movements/events, deltas once per batch of ticks
+MOVEMENTS_STREAM = MovementsStream(MOVEMENTS, SYMBOLS, every=TICK_TAIL.poll_interval)
+
+@app.on_event("startup")
+async def startup():
+    await DB.start()
+    TICK_TAIL.start()
+    MOVEMENTS_STREAM.start()
 
 @app.on_event("shutdown")
-def shutdown():
-    CONN_POOL.closeall()
+async def shutdown():
+    await MOVEMENTS_STREAM.stop()
+    TICK_TAIL.stop()
+    await DB.close()
 
 
-@app.get("/movements")
-async def get_movements():
-    interval = 3
+async def read_movements(interval: int) -> pd.DataFrame:
+    """
+        token, change & ltp columns, from memory when the engine tracks `interval`,
+        both sources return `token_movements`' accel as change
+    """
+    if interval in MOVEMENTS.windows and TICK_TAIL.ready.is_set():
+        return MOVEMENTS.movements(interval)
+
+    rows = await DB.token_movements(timedelta(minutes=interval))
+    return pd.DataFrame([tuple(row) for row in rows], columns=['token', 'change', 'ltp'])
+
+
+@app.get("/movements/stats")
+async def get_movements_stats():
+    return {"engine": MOVEMENTS.stats(), "tail": TICK_TAIL.stats(), "db": DB.stats(), "cache": RESPONSE_CACHE.stats(), "stream": MOVEMENTS_STREAM.stats()}
+
+
+async def movements_body(interval: int) -> bytes:
     growth_threshold = .2
 
+    df = await read_movements(interval)
+    # straight to bytes, skips fastapi's per value `jsonable_encoder` walk
+    return orjson.dumps({"data": movements_payload(df, SYMBOLS, growth_threshold)})
+
+
+@app.get("/movements")
+async def get_movements(request: Request, interval: int = 3):
     try:
-        conn = CONN_POOL.getconn()
-        df = pd.read_sql(f"select * from token_movements(interval '{interval} minutes')", conn, columns=['token', 'accel', 'price'])
-        CONN_POOL.putconn(conn)
-
-        df['isUp'] = df['accel'].abs() >= growth_threshold
-
-        res = []
-        for id, row in df.iterrows():
-            token = row['token']
-            if token not in lookup.index: continue
-
-            symbol = lookup.loc[token]['symbol']
-            accel = row['accel']
-            price = row['price']
-            if isUp >= 0.2:
-                isUp = 1
-            elif isUp <= -0.2:
-                isUp = -1
-            else:
-                isUp = 0
-
-            res.append({
-                'token': token,
-                'symbol': symbol,
-                'change': accel,
-                'ltp': price,
-                'isUp': isUp
-            })
-
-        return { "data": res }
+        return await RESPONSE_CACHE.respond(request, lambda: movements_body(interval), key=('/movements', interval))
+
+    except TimeoutError:
+        return {"error": f"token_movements took longer than {DB.timeout}s"}
 
     except Exception as e:
         return {"error": str(e)}
 
+def parse_tokens(tokens: str | None) -> set | None:
+    "'48105,48326' -> {48105, 48326}, None for every token"
+    return None if not tokens else {int(token) for token in tokens.split(',') if token.strip()}
+
+
+def parse_selection(message) -> set | None:
+    "tokens of a stream client's `{\"tokens\": [...]}` message, raises `ValueError` on anything else"
+    if not isinstance(message, dict) or "tokens" not in message:
+        raise ValueError("expected {\"tokens\": [...] | null}")
+
+    selected = message["tokens"]
+    if selected is None:
+        return None
+    if not isinstance(selected, list):
+        raise ValueError("tokens should be a list")
+    try:
+        return {int(token) for token in selected}
+    except (TypeError, ValueError):
+        raise ValueError("tokens should be integers") from None
+
+
+@app.websocket("/movements/stream")
+async def stream_movements(websocket: WebSocket, interval: int = 3, tokens: str = None):
+    """
+        Sends {"type": "snapshot", "data": [...]} then {"type": "delta", "data": [...]}
+        with the rows that moved. Send {"tokens": [...]} (or null for all) to change
+        the tokens, a snapshot of the new ones follows. Any other message closes the
+        socket with 1003.
+    """
+    await websocket.accept()
+    try:
+        subscriber, snapshot = MOVEMENTS_STREAM.subscribe(interval, parse_tokens(tokens))
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+
+    async def send(kind: str, rows: list) -> None:
+        await websocket.send_text(orjson.dumps({"type": kind, "data": rows}).decode())
+
+    async def read_selection() -> None:
+        while True:
+            try:
+                message = await websocket.receive_json()
+            except KeyError:
+                # a binary frame, `receive_json` reads the text
+                raise ValueError("expected a json text message") from None
+            subscriber.tokens = parse_selection(message)
+            await send("snapshot", MOVEMENTS_STREAM.snapshot(subscriber))
+
+    reader = asyncio.create_task(read_selection())
+    try:
+        await send("snapshot", snapshot)
+        while True:
+            update = asyncio.create_task(subscriber.next())
+            # a closed socket ends the reader, don't wait for the next delta to notice
+            done, _ = await asyncio.wait({reader, update}, return_when=asyncio.FIRST_COMPLETED)
+            if reader in done:
+                update.cancel()
+                # raises why it ended, the client left or sent something else
+                reader.result()
+                break
+            await send("delta", update.result())
+
+    except WebSocketDisconnect:
+        pass
+
+    except ValueError as e:
+        await websocket.close(code=1003, reason=str(e))
+
+    finally:
+        reader.cancel()
+        if reader.done() and not reader.cancelled():
+            # retrieved, asyncio doesn't log it as never retrieved
+            reader.exception()
+        MOVEMENTS_STREAM.unsubscribe(subscriber)
+
+
+@app.get("/movements/events")
+async def movement_events(interval: int = 3, tokens: str = None):
+    "Server sent events, a `snapshot` event then `delta` events (refer `/movements/stream`)"
+    try:
+        MOVEMENTS_STREAM.validate(interval)
+        selected = parse_tokens(tokens)
+    except ValueError as e:
+        return {"error": str(e)}
+
+    async def events():
+        # subscribed once the response streams, one never started holds no subscriber
+        subscriber, snapshot = MOVEMENTS_STREAM.subscribe(interval, selected)
+        try:
+            yield b"event: snapshot\ndata: " + orjson.dumps(snapshot) + b"\n\n"
+            while True:
+                yield b"event: delta\ndata: " + orjson.dumps(await subscriber.next()) + b"\n\n"
+        finally:
+            MOVEMENTS_STREAM.unsubscribe(subscriber)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="127.0.0.1", port=8000)
@@ -0,0 +1,324 @@
+"""
+    Columnar daily archive of ticks
+
+    Layout (hive partitioned, each file sorted by token & time):
+        <directory>/date=2024-01-25/exchange=NSE_FO/part-<ns>.parquet   (or .arrow)
+
+    Usage:
+        python -m smartapi.tick_archive --date 2024-01-25 --out ./archive
+"""
+import time
+import argparse
+
+from pathlib import Path
+from datetime import date, datetime, timedelta
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+from smartapi.connections.api_types import ExchangeType
+
+# same columns as `tick_data`, times are local like `exchange_timestamp`
+TICK_SCHEMA = pa.schema([
+    ('token', pa.int32()),
+    ('time', pa.timestamp('ms')),
+    ('price', pa.float64()),
+    ('volume', pa.int64()),
+])
+
+PARTITIONING = ds.partitioning(pa.schema([('date', pa.string()), ('exchange', pa.string())]), flavor='hive')
+
+SORT_KEYS = [('token', 'ascending'), ('time', 'ascending')]
+
+FORMATS = {
+    'parquet': '.parquet',
+    'arrow': '.arrow',
+}
+
+_DAY_MS = 24 * 3600 * 1000
+
+
+def partition_dir(directory: Path, day: date, exchange_type: ExchangeType) -> Path:
+    return Path(directory) / f"date={day.isoformat()}" / f"exchange={ExchangeType(exchange_type).name}"
+
+
+def write_table(table: pa.Table, path: Path, file_format: str = 'parquet') -> None:
+    "Sorts by token & time and writes one file"
+    table = table.sort_by(SORT_KEYS)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    if file_format == 'parquet':
+        pq.write_table(
+            table, path, compression='zstd', row_group_size=256 * 1024,
+            # sorted row groups keep min / max stats tight for token & time pushdown
+            sorting_columns=[pq.SortingColumn(0), pq.SortingColumn(1)]
+        )
+    else:
+        feather.write_feather(table, path, compression='lz4')
+
+
+class TickArchiveWriter:
+    """
+        Buffers live ticks per (date, exchange) partition and writes sorted part files
+
+        Call `roll` once a trading day is over to compact the day's parts into a single
+        sorted file per exchange, `close` writes what is left. Usable as `on_data`.
+    """
+
+    def __init__(self, directory, file_format: str = 'parquet', max_rows: int = 500_000) -> None:
+        """
+            Args:
+                file_format:    parquet | arrow (IPC / feather v2)
+                max_rows:       a part file is written once a partition buffers this many rows
+        """
+        if file_format not in FORMATS:
+            raise ValueError(f"Unknown format {file_format}, use one of {list(FORMATS)}")
+
+        self.directory = Path(directory)
+        self.file_format = file_format
+        self.max_rows = max_rows
+
+        # (date, exchange) -> [tokens, local ms, prices, volumes]
+        self._buffers = {}
+        # epoch ms range of the current local day, its date & utc offset
+        self._day = (0, 0, None, 0)
+
+        self.rows = 0
+        self.files = 0
+
+    def _local_day(self, epoch_ms: int) -> tuple[date, int]:
+        start, end, day, offset = self._day
+        if not start <= epoch_ms < end:
+            local = datetime.fromtimestamp(epoch_ms / 1000)
+            midnight = local.replace(hour=0, minute=0, second=0, microsecond=0)
+            start = int(midnight.timestamp() * 1000)
+            day = midnight.date()
+            offset = int((midnight - datetime(1970, 1, 1)).total_seconds() * 1000) - start
+            self._day = start, start + _DAY_MS, day, offset
+        return day, offset
+
+    def write(self, tick) -> None:
+        epoch_ms = tick.exchange_epoch_ms
+        day, offset = self._local_day(epoch_ms)
+
+        key = (day, tick.exchange_type)
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = self._buffers[key] = [[], [], [], []]
+
+        buffer[0].append(int(tick.token))
+        buffer[1].append(epoch_ms + offset)
+        buffer[2].append(tick.last_traded_price)
+        buffer[3].append(getattr(tick, 'volume_trade_for_the_day', None))
+        self.rows += 1
+
+        if len(buffer[0]) >= self.max_rows:
+            self._write_part(key)
+
+    def on_data(self, ws_conn, tick) -> None:
+        self.write(tick)
+
+    def _write_part(self, key: tuple) -> None:
+        buffer = self._buffers.pop(key, None)
+        if not buffer or not buffer[0]:
+            return
+
+        table = pa.table(buffer, schema=TICK_SCHEMA)
+        path = partition_dir(self.directory, *key) / f"part-{time.time_ns()}{FORMATS[self.file_format]}"
+        write_table(table, path, self.file_format)
+        self.files += 1
+
+    def flush(self) -> None:
+        for key in list(self._buffers):
+            self._write_part(key)
+
+    def roll(self, day: date) -> int:
+        """
+            Writes the buffered ticks of `day` and compacts its parts into one sorted
+            file per exchange
+
+            returns:
+                rows in the compacted files
+        """
+        for key in [key for key in self._buffers if key[0] == day]:
+            self._write_part(key)
+
+        return compact(self.directory, day, self.file_format)
+
+    def close(self) -> None:
+        self.flush()
+
+
+def compact(directory, day: date, file_format: str = 'parquet') -> int:
+    "Merges the part files of every exchange partition of `day` into a single sorted file"
+    rows = 0
+    day_dir = Path(directory) / f"date={day.isoformat()}"
+    suffix = FORMATS[file_format]
+
+    for partition in sorted(day_dir.glob("exchange=*")):
+        parts = sorted(partition.glob(f"part-*{suffix}"))
+        if len(parts) <= 1:
+            rows += sum(_read_file(part, file_format).num_rows for part in parts)
+            continue
+
+        table = pa.concat_tables([_read_file(part, file_format) for part in parts])
+        write_table(table, partition / f"part-{time.time_ns()}{suffix}", file_format)
+        for part in parts:
+            part.unlink()
+        rows += table.num_rows
+
+    return rows
+
+
+def _read_file(path: Path, file_format: str) -> pa.Table:
+    if file_format == 'parquet':
+        return pq.read_table(path, schema=TICK_SCHEMA)
+    return feather.read_table(path)
+
+
+def archive_from_db(pool, day: date, directory, exchange_type: ExchangeType = ExchangeType.NSE_FO,
+                    file_format: str = 'parquet', chunk_rows: int = 200_000) -> int:
+    """
+        Archives a day of `tick_data` (which has no exchange column, all rows go to
+        `exchange_type`), streamed chunk by chunk from a server side cursor in token,
+        time order into one sorted file
+
+        The day / exchange partition is replaced (new file first, then the old parts
+        are deleted), running it again for a day doesn't duplicate rows. A day with no
+        rows in the db leaves the partition as it is.
+
+        returns:
+            rows archived
+    """
+    start = datetime.combine(day, datetime.min.time())
+    partition = partition_dir(directory, day, exchange_type)
+    partition.mkdir(parents=True, exist_ok=True)
+
+    suffix = FORMATS[file_format]
+    # not a `part-*` name, readers & `compact` skip it until it's swapped in
+    tmp_path = partition / f".archive-{time.time_ns()}{suffix}"
+
+    rows = 0
+    writer = None
+    conn = pool.getconn()
+    try:
+        with conn.cursor(name='tick_archive') as cur:
+            cur.itersize = chunk_rows
+            cur.execute(
+                "SELECT token, time, price::float8, volume FROM tick_data "
+                "WHERE time >= %s AND time < %s ORDER BY token, time",
+                (start, start + timedelta(days=1))
+            )
+            while True:
+                chunk = cur.fetchmany(chunk_rows)
+                if not chunk:
+                    break
+
+                if writer is None:
+                    writer = _stream_writer(tmp_path, file_format)
+                writer.write_table(pa.table(list(zip(*chunk)), schema=TICK_SCHEMA))
+                rows += len(chunk)
+        conn.commit()
+
+    except BaseException:
+        if writer is not None:
+            writer.close()
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    finally:
+        pool.putconn(conn)
+
+    if writer is None:
+        return 0
+    writer.close()
+
+    old_parts = list(partition.glob(f"part-*{suffix}"))
+    tmp_path.replace(partition / f"part-{time.time_ns()}{suffix}")
+    for part in old_parts:
+        part.unlink()
+
+    return rows
+
+
+def _stream_writer(path: Path, file_format: str):
+    "writer taking sorted chunks with `write_table`, same settings as `write_table`"
+    if file_format == 'parquet':
+        return pq.ParquetWriter(
+            path, TICK_SCHEMA, compression='zstd',
+            sorting_columns=[pq.SortingColumn(0), pq.SortingColumn(1)]
+        )
+    return pa.ipc.new_file(path, TICK_SCHEMA, options=pa.ipc.IpcWriteOptions(compression='lz4'))
+
+
+def open_archive(directory, file_format: str = 'parquet') -> ds.Dataset:
+    return ds.dataset(
+        Path(directory), format='parquet' if file_format == 'parquet' else 'ipc',
+        partitioning=PARTITIONING, schema=TICK_SCHEMA.append(pa.field('date', pa.string())).append(pa.field('exchange', pa.string()))
+    )
+
+
+def read_ticks(directory, tokens: list = None, start: datetime = None, end: datetime = None,
+               exchanges: list[ExchangeType] = None, columns: list[str] = None,
+               file_format: str = 'parquet') -> pa.Table:
+    """
+        Loads a token subset / time range, only the matching partitions, row groups
+        and columns are read
+
+        Args:
+            tokens:     (optional) tokens to keep
+            start:      (optional) first time, inclusive
+            end:        (optional) last time, exclusive
+            exchanges:  (optional) exchange partitions to read
+            columns:    (optional) e.g. ['token', 'time', 'price']
+
+        returns:
+            arrow table, `.to_pandas()` for a DataFrame
+    """
+    dataset = open_archive(directory, file_format)
+    conditions = []
+
+    if tokens is not None:
+        conditions.append(pc.field('token').isin([int(token) for token in tokens]))
+    if start is not None:
+        # partition pruning on the date folder, then the row group stats
+        conditions.append(pc.field('date') >= start.date().isoformat())
+        conditions.append(pc.field('time') >= pa.scalar(start, pa.timestamp('ms')))
+    if end is not None:
+        conditions.append(pc.field('date') <= end.date().isoformat())
+        conditions.append(pc.field('time') < pa.scalar(end, pa.timestamp('ms')))
+    if exchanges is not None:
+        conditions.append(pc.field('exchange').isin([ExchangeType(exchange).name for exchange in exchanges]))
+
+    condition = None
+    for expression in conditions:
+        condition = expression if condition is None else condition & expression
+
+    return dataset.to_table(columns=columns, filter=condition)
+
+
+def main():
+    from psycopg2 import pool as psql_pool
+    from smartapi.configs import app_config
+
+    parser = argparse.ArgumentParser(description="Archive a day of tick_data")
+    parser.add_argument('--date', required=True, type=date.fromisoformat)
+    parser.add_argument('--out', required=True)
+    parser.add_argument('--exchange', default=ExchangeType.NSE_FO.name, choices=[e.name for e in ExchangeType])
+    parser.add_argument('--format', default='parquet', choices=list(FORMATS))
+    args = parser.parse_args()
+
+    pool = psql_pool.SimpleConnectionPool(**app_config['server']['db'])
+    try:
+        rows = archive_from_db(pool, args.date, args.out, ExchangeType[args.exchange], args.format)
+    finally:
+        pool.closeall()
+
+    print(f"Archived {rows} ticks of {args.date} to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
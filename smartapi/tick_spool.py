@@ -0,0 +1,306 @@
+import os
+import mmap
+import time
+import zlib
+import struct
+import threading
+import traceback
+
+from pathlib import Path
+from datetime import timedelta
+
+from smartapi.tick_writer import TickWriter, tick_row, PG_EPOCH
+
+# crc32 | token int4 | time (us since 2000-01-01, like COPY) | price f8 | volume i8 (-1 = null)
+RECORD = struct.Struct('<Iiqdq')
+PAYLOAD = struct.Struct('<iqdq')
+CHECKPOINT = struct.Struct('<qq')
+
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def segment_name(segment: int) -> str:
+    return f"spool_{segment:08d}.bin"
+
+
+class TickSpool:
+    """
+        Append only, memory mapped spool of tick rows, written before anything else
+
+        Records go into fixed size segment files (zero filled, so the first record with
+        a bad crc is the end of a segment). `commit` stores the position up to which
+        the rows are in the db in a checkpoint file and deletes the segments before it.
+        A new process always starts a new segment, so everything after the checkpoint
+        is replayed by the drainer on restart.
+
+        A killed process loses nothing written (the pages are in the page cache),
+        `sync_interval` bounds the loss on a machine crash.
+    """
+
+    def __init__(self, directory, segment_size: int = 64 * 1024 * 1024, sync_interval: float = 1.0) -> None:
+        """
+            Args:
+                directory:      spool folder, created if missing
+                segment_size:   bytes per segment file
+                sync_interval:  msync the active segment at most this often (seconds)
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        self.segment_size = segment_size - segment_size % RECORD.size
+        self.sync_interval = sync_interval
+
+        self._lock = threading.Lock()
+        self._fp = None
+        self._mm = None
+        self._last_sync = time.monotonic()
+
+        segments = self.segments()
+        self.segment = (segments[-1] + 1) if segments else 0
+        self.offset = 0
+        self._open_segment()
+
+        self.appended = 0
+
+    def segments(self) -> list[int]:
+        return sorted(int(path.stem.split('_')[1]) for path in self.directory.glob("spool_*.bin"))
+
+    def _open_segment(self) -> None:
+        path = self.directory / segment_name(self.segment)
+        self._fp = open(path, 'w+b')
+        self._fp.truncate(self.segment_size)
+        self._mm = mmap.mmap(self._fp.fileno(), self.segment_size)
+
+    def _close_segment(self) -> None:
+        if self._mm is not None:
+            self._mm.flush()
+            self._mm.close()
+            self._fp.close()
+            self._mm = self._fp = None
+
+    @property
+    def position(self) -> tuple[int, int]:
+        "(segment, offset) right after the last appended record"
+        return self.segment, self.offset
+
+    def append(self, data) -> None:
+        "Spools a tick (or any mapping with the `on_data` keys)"
+        self.append_row(tick_row(data))
+
+    def append_row(self, row: tuple) -> None:
+        token, tick_time, price, volume = row
+        payload = PAYLOAD.pack(token, (tick_time - PG_EPOCH) // _MICROSECOND, price, -1 if volume is None else volume)
+        record = struct.pack('<I', zlib.crc32(payload)) + payload
+
+        with self._lock:
+            if self.offset + RECORD.size > self.segment_size:
+                self._close_segment()
+                self.segment += 1
+                self.offset = 0
+                self._open_segment()
+
+            self._mm[self.offset: self.offset + RECORD.size] = record
+            self.offset += RECORD.size
+            self.appended += 1
+
+            if self.sync_interval is not None and time.monotonic() - self._last_sync >= self.sync_interval:
+                self._mm.flush()
+                self._last_sync = time.monotonic()
+
+    def read(self, position: tuple[int, int], max_records: int = 50_000) -> tuple[list[tuple], tuple[int, int]]:
+        """
+            Rows after `position`, at most `max_records`
+
+            returns:
+                (rows, position after the last returned row)
+        """
+        segment, offset = position
+        rows = []
+
+        while len(rows) < max_records:
+            with self._lock:
+                active, active_offset = self.segment, self.offset
+
+            if segment > active:
+                break
+
+            path = self.directory / segment_name(segment)
+            if not path.exists():
+                # deleted / never written, e.g. a checkpoint at the end of a segment
+                segment, offset = segment + 1, 0
+                continue
+
+            end = active_offset if segment == active else self.segment_size
+            count = max(0, min(max_records - len(rows), (end - offset) // RECORD.size))
+
+            with open(path, 'rb') as fp:
+                fp.seek(offset)
+                chunk = fp.read(count * RECORD.size)
+            chunk = chunk[:len(chunk) - len(chunk) % RECORD.size]
+
+            valid = 0
+            for idx, (crc, token, micros, price, volume) in enumerate(RECORD.iter_unpack(chunk)):
+                if crc != zlib.crc32(chunk[idx * RECORD.size + 4: (idx + 1) * RECORD.size]):
+                    break
+                rows.append((token, PG_EPOCH + micros * _MICROSECOND, price, None if volume == -1 else volume))
+                valid += 1
+            offset += valid * RECORD.size
+
+            if segment == active:
+                # everything below the write offset is complete, so a bad record here is corruption
+                if valid < count:
+                    print(f"Corrupt spool record in {path} at {offset}")
+                break
+
+            # a bad crc / zero record ends a finished segment
+            if valid < count or offset >= end:
+                segment, offset = segment + 1, 0
+
+        return rows, (segment, offset)
+
+    def checkpoint(self) -> tuple[int, int]:
+        "Position up to which the rows are committed, start of the oldest segment without a checkpoint"
+        path = self.directory / 'checkpoint'
+        if not path.exists():
+            first = self.segments()
+            return (first[0] if first else 0), 0
+        return CHECKPOINT.unpack(path.read_bytes())
+
+    def commit(self, position: tuple[int, int]) -> None:
+        "Records `position` as committed & deletes the segments before it"
+        path = self.directory / 'checkpoint'
+        tmp = path.with_suffix('.tmp')
+        with open(tmp, 'wb') as fp:
+            fp.write(CHECKPOINT.pack(*position))
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp, path)
+
+        for segment in self.segments():
+            if segment < position[0]:
+                (self.directory / segment_name(segment)).unlink(missing_ok=True)
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_segment()
+
+
+class SpoolDrainer:
+    """
+        Ships spooled rows to `tick_data` in bulk (refer `TickWriter.copy_rows`) and
+        checkpoints after every committed batch, a failing db only grows the spool
+    """
+
+    def __init__(self, spool: TickSpool, writer: TickWriter, batch_size: int = 20_000,
+                 interval: float = 0.2, max_retry_delay: float = 30) -> None:
+        """
+            Args:
+                batch_size:         rows per COPY
+                interval:           wait between polls when the spool is drained
+                max_retry_delay:    cap of the backoff while the db is failing
+        """
+        self.spool = spool
+        self.writer = writer
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_retry_delay = max_retry_delay
+
+        self._position = spool.checkpoint()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.shipped = 0
+        self.batches = 0
+        self.errors = 0
+        self.last_error = None
+
+        # left uncommitted by a previous run, replayed first
+        self.replayed = self.backlog
+
+    def start(self) -> 'SpoolDrainer':
+        if self._thread is not None:
+            return self
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="spool-drainer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, drain: bool = True) -> None:
+        "Stops the drainer, by default after one last pass over the spool"
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        if drain:
+            try:
+                while self.drain_once():
+                    pass
+            except Exception:
+                # still in the spool, shipped by the next run
+                traceback.print_exc()
+
+    @property
+    def position(self) -> tuple[int, int]:
+        return self._position
+
+    def drain_once(self) -> int:
+        """
+            Ships one batch & checkpoints it
+
+            returns:
+                rows read from the spool (0 when it's drained), raises when the write fails
+        """
+        rows, position = self.spool.read(self._position, self.batch_size)
+        if not rows and position == self._position:
+            return 0
+
+        if rows:
+            # copy_rows needs unique (token, time), the later row wins like the upsert
+            unique = {(row[0], row[1]): row for row in rows}
+            self.writer.copy_rows(list(unique.values()))
+            self.batches += 1
+            self.shipped += len(rows)
+
+        self.spool.commit(position)
+        self._position = position
+        return len(rows)
+
+    def _run(self) -> None:
+        delay = self.interval
+
+        while not self._stop.is_set():
+            try:
+                count = self.drain_once()
+                delay = self.interval
+            except Exception as err:
+                self.errors += 1
+                self.last_error = str(err)
+                traceback.print_exc()
+                self._stop.wait(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+                continue
+
+            if count < self.batch_size:
+                self._stop.wait(self.interval)
+
+    @property
+    def backlog(self) -> int:
+        "Rows spooled but not committed (approximate across segments)"
+        segment, offset = self._position
+        active, active_offset = self.spool.position
+        if segment == active:
+            return (active_offset - offset) // RECORD.size
+        return ((active - segment) * self.spool.segment_size + active_offset - offset) // RECORD.size
+
+    def stats(self) -> dict:
+        return {
+            "position": self._position,
+            "spool_position": self.spool.position,
+            "backlog": self.backlog,
+            "shipped": self.shipped,
+            "batches": self.batches,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
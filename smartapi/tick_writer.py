@@ -0,0 +1,244 @@
+import time
+import struct
+import threading
+import traceback
+
+from io import BytesIO
+from datetime import datetime, timedelta
+
+from psycopg2 import pool as psql_pool
+
+from smartapi.utils.histogram import LatencyHistogram
+
+# binary COPY framing, refer https://www.postgresql.org/docs/current/sql-copy.html
+COPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+COPY_TRAILER = struct.pack('>h', -1)
+
+# (token int4, time timestamp, price float8, volume int8)
+COPY_ROW = struct.Struct('>hiiiqidiq')
+COPY_ROW_NO_VOLUME = struct.Struct('>hiiiqidi')
+
+PG_EPOCH = datetime(2000, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+# one per connection, emptied by every commit
+STAGE_DDL = """
+    CREATE TEMP TABLE IF NOT EXISTS tick_data_stage (
+        token INTEGER,
+        time TIMESTAMP,
+        price DOUBLE PRECISION,
+        volume BIGINT
+    ) ON COMMIT DELETE ROWS;
+"""
+
+COPY_SQL = "COPY tick_data_stage (token, time, price, volume) FROM STDIN WITH (FORMAT binary)"
+
+MERGE_SQL = """
+    INSERT INTO tick_data (token, time, price, volume)
+    SELECT token, time, price, volume FROM tick_data_stage
+    ON CONFLICT (token, time) DO UPDATE
+    SET price = EXCLUDED.price, volume = EXCLUDED.volume;
+"""
+
+
+def tick_row(data) -> tuple:
+    "(token, time, price, volume) of a tick / backfilled row, same columns as `log_data.on_data`"
+    # LTP ticks carry no volume
+    volume = data.get('volume_trade_for_the_day')
+    return (
+        int(data['token']),
+        data['exchange_timestamp'].replace(microsecond=0),
+        float(data['last_traded_price']),
+        None if volume is None else int(volume)
+    )
+
+
+def encode_copy(rows) -> bytes:
+    "rows of `tick_row` as a binary COPY payload"
+    buf = [COPY_HEADER]
+    for token, tick_time, price, volume in rows:
+        micros = (tick_time - PG_EPOCH) // _MICROSECOND
+        if volume is None:
+            buf.append(COPY_ROW_NO_VOLUME.pack(4, 4, token, 8, micros, 8, price, -1))
+        else:
+            buf.append(COPY_ROW.pack(4, 4, token, 8, micros, 8, price, 8, volume))
+    buf.append(COPY_TRAILER)
+    return b''.join(buf)
+
+
+class TickWriter:
+    """
+        Buffers ticks & writes them to `tick_data` in bulk from a background thread
+
+        Rows are de-duplicated on (token, time) in memory (the last tick of a second
+        wins, like the upsert did), a flush is a binary COPY into a temp staging table
+        and one `INSERT ... ON CONFLICT` into `tick_data`, in a single transaction.
+        A failed flush keeps its rows for the next attempt.
+    """
+
+    def __init__(self, pool: psql_pool.AbstractConnectionPool, batch_size: int = 5_000,
+                 flush_interval: float = 0.5, max_backlog: int = 1_000_000) -> None:
+        """
+            Args:
+                pool:           psycopg2 pool, a connection is checked out per flush
+                batch_size:     flush as soon as this many rows are buffered
+                flush_interval: flush at least this often (seconds) when there are rows
+                max_backlog:    oldest rows are dropped beyond this (db down for long)
+        """
+        self.pool = pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backlog = max_backlog
+
+        # (token, time) -> row
+        self._buffer: dict[tuple, tuple] = {}
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+        self.received = 0
+        self.deduplicated = 0
+        self.dropped = 0
+        self.written = 0
+        self.flushes = 0
+        self.errors = 0
+        self.last_error = None
+
+        self.flush_ns = LatencyHistogram()
+        self.batch_rows = LatencyHistogram(max_value=10 ** 8)
+
+    def start(self) -> 'TickWriter':
+        if self._running:
+            return self
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="tick-writer", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self, drain: bool = True) -> int:
+        """
+            Stops the flush thread, by default after writing everything buffered
+
+            returns:
+                rows left unwritten
+        """
+        with self._cond:
+            self._running = False
+            if not drain:
+                self._buffer = {}
+            self._cond.notify()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        return len(self._buffer)
+
+    def write(self, data) -> None:
+        "Queues a tick (or any mapping with the `on_data` keys), never blocks on the db"
+        self.write_row(tick_row(data))
+
+    def write_row(self, row: tuple) -> None:
+        key = (row[0], row[1])
+        with self._cond:
+            buffer = self._buffer
+            self.received += 1
+
+            if key in buffer:
+                self.deduplicated += 1
+            elif self.max_backlog is not None and len(buffer) >= self.max_backlog:
+                del buffer[next(iter(buffer))]
+                self.dropped += 1
+
+            buffer[key] = row
+            if len(buffer) >= self.batch_size:
+                self._cond.notify()
+
+    @property
+    def backlog(self) -> int:
+        return len(self._buffer) + self._in_flight
+
+    def copy_rows(self, rows) -> int:
+        """
+            Writes `rows` (unique on (token, time)) right away on the calling thread,
+            raises when the transaction fails
+
+            returns:
+                number of rows written
+        """
+        payload = encode_copy(rows)
+
+        conn = self.pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(STAGE_DDL)
+                cur.copy_expert(COPY_SQL, BytesIO(payload))
+                cur.execute(MERGE_SQL)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.pool.putconn(conn)
+
+        return len(rows)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if self._running and len(self._buffer) < self.batch_size:
+                    self._cond.wait(timeout=self.flush_interval)
+
+                batch = self._buffer
+                if not batch:
+                    if not self._running:
+                        return
+                    continue
+
+                self._buffer = {}
+                self._in_flight = len(batch)
+
+            ok = self._flush(batch)
+
+            with self._cond:
+                self._in_flight = 0
+                if not ok:
+                    # newer rows of the same second win
+                    for key, row in batch.items():
+                        self._buffer.setdefault(key, row)
+
+                    if not self._running:
+                        return
+                    self._cond.wait(timeout=self.flush_interval)
+
+    def _flush(self, batch: dict) -> bool:
+        start = time.perf_counter_ns()
+        try:
+            written = self.copy_rows(list(batch.values()))
+        except Exception as err:
+            self.errors += 1
+            self.last_error = str(err)
+            traceback.print_exc()
+            return False
+
+        self.flush_ns.record(time.perf_counter_ns() - start)
+        self.batch_rows.record(written)
+        self.written += written
+        self.flushes += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "received": self.received,
+            "written": self.written,
+            "deduplicated": self.deduplicated,
+            "dropped": self.dropped,
+            "backlog": self.backlog,
+            "flushes": self.flushes,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "flush_ms": self.flush_ns.summary(scale=1e6),
+            "batch_rows": self.batch_rows.summary(),
+        }
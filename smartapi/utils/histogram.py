@@ -0,0 +1,144 @@
+from array import array
+
+
+class LatencyHistogram:
+    """
+        Fixed memory log-linear histogram of non negative integers (e.g. nanoseconds)
+
+        Values below 2 ** (sub_bits + 1) get a bucket each, above that every power of
+        two is split into 2 ** sub_bits buckets, so a recorded value is off by at most
+        1 / 2 ** sub_bits (~3% with the default 5). Values above `max_value` land in
+        the last bucket and are counted in `overflow`.
+    """
+
+    __slots__ = ('sub_bits', 'max_value', '_sub_count', '_counts', 'count', 'total', 'min', 'max', 'overflow')
+
+    def __init__(self, max_value: int = 3_600 * 10 ** 9, sub_bits: int = 5) -> None:
+        """
+            Args:
+                max_value:  largest value tracked exactly, default is an hour in ns
+                sub_bits:   buckets per power of two = 2 ** sub_bits
+        """
+        self.sub_bits = sub_bits
+        self.max_value = max_value
+        self._sub_count = 1 << sub_bits
+        self._counts = array('q', bytes(8 * (self._index(max_value) + 1)))
+        self.reset()
+
+    def _index(self, value: int) -> int:
+        shift = value.bit_length() - self.sub_bits - 1
+        if shift < 0:
+            return value
+        return self._sub_count * (shift + 1) + (value >> shift) - self._sub_count
+
+    def _lower_bound(self, index: int) -> int:
+        shift = index // self._sub_count - 1
+        if shift < 0:
+            return index
+        return (index % self._sub_count + self._sub_count) << shift
+
+    def _upper_bound(self, index: int) -> int:
+        "highest value that lands in `index`"
+        return self._lower_bound(index + 1) - 1
+
+    def reset(self) -> None:
+        for idx in range(len(self._counts)):
+            self._counts[idx] = 0
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.overflow = 0
+
+    def record(self, value: int) -> None:
+        value = int(value)
+        if value < 0:
+            value = 0
+
+        if value > self.max_value:
+            self.overflow += 1
+            self._counts[-1] += 1
+        else:
+            self._counts[self._index(value)] += 1
+
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, pct: float) -> int:
+        "Upper bound of the bucket holding the `pct`th percentile (capped at `max`)"
+        if not self.count:
+            return 0
+
+        rank = max(1, round(self.count * pct / 100))
+        seen = 0
+        for idx, count in enumerate(self._counts):
+            seen += count
+            if seen >= rank:
+                return min(self._upper_bound(idx), self.max)
+        return self.max
+
+    def percentiles(self, pcts=(50, 90, 99, 99.9)) -> dict[float, int]:
+        "Several percentiles in one pass over the buckets"
+        result = {}
+        if not self.count:
+            return {pct: 0 for pct in pcts}
+
+        ranks = sorted((max(1, round(self.count * pct / 100)), pct) for pct in pcts)
+        seen = 0
+        pos = 0
+        for idx, count in enumerate(self._counts):
+            if not count:
+                continue
+            seen += count
+            while pos < len(ranks) and seen >= ranks[pos][0]:
+                result[ranks[pos][1]] = min(self._upper_bound(idx), self.max)
+                pos += 1
+            if pos == len(ranks):
+                break
+
+        return {pct: result.get(pct, self.max) for pct in pcts}
+
+    def merge(self, other: 'LatencyHistogram') -> None:
+        "Adds `other`'s counts, both need the same `max_value` & `sub_bits`"
+        if len(other._counts) != len(self._counts) or other.sub_bits != self.sub_bits:
+            raise ValueError("Histograms have different bucket layouts")
+
+        for idx, count in enumerate(other._counts):
+            if count:
+                self._counts[idx] += count
+
+        self.count += other.count
+        self.total += other.total
+        self.overflow += other.overflow
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def copy(self) -> 'LatencyHistogram':
+        hist = LatencyHistogram(self.max_value, self.sub_bits)
+        hist.merge(self)
+        return hist
+
+    def summary(self, scale: float = 1.0, pcts=(50, 90, 99, 99.9)) -> dict:
+        """
+            count, mean, min, max & percentiles, divided by `scale`
+            (e.g. `scale=1e6` for ns -> ms)
+        """
+        summary = {
+            "count": self.count,
+            "mean": self.mean / scale,
+            "min": (self.min or 0) / scale,
+            "max": (self.max or 0) / scale,
+        }
+        for pct, value in self.percentiles(pcts).items():
+            summary[f"p{pct:g}"] = value / scale
+        return summary
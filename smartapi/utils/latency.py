@@ -0,0 +1,133 @@
+import time
+import threading
+import functools
+import traceback
+
+from contextlib import contextmanager
+
+from smartapi.utils.histogram import LatencyHistogram
+
+
+class LatencyRecorder:
+    """
+        Constant memory latency stats of one code path (on_data, db flush, rest call ...)
+
+        Keeps a histogram for the whole session & one for the current interval,
+        `snapshot` returns both and starts a new interval. `start_logging` prints a
+        snapshot every few seconds and hands it to `hook`.
+
+            recorder = LatencyRecorder('db_flush')
+            with recorder.time():
+                ...
+            fetch = recorder.timed(api.get_candle_data)
+    """
+
+    def __init__(self, name: str, max_value: int = 3_600 * 10 ** 9, sub_bits: int = 5) -> None:
+        """
+            Args:
+                name:       shown in the logs & snapshots
+                max_value:  largest latency tracked (ns), refer `LatencyHistogram`
+        """
+        self.name = name
+        self.total = LatencyHistogram(max_value, sub_bits)
+        self.interval = LatencyHistogram(max_value, sub_bits)
+
+        self._lock = threading.Lock()
+        self._interval_start = time.monotonic()
+
+        self._thread = None
+        self._stop = threading.Event()
+
+    def record(self, elapsed_ns: int) -> None:
+        with self._lock:
+            self.total.record(elapsed_ns)
+            self.interval.record(elapsed_ns)
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record(time.perf_counter_ns() - start)
+
+    def timed(self, fn):
+        "Wraps `fn` so every call is recorded"
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(time.perf_counter_ns() - start)
+        return wrapper
+
+    def percentile(self, pct: float) -> float:
+        "session percentile in ms"
+        return self.total.percentile(pct) / 1e6
+
+    def snapshot(self, reset: bool = True) -> dict:
+        """
+            Summaries (ms) of the current interval & the whole session
+
+            Args:
+                reset:  start a new interval
+        """
+        now = time.monotonic()
+        with self._lock:
+            interval = self.interval.summary(scale=1e6)
+            total = self.total.summary(scale=1e6)
+            elapsed = now - self._interval_start
+            if reset:
+                self.interval.reset()
+                self._interval_start = now
+
+        interval["per_sec"] = interval["count"] / elapsed if elapsed > 0 else 0.0
+        return {
+            "name": self.name,
+            "interval_s": elapsed,
+            "interval": interval,
+            "total": total,
+        }
+
+    def start_logging(self, every: float = 60, hook=None, log: bool = True) -> 'LatencyRecorder':
+        """
+            Takes a snapshot every `every` seconds on a background thread
+
+            Args:
+                hook:   (optional) called as `hook(snapshot)`, e.g. to push metrics
+                log:    print a one line summary
+        """
+        if self._thread is not None:
+            return self
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(every, hook, log), name=f"latency-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop_logging(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, every: float, hook, log: bool) -> None:
+        while not self._stop.wait(every):
+            snapshot = self.snapshot()
+            if log:
+                print(self.format(snapshot))
+            if hook is not None:
+                try:
+                    hook(snapshot)
+                except Exception:
+                    traceback.print_exc()
+
+    @staticmethod
+    def format(snapshot: dict) -> str:
+        interval = snapshot["interval"]
+        return (
+            f"[{snapshot['name']}] {interval['count']} in {snapshot['interval_s']:.0f}s "
+            f"({interval['per_sec']:.1f}/s), ms p50 {interval['p50']:.3f} p99 {interval['p99']:.3f} "
+            f"p99.9 {interval['p99.9']:.3f} max {interval['max']:.3f}"
+        )
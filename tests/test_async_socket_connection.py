@@ -0,0 +1,110 @@
+"""
+    `AsyncSocketConnection` against the local stand-in feed server
+
+        python -m pytest tests
+"""
+import asyncio
+
+from benchmarks.feed_server import StandInFeedServer
+from smartapi.connections.async_socket_connection import AsyncSocketConnection
+from smartapi.connections.api_types import SubscriptionMode, ExchangeType
+
+TOKENS = {ExchangeType.NSE_FO: ['48080', '48081', '48082']}
+
+
+def feed(server: StandInFeedServer, **kwargs) -> AsyncSocketConnection:
+    return AsyncSocketConnection('client', 'jwt', 'feed', 'key', url=server.url, **kwargs)
+
+
+async def take(connection: AsyncSocketConnection, count: int) -> list:
+    ticks = []
+    async for tick in connection:
+        ticks.append(tick)
+        if len(ticks) >= count:
+            break
+    return ticks
+
+
+def test_ticks_and_close():
+    async def run():
+        async with StandInFeedServer(port=0, rate=2000) as server:
+            async with feed(server) as connection:
+                await connection.subscribe('test', SubscriptionMode.QUOTE, TOKENS)
+                ticks = await asyncio.wait_for(take(connection, 50), 10)
+
+            assert len(ticks) == 50
+            assert {tick.token for tick in ticks} <= set(TOKENS[ExchangeType.NSE_FO])
+
+            # the iterator ends once closed, after what was still buffered
+            rest = await asyncio.wait_for(take(connection, 10_000), 5)
+            assert len(rest) < connection._queue.maxsize
+
+    asyncio.run(run())
+
+
+def test_close_with_full_queue():
+    async def run():
+        async with StandInFeedServer(port=0, rate=5000) as server:
+            connection = feed(server, queue_size=20)
+            await connection.connect()
+            await connection.subscribe('test', SubscriptionMode.LTP_MODE, TOKENS)
+
+            # nobody consumes, the reader fills the queue & waits
+            while not connection._queue.full():
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.1)
+            assert connection._queue.qsize() == 20
+
+            await asyncio.wait_for(connection.close(), 5)
+
+            # buffered ticks, then the end of the iterator
+            ticks = await asyncio.wait_for(take(connection, 10_000), 5)
+            assert len(ticks) == 19
+
+    asyncio.run(run())
+
+
+def test_break_out_then_exit():
+    async def run():
+        async with StandInFeedServer(port=0, rate=5000) as server:
+            async def consume():
+                async with feed(server, queue_size=20) as connection:
+                    await connection.subscribe('test', SubscriptionMode.QUOTE, TOKENS)
+                    async for _ in connection:
+                        # let the reader fill the queue before leaving
+                        await asyncio.sleep(0.2)
+                        break
+
+            await asyncio.wait_for(consume(), 10)
+
+    asyncio.run(run())
+
+
+def test_reconnect_resubscribes():
+    async def run():
+        async with StandInFeedServer(port=0, rate=2000, disconnect_after=30) as server:
+            async with feed(server, reconnect_delay=0.05, max_reconnect_delay=0.1) as connection:
+                await connection.subscribe('test', SubscriptionMode.QUOTE, TOKENS)
+                # more ticks than one connection sends
+                ticks = await asyncio.wait_for(take(connection, 100), 20)
+
+            assert len(ticks) == 100
+            assert connection.reconnects >= 3
+            assert server.connections >= 4
+
+    asyncio.run(run())
+
+
+def test_bad_frames_are_skipped():
+    async def run():
+        async with StandInFeedServer(port=0, rate=2000, bad_frame_every=10) as server:
+            async with feed(server) as connection:
+                await connection.subscribe('test', SubscriptionMode.QUOTE, TOKENS)
+                ticks = await asyncio.wait_for(take(connection, 90), 10)
+
+            assert len(ticks) == 90
+            assert connection.bad_frames >= 9
+            assert connection.reconnects == 0
+            assert server.connections == 1
+
+    asyncio.run(run())
@@ -0,0 +1,71 @@
+"""
+    `SocketShardPool` subscriptions with shards that don't touch the network
+
+        python -m pytest tests
+"""
+from smartapi.connections.shard_pool import SocketShardPool
+from smartapi.connections.socket_connection import SocketConnection
+from smartapi.connections.api_types import SubscriptionMode, ExchangeType
+
+
+class RecordingShard(SocketConnection):
+    "keeps the requests instead of sending them, `broken` ones raise like a dropped socket"
+
+    def __init__(self, *args) -> None:
+        super().__init__(*args)
+        self.sent = []
+        self.broken = False
+
+    def send(self, data: dict) -> None:
+        if self.broken:
+            raise ConnectionError("socket is already closed")
+        self.sent.append(data)
+
+
+def sent_tokens(shard: RecordingShard) -> set:
+    return {token for request in shard.sent for entry in request['params']['tokenList'] for token in entry['tokens']}
+
+
+def connected_pool(shards: int = 4) -> SocketShardPool:
+    pool = SocketShardPool('client', 'jwt', 'feed', 'key', shards=shards, socket_factory=RecordingShard)
+    for stats in pool._shard_stats:
+        stats["connected"] = True
+    return pool
+
+
+def test_failed_send_keeps_the_other_shards():
+    pool = connected_pool()
+    broken = pool._shards[0]
+    broken.broken = True
+
+    tokens = [str(48_000 + idx) for idx in range(100)]
+    pool.subscribe('test', SubscriptionMode.QUOTE, {ExchangeType.NSE_FO: tokens})
+
+    for idx, shard in enumerate(pool._shards):
+        assigned = {token for token in tokens if pool.shard_of(SubscriptionMode.QUOTE, ExchangeType.NSE_FO, token) == idx}
+        assert assigned
+        assert shard.subscriptions.exchange_tokens_map(SubscriptionMode.QUOTE)[ExchangeType.NSE_FO] == assigned
+        if shard is not broken:
+            assert sent_tokens(shard) == assigned
+
+    assert not broken.sent
+    assert pool.stats()["shards"][0]["errors"] == 1
+
+    # the shard comes back, `on_open` sends what it missed
+    broken.broken = False
+    pool._handle_open(0, None)
+    assert sent_tokens(broken) == set(broken.subscriptions.exchange_tokens_map(SubscriptionMode.QUOTE)[ExchangeType.NSE_FO])
+
+
+def test_disconnected_shard_subscribes_on_open():
+    pool = connected_pool(shards=2)
+    pool._shard_stats[1]["connected"] = False
+
+    pool.subscribe('test', SubscriptionMode.LTP_MODE, {ExchangeType.NSE_CM: [str(idx) for idx in range(1, 21)]})
+    assert not pool._shards[1].sent
+
+    pool._handle_open(1, None)
+    assert sent_tokens(pool._shards[1]) == {
+        token for token in map(str, range(1, 21))
+        if pool.shard_of(SubscriptionMode.LTP_MODE, ExchangeType.NSE_CM, token) == 1
+    }
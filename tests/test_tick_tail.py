@@ -0,0 +1,67 @@
+"""
+    `TickTail.poll` against an in memory `tick_data`
+
+        python -m pytest tests
+"""
+from datetime import datetime, timedelta
+
+from smartapi.movements import MovementsEngine, TickTail
+
+
+class TickData:
+    "connection stand-in answering the tail's `WHERE time >= %s ORDER BY time` query"
+
+    def __init__(self) -> None:
+        self.rows = []
+        self._result = []
+
+    def insert(self, token: int, time: datetime, price: float) -> None:
+        self.rows.append((token, time, price))
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+    def execute(self, sql: str, params: tuple) -> None:
+        since, = params
+        self._result = sorted((row for row in self.rows if row[1] >= since), key=lambda row: row[1])
+
+    def fetchall(self) -> list:
+        return self._result
+
+
+def test_reads_rows_committed_behind_the_last_poll():
+    now = datetime.now().replace(microsecond=0)
+    db = TickData()
+    engine = MovementsEngine()
+    tail = TickTail(engine, lookback=5)
+
+    db.insert(7, now - timedelta(seconds=60), 100.0)
+    db.insert(8, now - timedelta(seconds=60), 50.0)
+    db.insert(7, now, 101.0)
+    tail.poll(db)
+
+    # token 8's tick committed after the poll, older than where the tail got to
+    db.insert(8, now - timedelta(seconds=2), 55.0)
+    tail.poll(db)
+
+    ltp = engine.movements(1).set_index('token')['ltp']
+    assert ltp[8] == 55.0
+    assert ltp[7] == 101.0
+    assert engine.late == 0
+
+
+def test_rereads_dont_move_since_back():
+    now = datetime.now().replace(microsecond=0)
+    db = TickData()
+    tail = TickTail(MovementsEngine(), lookback=5)
+
+    db.insert(7, now, 100.0)
+    tail.poll(db)
+    assert tail.poll(db) == 1
+    assert tail.stats()["since"] == now